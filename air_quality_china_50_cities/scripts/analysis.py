@@ -8,26 +8,91 @@ analysis.py
 1. 读取 processed/air_quality_clean.csv
 2. 描述性统计 → 输出 reports/descriptive_stats.csv
 3. 相关性分析 → 输出 reports/correlation.csv
-4. 聚类分析 (KMeans, n=3) → 输出 reports/clusters.csv & reports/cluster_centers.csv
+4. 聚类分析 (KMeans, n=3) → 输出 reports/clusters.csv（Station, Datetime, Cluster）
+   & reports/cluster_centers.csv & reports/cluster_scaler.csv（标准化参数）
+5. 综合 AQI 等级分布 → 输出 reports/aqi_levels.csv
+
+聚类方式（--cluster-mode）：
+- kmeans：整表 KMeans（默认）
+- minibatch：分块读取，MiniBatchKMeans 流式拟合，内存占用只与 --chunk-rows 有关
+- assign：用保存的中心和标准化参数给 --input 的每行分配聚类，不重新拟合，也不输出其他报告
+--warm-start 以保存的 cluster_centers.csv 作为初始中心继续训练
+
+用法：
+    python analysis.py [--input CSV] [--cluster-mode kmeans|minibatch|assign] [--clusters 3]
+                       [--chunk-rows 100000] [--epochs 3] [--warm-start] [--labels 输出CSV]
 """
 
+import argparse
 import os
+import sys
 import pandas as pd
-from sklearn.cluster import KMeans
-from sklearn.preprocessing import StandardScaler
+
+from clustering import (
+    CHUNK_ROWS, EPOCHS, N_CLUSTERS, fit_kmeans, fit_minibatch, fit_scaler, load_centers, load_scaler,
+    save_model, write_labels,
+)
 
 INPUT_PATH      = os.path.join("../data", "processed", "china_50_cities.csv")
 OUT_STATS       = os.path.join("reports", "descriptive_stats.csv")
 OUT_CORR        = os.path.join("reports", "correlation.csv")
 OUT_CLUSTERS    = os.path.join("reports", "clusters.csv")
 OUT_CENTERS     = os.path.join("reports", "cluster_centers.csv")
+OUT_SCALER      = os.path.join("reports", "cluster_scaler.csv")
+OUT_AQI_LEVELS  = os.path.join("reports", "aqi_levels.csv")
+
+# AQI 计算与可视化共用 streamlit_app/aqi.py
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'streamlit_app'))
+from aqi import BREAKPOINTS_1H, aqi_levels
+
+CLUSTER_MODES = ('kmeans', 'minibatch', 'assign')
+POLLUTANTS = ['CO(GT)','NMHC(GT)','C6H6(GT)','NOx(GT)','NO2(GT)']
+
+def cluster(args):
+    """拟合（或读取）聚类中心，逐块写出每行的聚类标签"""
+    pollutants = POLLUTANTS
+    if args.cluster_mode != 'assign':
+        scaler = fit_scaler(args.input, pollutants, args.chunk_rows)
+        init = None
+        if args.warm_start and os.path.exists(OUT_CENTERS):
+            init = scaler.transform(load_centers(OUT_CENTERS, pollutants))
+            print(f"[analysis] 以 {OUT_CENTERS} 的 {len(init)} 个中心热启动")
+        if args.cluster_mode == 'kmeans':
+            centers = fit_kmeans(args.input, scaler, args.clusters, pollutants, init)
+        else:
+            centers = fit_minibatch(args.input, scaler, args.clusters, pollutants, args.chunk_rows,
+                                    init, args.epochs)
+        save_model(scaler, centers, OUT_CENTERS, OUT_SCALER, pollutants)
+        print(f"[analysis] 已输出聚类中心：{OUT_CENTERS}")
+
+    mean, scale = load_scaler(OUT_SCALER, pollutants)
+    counts = write_labels(args.input, args.labels, mean, scale, load_centers(OUT_CENTERS, pollutants),
+                          pollutants, args.chunk_rows)
+    print(f"[analysis] 已输出聚类结果：{args.labels}（各聚类行数 {counts.tolist()}）")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='描述性统计、相关性、聚类和 AQI 等级分析')
+    parser.add_argument('--input', default=INPUT_PATH, help='预处理后的 CSV')
+    parser.add_argument('--cluster-mode', choices=CLUSTER_MODES, default='kmeans', help='聚类方式')
+    parser.add_argument('--clusters', type=int, default=N_CLUSTERS, help='聚类个数（热启动时取保存的中心个数）')
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS, help='分块读取的行数')
+    parser.add_argument('--epochs', type=int, default=EPOCHS, help='minibatch 模式遍历数据的轮数')
+    parser.add_argument('--warm-start', action='store_true', help='以保存的聚类中心作为初始中心')
+    parser.add_argument('--labels', default=OUT_CLUSTERS, help='聚类标签输出路径')
+    args = parser.parse_args(argv)
 
-def main():
     os.makedirs("reports", exist_ok=True)
 
-    df = pd.read_csv(INPUT_PATH, parse_dates=['Datetime'])
+    if args.cluster_mode == 'assign':
+        if not (os.path.exists(OUT_CENTERS) and os.path.exists(OUT_SCALER)):
+            print(f"[analysis] 缺少 {OUT_CENTERS} 或 {OUT_SCALER}，请先拟合聚类")
+            return 1
+        cluster(args)
+        return 0
 
-    pollutants = ['CO(GT)','NMHC(GT)','C6H6(GT)','NOx(GT)','NO2(GT)']
+    df = pd.read_csv(args.input, parse_dates=['Datetime'])
+
+    pollutants = POLLUTANTS
 
     # 1. 描述性统计
     desc = df.groupby('Station')[pollutants].agg(['mean','median','std']).round(2)
@@ -39,21 +104,14 @@ def main():
     corr.to_csv(OUT_CORR)
     print(f"[analysis] 已输出相关性矩阵：{OUT_CORR}")
 
-    # 3. 聚类分析
-    scaler = StandardScaler()
-    X_scaled = scaler.fit_transform(df[pollutants].fillna(0))
-    kmeans = KMeans(n_clusters=3, random_state=42)
-    df['Cluster'] = kmeans.fit_predict(X_scaled)
-
-    df.to_csv(OUT_CLUSTERS, index=False)
-    centers = pd.DataFrame(
-        scaler.inverse_transform(kmeans.cluster_centers_),
-        columns=pollutants
-    ).round(2)
-    centers['Cluster'] = centers.index
-    centers.to_csv(OUT_CENTERS, index=False)
-    print(f"[analysis] 已输出聚类结果：{OUT_CLUSTERS}")
-    print(f"[analysis] 已输出聚类中心：{OUT_CENTERS}")
+    # 3. 聚类分析（按块读取输入，标签只输出 Station, Datetime, Cluster）
+    cluster(args)
+
+    # 5. 综合 AQI 等级分布（逐小时，按 1 小时浓度限值；只有 CO、NO2 有限值）
+    levels = aqi_levels(df, [p for p in pollutants if p in BREAKPOINTS_1H], by='Station')
+    levels.to_csv(OUT_AQI_LEVELS)
+    print(f"[analysis] 已输出 AQI 等级分布：{OUT_AQI_LEVELS}")
+    return 0
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
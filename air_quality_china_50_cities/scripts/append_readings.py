@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+append_readings.py
+
+增量追加新的逐小时读数，只处理新数据，不重跑整个预处理：
+1. 读取新的原始读数（格式与 AirQualityUCI.csv 相同），只保留晚于该站点高水位（已读入的最新时间）的行
+2. 接着上次保存的插值状态（锚点和待定行）做时间插值；
+   第一次追加时没有状态，以输出 CSV 中该站点的最后一行作为锚点（只在这时读取一次整个 CSV）
+3. 时间特征、站点和噪声：新读数都归入 --station 指定的站点（默认为数据最新的站点）
+4. 追加到输出 CSV，可选追加 parquet 分区；类型化缓存和汇总立方体只并入新行，不整表重建
+5. 保存每个站点的高水位和插值状态（<输出CSV>.append/ 目录），下次追加时使用
+
+插值需要下一个有效值：末尾缺失的行暂不输出，等下次追加时一起插值；
+某列连续缺失超过 --max-hold 行（默认一天）时不再等待，按最后一个有效值填充输出，
+避免长期缺失的指标（例如 NMHC）让新读数一直无法输出。
+数据不会再更新时用 --flush 把剩余的行都按最后一个有效值填充输出（与整表预处理的末尾处理相同）
+
+用法：
+    python append_readings.py --input 新读数CSV [--output 输出CSV] [--station 城市] [--seed 0]
+                              [--partitions 分区目录] [--max-hold 24] [--flush] [--no-rollup]
+"""
+
+import argparse
+import json
+import os
+import sys
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from data_preprocess import DEFAULT_OUTPUT, PreprocessError, index_by_datetime, numeric_columns, read_raw
+from stages import CHINA_CITIES, ChunkInterpolator, add_time_features, assign_stations, write_partitions
+
+STATE_FILE = 'state.json'
+# 等待下一个有效值的最多行数（逐小时数据即一天）
+MAX_HOLD = 24
+
+
+def state_dir(output_path: str) -> str:
+    """输出 CSV 对应的增量状态目录"""
+    return os.path.splitext(output_path)[0] + '.append'
+
+
+def _station_file(folder: str, code: int, kind: str) -> str:
+    # 文件名用城市编号，不用中文城市名
+    return os.path.join(folder, f'{code:02d}.{kind}.parquet')
+
+
+def load_state(output_path: str, cities: dict = CHINA_CITIES) -> Dict[str, pd.Timestamp]:
+    """
+    每个站点的高水位。没有保存的状态时从输出 CSV 统计（只读 Datetime/Station 两列）
+    """
+    path = os.path.join(state_dir(output_path), STATE_FILE)
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            return {k: pd.Timestamp(v) for k, v in json.load(f)['high_water'].items()}
+    if not os.path.exists(output_path):
+        raise PreprocessError(f"输出文件不存在，请先运行 data_preprocess.py：{output_path}")
+    existing = pd.read_csv(output_path, usecols=['Datetime', 'Station'], parse_dates=['Datetime'])
+    high = existing.groupby('Station')['Datetime'].max()
+    return {s: high[s] for s in cities if s in high.index}
+
+
+def save_state(output_path: str, high_water: Dict[str, pd.Timestamp]):
+    folder = state_dir(output_path)
+    os.makedirs(folder, exist_ok=True)
+    tmp = os.path.join(folder, STATE_FILE + '.tmp')
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump({'high_water': {k: v.isoformat() for k, v in high_water.items()}}, f, ensure_ascii=False)
+    os.replace(tmp, os.path.join(folder, STATE_FILE))
+
+
+def load_interpolator(output_path: str, station: str, code: int, columns,
+                      max_hold: int = MAX_HOLD) -> ChunkInterpolator:
+    """恢复站点的插值状态；第一次追加时以输出 CSV 中该站点的最后一行作为锚点"""
+    folder = state_dir(output_path)
+    anchor_path = _station_file(folder, code, 'anchor')
+    held_path = _station_file(folder, code, 'held')
+    if os.path.exists(anchor_path) or os.path.exists(held_path):
+        anchor = pd.read_parquet(anchor_path) if os.path.exists(anchor_path) else None
+        held = pd.read_parquet(held_path) if os.path.exists(held_path) else None
+        return ChunkInterpolator.resume(columns, anchor, held, max_hold)
+    existing = pd.read_csv(output_path, index_col='Datetime', parse_dates=['Datetime'])
+    rows = existing[existing['Station'] == station]
+    return ChunkInterpolator.resume(columns, rows[columns].iloc[-1:], None, max_hold)
+
+
+def save_interpolator(output_path: str, code: int, interpolator: ChunkInterpolator):
+    folder = state_dir(output_path)
+    os.makedirs(folder, exist_ok=True)
+    for kind, frame in zip(('anchor', 'held'), interpolator.state()):
+        path = _station_file(folder, code, kind)
+        if frame is not None and len(frame):
+            frame.to_parquet(path)
+        elif os.path.exists(path):
+            os.remove(path)
+
+
+def update_rollup(output_path: str, appended: bytes):
+    """只并入追加的行：更新类型化缓存和汇总立方体，再删除旧版本"""
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'streamlit_app'))
+    from dataset import append_cache, remove_stale
+    from rollup import append_rollup
+    old, cache, rows = append_cache(output_path, appended)
+    append_rollup(old, cache, rows)
+    remove_stale(output_path, cache)
+
+
+def append_readings(input_path: str, output_path: str, station: Optional[str] = None,
+                    seed: Optional[int] = None, partitions_dir: Optional[str] = None,
+                    max_hold: int = MAX_HOLD, flush: bool = False, rollup: bool = True,
+                    cities: dict = CHINA_CITIES) -> int:
+    """增量追加，返回追加到输出的行数；失败时抛出 PreprocessError"""
+    high_water = load_state(output_path, cities)
+    if station is None:
+        if not high_water:
+            raise PreprocessError("输出中没有任何站点的数据，请用 --station 指定站点")
+        station = max(high_water, key=high_water.get)
+    if station not in cities:
+        raise PreprocessError(f"未知的站点：{station}")
+    code = list(cities).index(station)
+
+    data = index_by_datetime(read_raw(input_path))
+    last = high_water.get(station)
+    if last is not None:
+        data = data[data.index > last]
+    print(f"✅ {station}：新读数 {len(data)} 行（高水位 {last}）")
+
+    columns = numeric_columns(data)
+    interpolator = load_interpolator(output_path, station, code, columns, max_hold)
+    ready = [interpolator.push(data)] if len(data) else []
+    if flush:
+        ready.append(interpolator.flush())
+    ready = [p for p in ready if len(p)]
+    if flush and ready:
+        # 填充输出后没有待定行，最后输出的一行作为下次追加的锚点
+        interpolator = ChunkInterpolator.resume(columns, ready[-1][columns].iloc[-1:], None, max_hold)
+    ready = pd.concat(ready) if ready else pd.DataFrame()
+
+    appended = b''
+    if len(ready):
+        ready = add_time_features(ready)
+        stamp = ready.index[0]
+        rng = np.random.default_rng(None if seed is None else [seed, code, int(stamp.timestamp())])
+        ready = assign_stations(ready, np.full(len(ready), code), rng, cities)
+        header = pd.read_csv(output_path, nrows=0, index_col=0).columns
+        appended = ready.reindex(columns=header).to_csv(header=False).encode('utf-8')
+        with open(output_path, 'ab') as f:
+            f.write(appended)
+        if partitions_dir:
+            write_partitions(ready, partitions_dir, f"append-{code:02d}-{stamp:%Y%m%d%H%M}")
+
+    # 先写输出再保存状态：中途失败时重新运行，不会漏掉已读入的行
+    if len(data):
+        high_water[station] = data.index.max()
+    save_interpolator(output_path, code, interpolator)
+    save_state(output_path, high_water)
+    if appended and rollup:
+        try:
+            update_rollup(output_path, appended)
+        except Exception as e:
+            raise PreprocessError(f"更新汇总数据时出错: {e}") from e
+    return len(ready)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='增量追加新的逐小时读数到中国 50 城市数据集')
+    parser.add_argument('--input', required=True, help='新读数的原始 CSV（分号分隔，格式与 AirQualityUCI.csv 相同）')
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help='要追加的输出 CSV')
+    parser.add_argument('--station', default=None, help='新读数所属的站点，默认为数据最新的站点')
+    parser.add_argument('--seed', type=int, default=None, help='噪声的随机种子')
+    parser.add_argument('--partitions', default=None, help='同时追加的 parquet 分区目录')
+    parser.add_argument('--max-hold', type=int, default=MAX_HOLD, help='等待下一个有效值的最多行数')
+    parser.add_argument('--flush', action='store_true', help='末尾还不能插值的行按最后一个有效值填充输出')
+    parser.add_argument('--no-rollup', action='store_true', help='不更新缓存和汇总立方体')
+    args = parser.parse_args(argv)
+
+    try:
+        rows = append_readings(args.input, args.output, args.station, args.seed, args.partitions,
+                               max(args.max_hold, 1), args.flush, not args.no_rollup)
+    except PreprocessError as e:
+        print(f"❌ {e}")
+        return 1
+    print(f"✅ 已追加 {rows} 行到 {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+chunked_preprocess.py
+
+分块（out-of-core）预处理，处理步骤与 data_preprocess.py 相同，内存占用只与块大小有关：
+1. 第一遍只读 Date/Time 两列，统计有效行数（城市按行号平均划分，需要先知道总行数）
+2. 第二遍按时间顺序逐块：解析日期时间 → 去重 → 跨块时间插值 → 时间特征 → 城市划分和噪声
+3. 每块按 年/月 写出 data/processed/partitions/year=YYYY/month=MM/part-NNNNN.parquet
+4. 可选：同时逐块追加写出 CSV，供可视化应用使用
+
+原始文件需要按时间排序；时间早于已处理数据的行会被丢弃（与整表处理的“保留第一次出现”一致）
+
+用法：
+    python chunked_preprocess.py [--input 原始CSV] [--out 分区目录] [--chunk-rows 200000] [--seed 0] [--csv 输出CSV]
+"""
+
+import argparse
+import os
+import sys
+from typing import Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from stages import (
+    CHINA_CITIES, ChunkInterpolator, add_time_features, assign_stations, clear_partitions, iter_raw_chunks,
+    parse_datetime, partition_files, station_codes, write_partitions,
+)
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_INPUT = os.path.join(PROJECT_ROOT, 'data', 'raw', 'AirQualityUCI.csv')
+DEFAULT_OUT = os.path.join(PROJECT_ROOT, 'data', 'processed', 'partitions')
+CHUNK_ROWS = 200000
+_EARLIEST = np.datetime64(np.iinfo(np.int64).min + 1, 's')
+
+
+def _new_rows(times: pd.DatetimeIndex, last) -> Tuple[np.ndarray, object]:
+    """
+    保留时间有效、且晚于之前所有行的行（删除 NaT 和重复时间，保留第一次出现）
+    last 为之前各块的最大时间；返回 (保留的布尔数组, 新的最大时间)
+    """
+    t = times.to_numpy().astype('datetime64[s]')
+    ok = ~np.isnat(t)
+    start = _EARLIEST if last is None else last
+    # 每行之前（不含本行）出现过的最大时间，NaT 不参与
+    prefix = np.maximum.accumulate(np.where(ok, t, _EARLIEST)) if len(t) else t
+    before = np.maximum(np.concatenate([[start], prefix[:-1]]), start)
+    keep = ok & (t > before)
+    new_last = max(start, prefix[-1]) if len(t) else start
+    return keep, (None if new_last == _EARLIEST else new_last)
+
+
+def count_rows(path: str, chunk_rows: int = CHUNK_ROWS) -> int:
+    """第一遍：只读 Date/Time，统计去重后的有效行数"""
+    total, last = 0, None
+    for chunk in pd.read_csv(path, sep=';', usecols=['Date', 'Time'], chunksize=chunk_rows):
+        keep, last = _new_rows(parse_datetime(chunk['Date'], chunk['Time']), last)
+        total += int(keep.sum())
+    return total
+
+
+def preprocess_chunked(input_path: str, out_dir: str, chunk_rows: int = CHUNK_ROWS,
+                       seed: Optional[int] = None, csv_path: Optional[str] = None,
+                       cities: dict = CHINA_CITIES) -> int:
+    """
+    分块预处理，返回输出的行数
+    每个输出块使用独立的随机数生成器（seed 给定时由 (seed, 块号) 决定），结果可复现
+    """
+    total = count_rows(input_path, chunk_rows)
+    print(f"✅ 有效行数统计完成：{total}")
+    os.makedirs(out_dir, exist_ok=True)
+    clear_partitions(out_dir)
+    if csv_path and os.path.exists(csv_path):
+        os.remove(csv_path)
+
+    interpolator = None
+    last = None
+    position = part = 0
+
+    def emit(ready: pd.DataFrame):
+        nonlocal position, part
+        if ready.empty:
+            return
+        ready = add_time_features(ready)
+        codes = station_codes(np.arange(position, position + len(ready)), total, len(cities))
+        rng = np.random.default_rng(None if seed is None else [seed, part])
+        ready = assign_stations(ready, codes, rng, cities)
+        write_partitions(ready, out_dir, f'part-{part:05d}')
+        if csv_path:
+            ready.to_csv(csv_path, mode='a', header=(position == 0))
+        position += len(ready)
+        part += 1
+
+    for raw in iter_raw_chunks(input_path, chunk_rows):
+        times = parse_datetime(raw['Date'], raw['Time'])
+        keep, last = _new_rows(times, last)
+        if not keep.any():
+            continue
+        chunk = raw[keep].copy()
+        chunk.index = times[keep]
+        chunk['Time'] = chunk['Time'].str.replace('.', ':', regex=False)
+        if interpolator is None:
+            numeric = [c for c in chunk.columns if c not in ('Date', 'Time')]
+            interpolator = ChunkInterpolator(numeric)
+        emit(interpolator.push(chunk))
+    if interpolator is not None:
+        emit(interpolator.flush())
+    return position
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='分块预处理 AirQualityUCI 原始数据，按年/月分区输出')
+    parser.add_argument('--input', default=DEFAULT_INPUT, help='原始 CSV（分号分隔）')
+    parser.add_argument('--out', default=DEFAULT_OUT, help='分区输出目录')
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS, help='每块读取的行数')
+    parser.add_argument('--seed', type=int, default=None, help='噪声的随机种子')
+    parser.add_argument('--csv', default=None, help='同时输出的 CSV 路径（可视化应用读取）')
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.input):
+        print(f"❌ 文件未找到：{args.input}")
+        return 1
+    try:
+        rows = preprocess_chunked(args.input, args.out, args.chunk_rows, args.seed, args.csv)
+    except Exception as e:
+        print(f"❌ 分块预处理出错: {e}")
+        return 1
+    print(f"✅ 已输出 {rows} 行，{len(partition_files(args.out))} 个分区文件：{args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+clustering.py
+
+污染物聚类，供 analysis.py 使用：
+1. 分块读取输入，只读 Station、Datetime 和污染物列，内存占用只与块大小有关
+2. StandardScaler.partial_fit 逐块统计标准化参数，MiniBatchKMeans.partial_fit 逐批流式拟合
+3. 可以用之前保存的 cluster_centers.csv 作为初始中心继续训练（热启动）
+4. 保存的聚类中心和标准化参数可以直接给新数据分配聚类，不重新拟合
+5. 聚类结果只输出 Station, Datetime, Cluster 三列，不复制整张表
+
+聚类中心按原始单位保存（保留两位小数），标准化参数另存一个文件；
+写出的标签都按保存后的中心分配，之后单独分配新数据的结果与此一致
+"""
+
+import os
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from sklearn.preprocessing import StandardScaler
+
+from stages import POLLUTANTS
+
+KEY_COLUMNS = ['Station', 'Datetime']
+LABEL_COLUMNS = KEY_COLUMNS + ['Cluster']
+CHUNK_ROWS = 100000
+# 每次 partial_fit 的行数（与 MiniBatchKMeans 的默认值相同）
+BATCH_SIZE = 1024
+EPOCHS = 3
+N_CLUSTERS = 3
+RANDOM_STATE = 42
+
+
+def iter_chunks(path: str, columns: List[str] = POLLUTANTS, chunk_rows: int = CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+    """分块读取；Datetime 保持原来的字符串，写出标签时不重新格式化"""
+    yield from pd.read_csv(path, usecols=KEY_COLUMNS + list(columns), chunksize=chunk_rows)
+
+
+def features(chunk: pd.DataFrame, columns: List[str] = POLLUTANTS) -> np.ndarray:
+    """聚类特征：缺失值按 0 处理（与原来整表 KMeans 的处理相同）"""
+    return chunk[list(columns)].fillna(0).to_numpy(dtype=np.float64)
+
+
+def fit_scaler(path: str, columns: List[str] = POLLUTANTS, chunk_rows: int = CHUNK_ROWS) -> StandardScaler:
+    """逐块统计均值和方差，结果与整表 fit 相同"""
+    scaler = StandardScaler()
+    for chunk in iter_chunks(path, columns, chunk_rows):
+        if len(chunk):
+            scaler.partial_fit(features(chunk, columns))
+    return scaler
+
+
+def fit_kmeans(path: str, scaler: StandardScaler, n_clusters: int = N_CLUSTERS,
+               columns: List[str] = POLLUTANTS, init: Optional[np.ndarray] = None) -> np.ndarray:
+    """整表 KMeans（原来的做法，需要把特征全部读入内存），返回标准化后的中心"""
+    X = scaler.transform(features(pd.read_csv(path, usecols=list(columns)), columns))
+    if init is None:
+        model = KMeans(n_clusters=n_clusters, random_state=RANDOM_STATE)
+    else:
+        model = KMeans(n_clusters=len(init), init=init, n_init=1, random_state=RANDOM_STATE)
+    return model.fit(X).cluster_centers_
+
+
+def fit_minibatch(path: str, scaler: StandardScaler, n_clusters: int = N_CLUSTERS,
+                  columns: List[str] = POLLUTANTS, chunk_rows: int = CHUNK_ROWS,
+                  init: Optional[np.ndarray] = None, epochs: int = EPOCHS,
+                  batch_size: int = BATCH_SIZE) -> np.ndarray:
+    """
+    流式 MiniBatchKMeans：每轮按块读取，块内打乱后按 batch_size 逐批 partial_fit
+    init 为标准化后的初始中心，给定时从这些中心继续训练；返回标准化后的中心
+    """
+    model = MiniBatchKMeans(n_clusters=n_clusters if init is None else len(init),
+                            init='k-means++' if init is None else init, n_init=1,
+                            batch_size=batch_size, random_state=RANDOM_STATE)
+    rng = np.random.default_rng(RANDOM_STATE)
+    for _ in range(max(epochs, 1)):
+        for chunk in iter_chunks(path, columns, chunk_rows):
+            X = scaler.transform(features(chunk, columns))
+            order = rng.permutation(len(X))
+            for start in range(0, len(X), batch_size):
+                model.partial_fit(X[order[start:start + batch_size]])
+    if not hasattr(model, 'cluster_centers_'):
+        raise ValueError(f"输入没有数据：{path}")
+    return model.cluster_centers_
+
+
+def save_model(scaler: StandardScaler, centers_scaled: np.ndarray, centers_path: str, scaler_path: str,
+               columns: List[str] = POLLUTANTS) -> pd.DataFrame:
+    """保存聚类中心（原始单位）和标准化参数，返回保存的中心表"""
+    centers = pd.DataFrame(scaler.inverse_transform(centers_scaled), columns=columns).round(2)
+    centers['Cluster'] = centers.index
+    centers.to_csv(centers_path, index=False)
+    params = pd.DataFrame({'mean': scaler.mean_, 'scale': scaler.scale_},
+                          index=pd.Index(columns, name='Pollutant'))
+    params.to_csv(scaler_path)
+    return centers
+
+
+def load_centers(centers_path: str, columns: List[str] = POLLUTANTS) -> np.ndarray:
+    """读取保存的聚类中心（原始单位），按 Cluster 排序"""
+    centers = pd.read_csv(centers_path).sort_values('Cluster')
+    return centers[list(columns)].to_numpy(dtype=np.float64)
+
+
+def load_scaler(scaler_path: str, columns: List[str] = POLLUTANTS) -> Tuple[np.ndarray, np.ndarray]:
+    """读取保存的标准化参数 (mean, scale)"""
+    params = pd.read_csv(scaler_path, index_col='Pollutant').reindex(list(columns))
+    if params.isna().any().any():
+        raise ValueError(f"标准化参数缺少污染物：{scaler_path}")
+    return params['mean'].to_numpy(dtype=np.float64), params['scale'].to_numpy(dtype=np.float64)
+
+
+def assign(X: np.ndarray, mean: np.ndarray, scale: np.ndarray, centers: np.ndarray) -> np.ndarray:
+    """在标准化空间中把每行分配给最近的中心（centers 为原始单位），不做任何拟合"""
+    Z = (X - mean) / scale
+    C = (centers - mean) / scale
+    # |z - c|^2 = |z|^2 - 2 z·c + |c|^2，|z|^2 对所有中心相同，不影响 argmin
+    dist = (C ** 2).sum(axis=1) - 2 * Z @ C.T
+    return dist.argmin(axis=1)
+
+
+def write_labels(path: str, out_path: str, mean: np.ndarray, scale: np.ndarray, centers: np.ndarray,
+                 columns: List[str] = POLLUTANTS, chunk_rows: int = CHUNK_ROWS) -> pd.Series:
+    """
+    逐块分配聚类并写出 Station, Datetime, Cluster，返回每个聚类的行数
+    先写临时文件再替换，中途失败不会留下半个结果
+    """
+    counts = np.zeros(len(centers), dtype=np.int64)
+    tmp = out_path + '.tmp'
+    pd.DataFrame(columns=LABEL_COLUMNS).to_csv(tmp, index=False)
+    for chunk in iter_chunks(path, columns, chunk_rows):
+        labels = assign(features(chunk, columns), mean, scale, centers)
+        counts += np.bincount(labels, minlength=len(centers))
+        chunk[KEY_COLUMNS].assign(Cluster=labels).to_csv(tmp, mode='a', header=False, index=False)
+    os.replace(tmp, out_path)
+    return pd.Series(counts, index=pd.RangeIndex(len(centers), name='Cluster'), name='Rows')
@@ -1,168 +1,282 @@
-# 导入需要的库
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+data_preprocess.py
+
+功能：
+1. 读取原始 AirQualityUCI.csv（分号分隔、逗号小数点、-200 视为缺失），删除无效列
+2. 解析日期时间作为索引，处理缺失和重复的时间
+3. 按 月 或 站点 划分为连续的分区，用进程池并行处理每个分区：
+   时间插值 → 时间特征 → 城市划分和噪声（每个分区的随机数由 (seed, 分区号) 决定）
+4. 按分区顺序合并，保存 CSV（可选同时按 年/月 写出 parquet 分区）
+5. 生成可视化应用使用的汇总立方体
+每个阶段的耗时在结束时输出
+
+用法：
+    python data_preprocess.py [--input 原始CSV] [--output 输出CSV] [--workers N]
+                              [--partition-by month|station] [--seed 0] [--partitions 分区目录] [--no-rollup]
+超出内存的原始文件使用 chunked_preprocess.py 分块处理
+之后新到的逐小时读数使用 append_readings.py 增量追加，不必重跑整个预处理
+"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
 import pandas as pd
 import numpy as np
 
-# 1. 读取数据(注意分隔符和小数点格式)
-file_path = r'D:\worklocation\PycharmProjects\可视化\air_quality_viz\data\raw\AirQualityUCI.csv'
-try:
-    # 先不解析日期，只读取数据
-    data = pd.read_csv(
-        file_path,
-        sep=';',  # 指定分隔符为分号
-        decimal=',',  # 指定小数点格式为逗号
-        na_values=[-200]  # 将-200视为缺失值
-    )
-    print("✅ 文件读取成功")
-except FileNotFoundError:
-    print("❌ 文件未找到，请检查路径是否正确")
-    exit()
-except Exception as e:
-    print(f"❌ 读取文件时出错: {e}")
-    exit()
-
-# 2. 合并日期和时间列为一个日期时间列
-try:
+from stages import (
+    CHINA_CITIES, RAW_READ_OPTIONS, add_time_features, assign_stations, clear_partitions, parse_datetime,
+    station_codes, write_partitions,
+)
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_INPUT = os.path.join(PROJECT_ROOT, 'data', 'raw', 'AirQualityUCI.csv')
+DEFAULT_OUTPUT = os.path.join(PROJECT_ROOT, 'data', 'processed', 'china_50_cities.csv')
+PARTITION_KEYS = ('month', 'station')
+
+
+class PreprocessError(Exception):
+    """预处理某个阶段失败，消息为给用户看的说明"""
+
+
+class StageTimer:
+    """记录每个阶段的耗时（秒），并行阶段中各分区的耗时累加"""
+
+    def __init__(self):
+        self.seconds: Dict[str, float] = {}
+
+    def add(self, stage: str, seconds: float):
+        self.seconds[stage] = self.seconds.get(stage, 0.0) + seconds
+
+    def run(self, stage: str, func, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.add(stage, time.perf_counter() - start)
+
+    def report(self):
+        for stage, seconds in self.seconds.items():
+            print(f"⏱️ {stage}: {seconds:.2f}s")
+
+
+# 1. 读取数据
+def read_raw(path: str) -> pd.DataFrame:
+    if not os.path.exists(path):
+        raise PreprocessError(f"文件未找到，请检查路径是否正确：{path}")
+    try:
+        # 先不解析日期，只读取数据
+        data = pd.read_csv(path, **RAW_READ_OPTIONS)
+    except Exception as e:
+        raise PreprocessError(f"读取文件时出错: {e}") from e
+    # 删除所有名称包含 'Unnamed' 的列
+    return data.loc[:, ~data.columns.str.contains('^Unnamed')]
+
+
+# 2. 日期时间索引、缺失和重复的时间
+def index_by_datetime(data: pd.DataFrame) -> pd.DataFrame:
+    if 'Date' not in data.columns or 'Time' not in data.columns:
+        raise PreprocessError("未找到 'Date' 或 'Time' 列，请检查文件列名")
     # 如果时间部分使用的是点号作为分隔符，先替换为冒号
     data['Time'] = data['Time'].str.replace('.', ':', regex=False)
-    # 将 'Date' 和 'Time' 列合并为一个日期时间列
-    # 格式说明: %d/%m/%Y %H:%M:%S 表示日/月/年 时:分:秒
-    data['Datetime'] = pd.to_datetime(data['Date'] + ' ' + data['Time'], format='%d/%m/%Y %H:%M:%S')
-    print("✅ 日期时间列合并成功")
-except KeyError:
-    print("❌ 未找到 'Date' 或 'Time' 列，请检查文件列名")
-    exit()
-except Exception as e:
-    print(f"❌ 合并日期时间列时出错: {e}")
-    exit()
-
-# 3. 将合并后的日期时间列设置为索引
-try:
-    data.set_index('Datetime', inplace=True)
-    print("✅ 索引设置成功")
-except KeyError:
-    print("❌ 未找到 'Datetime' 列，请检查列名")
-    exit()
-except Exception as e:
-    print(f"❌ 设置索引时出错: {e}")
-    exit()
-
-# 4. 删除无效列
-try:
-    # 删除所有名称包含 'Unnamed' 的列
-    data = data.loc[:, ~data.columns.str.contains('^Unnamed')]
-    print("✅ 无效列已删除")
-except Exception as e:
-    print(f"❌ 删除无效列时出错: {e}")
-    exit()
-
-# 5. 处理缺失和重复值
-try:
-    # 检查索引中是否有NaN值
+    # 按 日/月/年 时:分:秒 的固定位置直接解析，不拼接字符串
+    data.index = parse_datetime(data['Date'], data['Time'])
     if data.index.hasnans:
-        print("⚠️ 索引中存在NaN值，正在进行处理...")
-        # 重置索引，将日期时间列转换为普通列
-        data = data.reset_index()
-        # 填充索引中的NaN值，使用前向填充
-        data['Datetime'] = data['Datetime'].ffill()
-        # 将Datetime列重新设置为索引
-        data = data.set_index('Datetime')
-
+        print("⚠️ 索引中存在NaN值，使用前一行的时间填充")
+        data.index = pd.DatetimeIndex(data.index.to_series().ffill(), name='Datetime')
     # 删除重复索引，保留第一个出现的
     data = data[~data.index.duplicated(keep='first')]
-
     # 推断数据类型（避免FutureWarning）
-    data = data.infer_objects(copy=False)
-
-    # 进行时间加权插值填充缺失值
-    data = data.interpolate(method='time', limit_direction='forward')
-    print("✅ 缺失值处理完成")
-except Exception as e:
-    print(f"❌ 处理缺失值时出错: {e}")
-    exit()
-
-# 6. 提取时间特征
-try:
-    # 从索引中提取年份、月份、日期、小时和星期几
-    data['Year'] = data.index.year
-    data['Month'] = data.index.month
-    data['Day'] = data.index.day
-    data['Hour'] = data.index.hour
-    data['Weekday'] = data.index.weekday  # 0 = 周一, 6 = 周日
-    print("✅ 时间特征提取成功")
-except Exception as e:
-    print(f"❌ 提取时间特征时出错: {e}")
-    exit()
-
-# 7. 定义中国50个主要城市及其经纬度
-china_cities = {
-    '北京': (39.9042, 116.4074), '上海': (31.2304, 121.4737), '广州': (23.1291, 113.2644),
-    '深圳': (22.5431, 114.0579), '杭州': (30.2741, 120.1551), '南京': (32.0603, 118.7969),
-    '天津': (39.3434, 117.3616), '重庆': (29.5630, 106.5516), '成都': (30.5728, 104.0668),
-    '武汉': (30.5928, 114.3055), '西安': (34.3416, 108.9398), '长沙': (28.2282, 112.9388),
-    '郑州': (34.7466, 113.6254), '青岛': (36.0671, 120.3826), '大连': (38.9140, 121.6147),
-    '厦门': (24.4798, 118.0894), '合肥': (31.8206, 117.2272), '济南': (36.6512, 117.1201),
-    '宁波': (29.8683, 121.5440), '佛山': (23.0215, 113.1214), '苏州': (31.2989, 120.5853),
-    '无锡': (31.4912, 120.3119), '昆明': (25.0389, 102.7189), '南昌': (28.6829, 115.8582),
-    '南宁': (22.8170, 108.3669), '太原': (37.8706, 112.5489), '贵阳': (26.6477, 106.6302),
-    '呼和浩特': (40.8426, 111.7492), '兰州': (36.0611, 103.8343), '哈尔滨': (45.8038, 126.5349),
-    '长春': (43.8171, 125.3235), '沈阳': (41.8057, 123.4315), '石家庄': (38.0428, 114.5149),
-    '唐山': (39.6305, 118.1809), '包头': (40.6574, 109.8403), '西宁': (36.6171, 101.7782),
-    '银川': (38.4872, 106.2309), '海口': (20.0440, 110.1983), '乌鲁木齐': (43.8256, 87.6168),
-    '拉萨': (29.6520, 91.1721), '珠海': (22.2707, 113.5767), '中山': (22.5159, 113.3926),
-    '惠州': (23.1115, 114.4158), '东莞': (23.0207, 113.7518), '江门': (22.5751, 113.0815),
-    '扬州': (32.3932, 119.4127), '镇江': (32.1896, 119.4250), '洛阳': (34.6186, 112.4536),
-    '宜昌': (30.6919, 111.2865), '芜湖': (31.3525, 118.4335)
-}
-
-# 8. 平均划分数据到不同城市
-try:
-    df_list = []
-    num_cities = len(china_cities)
-    data_length = len(data)
-    n = data_length // num_cities
-
-    if data_length % num_cities != 0:
-        print(f"⚠️ 数据行数({data_length})不能整除城市数({num_cities})，最后城市将多一点数据")
-
-    for i, (city, (lat, lon)) in enumerate(china_cities.items()):
-        # 计算当前城市的数据起始和结束索引
-        start_idx = i * n
-        # 如果是最后一个城市，确保包含所有剩余数据
-        end_idx = data_length if i == (num_cities - 1) else start_idx + n
-
-        chunk = data.iloc[start_idx:end_idx].copy()
-
-        # 对污染物数据添加 ±5% 的随机噪声，模拟城市差异
-        pollutants = ['CO(GT)', 'NMHC(GT)', 'C6H6(GT)', 'NOx(GT)', 'NO2(GT)']
-        for p in pollutants:
-            if p in chunk.columns:
-                chunk[p] = chunk[p] * (1 + np.random.uniform(-0.05, 0.05, size=len(chunk)))
-
-        # 添加城市信息
-        chunk['Station'] = city
-        chunk['Latitude'] = lat
-        chunk['Longitude'] = lon
-
-        df_list.append(chunk)
-
-    print("✅ 城市数据分配完成")
-except Exception as e:
-    print(f"❌ 分配数据到城市时出错: {e}")
-    exit()
-
-# 9. 合并所有城市数据
-try:
-    multi_city_df = pd.concat(df_list).sort_index()
-    print("✅ 数据合并成功")
-except Exception as e:
-    print(f"❌ 合并数据时出错: {e}")
-    exit()
-
-# 10. 保存处理后的数据
-output_path = r'D:\worklocation\PycharmProjects\可视化\air_quality_viz\data\processed\china_50_cities.csv'
-try:
-    multi_city_df.to_csv(output_path)
+    data = data.infer_objects()
+    # 分区要求按时间排列
+    return data if data.index.is_monotonic_increasing else data.sort_index(kind='stable')
+
+
+def numeric_columns(data: pd.DataFrame) -> List[str]:
+    """参与插值的列（Date/Time 为字符串列）"""
+    return [c for c in data.columns if c not in ('Date', 'Time')]
+
+
+# 3. 分区
+def partition_bounds(data: pd.DataFrame, by: str, num_cities: int) -> List[Tuple[int, int]]:
+    """按月或按站点划分的连续行区间 [start, end)；数据按时间排列，两种划分都是连续的"""
+    if by == 'month':
+        key = data.index.year.to_numpy() * 100 + data.index.month.to_numpy()
+    elif by == 'station':
+        key = station_codes(np.arange(len(data)), len(data), num_cities)
+    else:
+        raise PreprocessError(f"未知的分区方式：{by}（可选 {', '.join(PARTITION_KEYS)}）")
+    if len(key) == 0:
+        return []
+    starts = np.concatenate([[0], np.flatnonzero(key[1:] != key[:-1]) + 1])
+    ends = np.append(starts[1:], len(key))
+    return list(zip(starts.tolist(), ends.tolist()))
+
+
+def context_bounds(data: pd.DataFrame, columns: List[str], bounds: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """
+    每个分区插值需要的行范围：向前扩展到每列在分区之前的最后一个有效值，
+    向后扩展到每列在分区之后的第一个有效值。在这个范围内插值，与整表插值的结果相同
+    """
+    starts = np.array([b[0] for b in bounds], dtype=np.int64)
+    ends = np.array([b[1] for b in bounds], dtype=np.int64)
+    lo, hi = starts.copy(), ends.copy()
+    for c in columns:
+        valid = np.flatnonzero(data[c].notna().to_numpy())
+        if len(valid) == 0:
+            continue
+        i = np.searchsorted(valid, starts) - 1
+        has = i >= 0
+        lo[has] = np.minimum(lo[has], valid[i[has]])
+        j = np.searchsorted(valid, ends)
+        has = j < len(valid)
+        hi[has] = np.maximum(hi[has], valid[j[has]] + 1)
+    return list(zip(lo.tolist(), hi.tolist()))
+
+
+def process_partition(task: dict) -> Tuple[pd.DataFrame, Dict[str, float]]:
+    """
+    处理一个分区（在子进程中运行）：插值 → 时间特征 → 城市划分和噪声，可选写出 parquet 分区
+    task['frame'] 为带前后上下文的行，task['own'] 为本分区在其中的位置
+    """
+    timings = {}
+    start = time.perf_counter()
+    frame, (a, b) = task['frame'], task['own']
+    columns = task['columns']
+    interpolated = frame[columns].interpolate(method='time', limit_direction='forward')
+    data = frame.iloc[a:b].copy()
+    data[columns] = interpolated.iloc[a:b]
+    timings['插值'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    data = add_time_features(data)
+    timings['时间特征'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    cities = task['cities']
+    offset = task['offset']
+    codes = station_codes(np.arange(offset, offset + len(data)), task['total'], len(cities))
+    # 每个分区独立的随机数，结果与进程数和调度顺序无关
+    rng = np.random.default_rng([task['seed'], task['part']])
+    data = assign_stations(data, codes, rng, cities)
+    timings['城市划分和噪声'] = time.perf_counter() - start
+
+    if task['partitions_dir']:
+        start = time.perf_counter()
+        write_partitions(data, task['partitions_dir'], f"part-{task['part']:05d}")
+        timings['写出分区'] = time.perf_counter() - start
+    return data, timings
+
+
+def run_partitions(data: pd.DataFrame, by: str, workers: int, seed: int,
+                   partitions_dir: Optional[str], timer: StageTimer,
+                   cities: dict = CHINA_CITIES) -> pd.DataFrame:
+    """划分分区并行处理，按分区顺序合并（结果与 workers 无关）"""
+    if partitions_dir:
+        os.makedirs(partitions_dir, exist_ok=True)
+        clear_partitions(partitions_dir)
+    columns = numeric_columns(data)
+    bounds = partition_bounds(data, by, len(cities))
+    context = context_bounds(data, columns, bounds)
+    tasks = [{
+        'frame': data.iloc[lo:hi], 'own': (start - lo, end - lo), 'columns': columns,
+        'offset': start, 'total': len(data), 'cities': cities, 'seed': seed, 'part': part,
+        'partitions_dir': partitions_dir,
+    } for part, ((start, end), (lo, hi)) in enumerate(zip(bounds, context))]
+    print(f"✅ 划分为 {len(tasks)} 个分区（按{'月' if by == 'month' else '站点'}），{workers} 个进程")
+
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(process_partition, tasks))
+    else:
+        results = [process_partition(task) for task in tasks]
+    for _, timings in results:
+        for stage, seconds in timings.items():
+            timer.add(f'{stage}（各分区累计）', seconds)
+    if not results:
+        return data.iloc[:0]
+    return pd.concat([frame for frame, _ in results])
+
+
+# 5. 汇总立方体
+def build_rollup(output_path: str):
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'streamlit_app'))
+    from rollup import ensure_rollup
+    ensure_rollup(output_path)
+
+
+def preprocess(input_path: str, output_path: str, workers: int = 1, by: str = 'month',
+               seed: Optional[int] = None, partitions_dir: Optional[str] = None,
+               rollup: bool = True) -> StageTimer:
+    """完整的预处理流程，失败时抛出 PreprocessError"""
+    timer = StageTimer()
+    if seed is None:
+        # 没有指定种子时随机生成一个并输出，方便复现
+        seed = int(np.random.SeedSequence().entropy % (2 ** 32))
+    print(f"✅ 随机种子：{seed}")
+
+    data = timer.run('读取', read_raw, input_path)
+    print("✅ 文件读取成功")
+    data = timer.run('解析日期时间', index_by_datetime, data)
+    print("✅ 日期时间索引设置成功")
+
+    if len(data) % len(CHINA_CITIES) != 0:
+        print(f"⚠️ 数据行数({len(data)})不能整除城市数({len(CHINA_CITIES)})，最后城市将多一点数据")
+    start = time.perf_counter()
+    try:
+        multi_city_df = run_partitions(data, by, workers, seed, partitions_dir, timer)
+    except PreprocessError:
+        raise
+    except Exception as e:
+        raise PreprocessError(f"分区处理时出错: {e}") from e
+    timer.add('并行处理（墙钟）', time.perf_counter() - start)
+    print("✅ 缺失值插值、时间特征、城市划分完成")
+
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+        timer.run('保存 CSV', multi_city_df.to_csv, output_path)
+    except Exception as e:
+        raise PreprocessError(f"保存文件时出错: {e}") from e
     print(f"✅ 数据成功保存到 {output_path}")
-except Exception as e:
-    print(f"❌ 保存文件时出错: {e}")
-    exit()
\ No newline at end of file
+
+    if rollup:
+        # 小时/天/月 × 站点 × 污染物 的汇总，可视化应用直接读取，不再逐小时汇总
+        try:
+            timer.run('汇总立方体', build_rollup, output_path)
+        except Exception as e:
+            raise PreprocessError(f"生成汇总数据时出错: {e}") from e
+        print("✅ 汇总数据生成成功")
+    return timer
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='预处理 AirQualityUCI 原始数据，生成中国 50 城市数据集')
+    parser.add_argument('--input', default=DEFAULT_INPUT, help='原始 CSV（分号分隔）')
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help='输出 CSV')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='并行进程数，1 为不并行')
+    parser.add_argument('--partition-by', choices=PARTITION_KEYS, default='month', help='并行处理的分区方式')
+    parser.add_argument('--seed', type=int, default=None, help='噪声的随机种子')
+    parser.add_argument('--partitions', default=None, help='同时按 年/月 写出 parquet 分区的目录')
+    parser.add_argument('--no-rollup', action='store_true', help='不生成汇总立方体')
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    try:
+        timer = preprocess(args.input, args.output, max(args.workers, 1), args.partition_by,
+                           args.seed, args.partitions, not args.no_rollup)
+    except PreprocessError as e:
+        print(f"❌ {e}")
+        return 1
+    timer.report()
+    print(f"⏱️ 总计: {time.perf_counter() - start:.2f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
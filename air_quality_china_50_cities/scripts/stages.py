@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+
+"""
+stages.py
+
+预处理各阶段的公共函数，整表处理（data_preprocess.py）和分块处理（chunked_preprocess.py）共用：
+1. 原始文件读取、日期时间解析
+2. 跨块的时间插值
+3. 时间特征、城市划分
+4. 按 年/月 分区写出列式文件
+"""
+
+import glob
+import os
+import shutil
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+# 原始文件格式：分号分隔、逗号小数点、-200 表示缺失
+RAW_READ_OPTIONS = dict(sep=';', decimal=',', na_values=[-200])
+DATE_FORMAT = '%d/%m/%Y %H:%M:%S'
+
+POLLUTANTS = ['CO(GT)', 'NMHC(GT)', 'C6H6(GT)', 'NOx(GT)', 'NO2(GT)']
+# 模拟城市差异的噪声幅度（±5%）
+NOISE = 0.05
+
+# 中国50个主要城市及其经纬度
+CHINA_CITIES = {
+    '北京': (39.9042, 116.4074), '上海': (31.2304, 121.4737), '广州': (23.1291, 113.2644),
+    '深圳': (22.5431, 114.0579), '杭州': (30.2741, 120.1551), '南京': (32.0603, 118.7969),
+    '天津': (39.3434, 117.3616), '重庆': (29.5630, 106.5516), '成都': (30.5728, 104.0668),
+    '武汉': (30.5928, 114.3055), '西安': (34.3416, 108.9398), '长沙': (28.2282, 112.9388),
+    '郑州': (34.7466, 113.6254), '青岛': (36.0671, 120.3826), '大连': (38.9140, 121.6147),
+    '厦门': (24.4798, 118.0894), '合肥': (31.8206, 117.2272), '济南': (36.6512, 117.1201),
+    '宁波': (29.8683, 121.5440), '佛山': (23.0215, 113.1214), '苏州': (31.2989, 120.5853),
+    '无锡': (31.4912, 120.3119), '昆明': (25.0389, 102.7189), '南昌': (28.6829, 115.8582),
+    '南宁': (22.8170, 108.3669), '太原': (37.8706, 112.5489), '贵阳': (26.6477, 106.6302),
+    '呼和浩特': (40.8426, 111.7492), '兰州': (36.0611, 103.8343), '哈尔滨': (45.8038, 126.5349),
+    '长春': (43.8171, 125.3235), '沈阳': (41.8057, 123.4315), '石家庄': (38.0428, 114.5149),
+    '唐山': (39.6305, 118.1809), '包头': (40.6574, 109.8403), '西宁': (36.6171, 101.7782),
+    '银川': (38.4872, 106.2309), '海口': (20.0440, 110.1983), '乌鲁木齐': (43.8256, 87.6168),
+    '拉萨': (29.6520, 91.1721), '珠海': (22.2707, 113.5767), '中山': (22.5159, 113.3926),
+    '惠州': (23.1115, 114.4158), '东莞': (23.0207, 113.7518), '江门': (22.5751, 113.0815),
+    '扬州': (32.3932, 119.4127), '镇江': (32.1896, 119.4250), '洛阳': (34.6186, 112.4536),
+    '宜昌': (30.6919, 111.2865), '芜湖': (31.3525, 118.4335)
+}
+
+# 分区文件名：<输出目录>/year=YYYY/month=MM/part-NNNNN.parquet
+PARTITION_GLOB = os.path.join('year=*', 'month=*', '*.parquet')
+
+
+# ---- 读取与解析 ----
+def iter_raw_chunks(path: str, chunk_rows: int) -> Iterator[pd.DataFrame]:
+    """按块读取原始 CSV，每块 chunk_rows 行，删除 'Unnamed' 空列"""
+    for chunk in pd.read_csv(path, chunksize=chunk_rows, **RAW_READ_OPTIONS):
+        yield chunk.loc[:, ~chunk.columns.str.contains('^Unnamed')]
+
+
+def _digits(values: pd.Series, width: int) -> np.ndarray:
+    # 定长 ASCII 字符串 -> (n, width) 的数字矩阵，非定长的行后面单独处理
+    raw = values.fillna('').astype(str).to_numpy().astype(f'S{width}')
+    return np.frombuffer(raw.tobytes(), dtype=np.uint8).reshape(-1, width).astype(np.int64) - 48
+
+
+def parse_datetime(date: pd.Series, time: pd.Series) -> pd.DatetimeIndex:
+    """
+    解析 'dd/mm/YYYY' 和 'HH.MM.SS'（或 'HH:MM:SS'）两列
+    按固定位置直接取数字计算，不拼接字符串；格式不符的行再交给 pd.to_datetime，无法解析的为 NaT
+    """
+    d, t = _digits(date, 10), _digits(time, 8)
+    day, month = d[:, 0] * 10 + d[:, 1], d[:, 3] * 10 + d[:, 4]
+    year = d[:, 6] * 1000 + d[:, 7] * 100 + d[:, 8] * 10 + d[:, 9]
+    hour, minute, second = t[:, 0] * 10 + t[:, 1], t[:, 3] * 10 + t[:, 4], t[:, 6] * 10 + t[:, 7]
+    slash, dot, colon = ord('/') - 48, ord('.') - 48, ord(':') - 48
+    ok = ((d[:, 2] == slash) & (d[:, 5] == slash) & ((t[:, 2] == dot) | (t[:, 2] == colon))
+          & ((t[:, 5] == dot) | (t[:, 5] == colon))
+          & (d[:, [0, 1, 3, 4, 6, 7, 8, 9]] >= 0).all(axis=1) & (d[:, [0, 1, 3, 4, 6, 7, 8, 9]] <= 9).all(axis=1)
+          & (t[:, [0, 1, 3, 4, 6, 7]] >= 0).all(axis=1) & (t[:, [0, 1, 3, 4, 6, 7]] <= 9).all(axis=1)
+          & (month >= 1) & (month <= 12) & (day >= 1) & (day <= 31)
+          & (hour <= 23) & (minute <= 59) & (second <= 59))
+    months = ((year - 1970) * 12 + month - 1).astype('datetime64[M]')
+    days = months.astype('datetime64[D]') + (day - 1)
+    # 31/02 这类日期会进到下个月，交给下面的慢速路径判断
+    ok &= days.astype('datetime64[M]') == months
+    out = (days.astype('datetime64[s]') + (hour * 3600 + minute * 60 + second)).astype('datetime64[s]')
+    out[~ok] = np.datetime64('NaT')
+    bad = np.flatnonzero(~ok & date.notna().to_numpy() & time.notna().to_numpy())
+    if len(bad):
+        text = date.iloc[bad].astype(str) + ' ' + time.iloc[bad].astype(str).str.replace('.', ':', regex=False)
+        out[bad] = pd.to_datetime(text, format=DATE_FORMAT, errors='coerce').to_numpy().astype('datetime64[s]')
+    return pd.DatetimeIndex(out, name='Datetime')
+
+
+# ---- 插值 ----
+class ChunkInterpolator:
+    """
+    分块的时间加权插值（method='time', limit_direction='forward'），结果与整表插值相同
+    每块只输出所有列都已“确定”的行：某列最后一个有效值之后的行要等下一个有效值才能插值，
+    这些行连同前面一行已输出的结果（锚点）留到下一块一起计算。
+    某列连续缺失超过 max_hold 行时不再等待，先按最后一个有效值填充输出，内存始终有界
+    """
+
+    def __init__(self, columns: List[str], max_hold: int = 100000):
+        self.columns = columns
+        self.max_hold = max_hold
+        self._anchor: Optional[pd.DataFrame] = None
+        self._held: Optional[pd.DataFrame] = None
+
+    def _interpolate(self, frame: pd.DataFrame) -> pd.DataFrame:
+        out = frame.copy()
+        out[self.columns] = frame[self.columns].interpolate(method='time', limit_direction='forward')
+        return out
+
+    def push(self, chunk: pd.DataFrame) -> pd.DataFrame:
+        """加入按时间排序的一块（索引为 Datetime），返回可以输出的已插值行"""
+        parts = [p for p in (self._anchor, self._held, chunk) if p is not None and len(p)]
+        frame = pd.concat(parts) if len(parts) > 1 else parts[0]
+        skip = 0 if self._anchor is None else len(self._anchor)
+        values = frame[self.columns].to_numpy(dtype=np.float64)
+        valid = ~np.isnan(values)
+        # 每列最后一个有效值的位置；之后的行还不能确定。整列缺失的列不影响
+        has = valid.any(axis=0)
+        last = len(frame) - 1 - np.argmax(valid[::-1], axis=0)
+        cut = int(last[has].min()) + 1 if has.any() else len(frame)
+        cut = max(cut, len(frame) - self.max_hold, skip)
+        result = self._interpolate(frame)
+        if cut > skip:
+            self._anchor = result.iloc[cut - 1:cut]
+        self._held = frame.iloc[cut:]
+        return result.iloc[skip:cut]
+
+    @classmethod
+    def resume(cls, columns: List[str], anchor: Optional[pd.DataFrame], held: Optional[pd.DataFrame],
+               max_hold: int = 100000) -> 'ChunkInterpolator':
+        """
+        从保存的状态继续插值（增量追加时使用）
+        anchor 为已输出的最后一行（至少包含 columns），held 为已读入、还不能输出的行
+        """
+        interpolator = cls(columns, max_hold)
+        interpolator._anchor = anchor if anchor is not None and len(anchor) else None
+        interpolator._held = held if held is not None and len(held) else None
+        return interpolator
+
+    def state(self) -> Tuple[Optional[pd.DataFrame], Optional[pd.DataFrame]]:
+        """(锚点, 待定行)，保存后用 resume 恢复"""
+        return self._anchor, self._held
+
+    def flush(self) -> pd.DataFrame:
+        """数据结束：剩余的行按最后一个有效值填充（与整表插值相同）"""
+        if self._held is None or not len(self._held):
+            return pd.DataFrame()
+        parts = [p for p in (self._anchor, self._held) if p is not None]
+        skip = 0 if self._anchor is None else len(self._anchor)
+        result = self._interpolate(pd.concat(parts))
+        self._anchor = self._held = None
+        return result.iloc[skip:]
+
+
+# ---- 特征与城市划分 ----
+def add_time_features(data: pd.DataFrame) -> pd.DataFrame:
+    """从 Datetime 索引提取年份、月份、日期、小时和星期几（0 = 周一）"""
+    idx = data.index
+    data['Year'] = idx.year
+    data['Month'] = idx.month
+    data['Day'] = idx.day
+    data['Hour'] = idx.hour
+    data['Weekday'] = idx.weekday
+    return data
+
+
+def station_codes(positions: np.ndarray, total_rows: int, num_cities: int) -> np.ndarray:
+    """全局行号 -> 城市编号：每个城市 total_rows // num_cities 行，剩余的行都归最后一个城市"""
+    n = max(total_rows // num_cities, 1)
+    return np.minimum(positions // n, num_cities - 1)
+
+
+def assign_stations(data: pd.DataFrame, codes: np.ndarray, rng: np.random.Generator,
+                    cities: dict = CHINA_CITIES) -> pd.DataFrame:
+    """
+    按城市编号添加 Station/Latitude/Longitude，并对污染物添加 ±5% 的噪声
+    噪声一次生成 (行数 × 污染物数) 的矩阵，经纬度按编号从查找表取值，不按城市循环
+    """
+    names = list(cities.keys())
+    coords = np.array(list(cities.values()))
+    pollutants = [p for p in POLLUTANTS if p in data.columns]
+    noise = rng.uniform(1 - NOISE, 1 + NOISE, size=(len(data), len(pollutants)))
+    data[pollutants] = data[pollutants].to_numpy(dtype=np.float64) * noise
+    data['Station'] = pd.Categorical.from_codes(codes, categories=names)
+    data['Latitude'] = coords[codes, 0]
+    data['Longitude'] = coords[codes, 1]
+    return data
+
+
+# ---- 分区输出 ----
+def partition_path(out_dir: str, year: int, month: int) -> str:
+    return os.path.join(out_dir, f'year={year:04d}', f'month={month:02d}')
+
+
+def write_partitions(data: pd.DataFrame, out_dir: str, part: str) -> List[str]:
+    """按 年/月 把一块数据写成 <out_dir>/year=YYYY/month=MM/<part>.parquet，返回写出的文件"""
+    written = []
+    if data.empty:
+        return written
+    key = data.index.year * 100 + data.index.month
+    for ym in np.unique(key):
+        folder = partition_path(out_dir, int(ym) // 100, int(ym) % 100)
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, f'{part}.parquet')
+        data[key == ym].to_parquet(path)
+        written.append(path)
+    return written
+
+
+def clear_partitions(out_dir: str):
+    """删除旧的分区，避免与本次结果混在一起"""
+    for name in os.listdir(out_dir) if os.path.isdir(out_dir) else []:
+        if name.startswith('year='):
+            shutil.rmtree(os.path.join(out_dir, name))
+
+
+def partition_files(out_dir: str) -> List[str]:
+    """按时间顺序列出分区文件（目录名和文件名都是定长编号，字典序即时间顺序）"""
+    return sorted(glob.glob(os.path.join(out_dir, PARTITION_GLOB)))
+
+
+def read_partitions(out_dir: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """读取全部分区，按时间排序后返回（分区目录名不会变成额外的列）"""
+    files = partition_files(out_dir)
+    if not files:
+        return pd.DataFrame()
+    data = pd.concat([pd.read_parquet(f, columns=columns) for f in files])
+    return data if data.index.is_monotonic_increasing else data.sort_index(kind='stable')
@@ -0,0 +1,220 @@
+import threading
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from dataset import DATETIME_COLUMN, STATION_COLUMN
+from rollup import ROLLUP_COLUMNS, SKETCH_BINS, SKETCH_MAX, SKETCH_MIN, bin_values, sketch_bins
+
+# 季节窗口：按一天中的小时分开统计
+SEASONS = 24
+# 历史读数的权重每过 HALF_LIFE_DAYS 天减半，相当于一个平滑的滑动窗口
+HALF_LIFE_DAYS = 30.0
+# 单元中有效读数（按衰减后的权重计）少于这个数时不报警
+MIN_WEIGHT = 5.0
+# 草图桶中点到桶边界的倍数（对数刻度上半个桶宽）
+_HALF_BIN = 10 ** ((np.log10(SKETCH_MAX) - np.log10(SKETCH_MIN)) / SKETCH_BINS / 2)
+ANOMALY_COLUMNS = [DATETIME_COLUMN, STATION_COLUMN, 'Pollutant', 'Value', 'Lower', 'Upper']
+
+
+def sketch_quantiles(counts: np.ndarray, qs: Sequence[float]) -> np.ndarray:
+    """
+    一组草图（最后一维为桶）的近似分位数，结果形状为 counts.shape[:-1] + (len(qs),)
+    与 rollup.quantiles_from_counts 的取法相同，只是对所有单元一起计算；空草图为 NaN
+    """
+    cum = np.cumsum(counts, axis=-1)
+    total = cum[..., -1:]
+    out = np.empty(counts.shape[:-1] + (len(qs),))
+    for i, q in enumerate(qs):
+        idx = np.minimum((cum < q * total).sum(axis=-1), counts.shape[-1] - 1)
+        out[..., i] = bin_values(idx)
+    out[total[..., 0] <= 0] = np.nan
+    return out
+
+
+class SeasonalIQRDetector:
+    """
+    按 (站点, 一天中的小时) 统计每个污染物的分位数草图，用 IQR 规则判断新读数是否异常
+    草图与汇总立方体相同（rollup.sketch_bins 的对数分桶），桶计数可以直接相加合并；
+    旧读数按半衰期指数衰减，衰减只在单元被更新时补算，所以每个新读数的代价是 O(桶数)，
+    与历史长度无关。用法：
+        det = SeasonalIQRDetector().fit(history)
+        alerts = det.update('北京', ts, {'CO(GT)': 3.2, ...})
+    """
+
+    def __init__(self, pollutants: Sequence[str] = ROLLUP_COLUMNS, half_life_days: float = HALF_LIFE_DAYS,
+                 multiplier: float = 1.5, min_weight: float = MIN_WEIGHT):
+        self.pollutants = list(pollutants)
+        self.half_life = np.timedelta64(int(half_life_days * 86400), 's')
+        self.multiplier = multiplier
+        self.min_weight = min_weight
+        self.stations: Dict[object, int] = {}
+        # 每个污染物一个 (站点, 小时, 桶) 的计数数组；updated 为每个单元计数对应的时间
+        self.counts = {p: np.zeros((0, SEASONS, SKETCH_BINS + 1)) for p in self.pollutants}
+        self.updated = np.zeros((0, SEASONS), dtype='datetime64[s]')
+        self._bounds = {p: np.full((0, SEASONS, 2), np.nan) for p in self.pollutants}
+        self._lock = threading.Lock()
+
+    # ---- 内部 ----
+    def _row(self, station) -> int:
+        row = self.stations.get(station)
+        if row is None:
+            row = self.stations[station] = len(self.stations)
+            if row >= len(self.updated):
+                # 容量翻倍，逐个新增站点时均摊 O(1)
+                extra = max(len(self.updated), 4)
+                for p in self.pollutants:
+                    self.counts[p] = np.concatenate([self.counts[p], np.zeros((extra, SEASONS, SKETCH_BINS + 1))])
+                    self._bounds[p] = np.concatenate([self._bounds[p], np.full((extra, SEASONS, 2), np.nan)])
+                self.updated = np.concatenate([self.updated, np.full((extra, SEASONS), np.datetime64('NaT'), 'datetime64[s]')])
+        return row
+
+    def _decay(self, since, until) -> np.ndarray:
+        age = (np.asarray(until, dtype='datetime64[s]') - np.asarray(since, dtype='datetime64[s]'))
+        factor = 0.5 ** (age / self.half_life)
+        # 从未更新过的单元没有计数，按 1 处理
+        return np.where(np.isnat(np.asarray(since, dtype='datetime64[s]')), 1.0, np.minimum(factor, 1.0))
+
+    def _refresh(self, p: str, rows, hours):
+        """重新计算单元的上下界；有效权重不足的单元为 NaN（不报警）"""
+        counts = self.counts[p][rows, hours]
+        q = sketch_quantiles(counts, [0.25, 0.75])
+        # 取四分位数所在桶的外侧边界：草图的分辨率只会让界限变宽，不会因为桶宽误报
+        q1, q3 = q[..., 0] / _HALF_BIN, q[..., 1] * _HALF_BIN
+        iqr = q3 - q1
+        bounds = np.stack([q1 - self.multiplier * iqr, q3 + self.multiplier * iqr], axis=-1)
+        bounds[counts.sum(axis=-1) < self.min_weight] = np.nan
+        self._bounds[p][rows, hours] = bounds
+
+    # ---- 批量 ----
+    def fit(self, df: pd.DataFrame) -> 'SeasonalIQRDetector':
+        """
+        一次性加入历史读数（向量化），结果与按时间顺序逐条 update 相同
+        每个 (站点, 小时) 单元衰减到该单元自己最新的读数时间，与 update 一样；
+        各站点覆盖的时段不同，不能统一衰减到整个 df 的最新时间
+        """
+        if df.empty:
+            return self
+        times = pd.DatetimeIndex(df[DATETIME_COLUMN]).as_unit('s')
+        with self._lock:
+            uniq = df[STATION_COLUMN].unique()
+            lookup = pd.Series([self._row(s) for s in uniq], index=uniq)
+            r = lookup.reindex(df[STATION_COLUMN].to_numpy()).to_numpy()
+            h = times.hour.to_numpy()
+            t = times.to_numpy()
+            cell = r * SEASONS + h
+            # 每个单元的新时间：原有时间与该单元新读数的最大值（NaT 按 int64 视图是最小值）
+            latest = self.updated.reshape(-1).view(np.int64).copy()
+            np.maximum.at(latest, cell, t.view(np.int64))
+            now = latest.view('datetime64[s]').reshape(self.updated.shape)
+            # 已有计数先衰减到各自单元的新时间，新读数按距所在单元新时间的间隔计算权重
+            decay = self._decay(self.updated, now)
+            for p in self.pollutants:
+                self.counts[p] *= decay[..., None]
+            self.updated = now
+            weight = self._decay(t, now.reshape(-1)[cell])
+            for p in self.pollutants:
+                if p not in df.columns:
+                    continue
+                v = pd.to_numeric(df[p], errors='coerce').to_numpy(dtype=np.float64)
+                ok = ~np.isnan(v)
+                np.add.at(self.counts[p], (r[ok], h[ok], sketch_bins(v[ok])), weight[ok])
+            # 衰减也会改变有效权重，所有涉及的单元都重新计算上下界
+            used = np.unique(cell)
+            for p in self.pollutants:
+                self._refresh(p, used // SEASONS, used % SEASONS)
+        return self
+
+    def bounds(self, pollutant: str) -> pd.DataFrame:
+        """每个 (站点, 小时) 当前的上下界，索引为站点，列为 Lower/Upper 的 0..23 点"""
+        with self._lock:
+            b = self._bounds[pollutant][:len(self.stations)]
+            cols = pd.MultiIndex.from_product([['Lower', 'Upper'], range(SEASONS)], names=['', 'Hour'])
+            data = np.concatenate([b[..., 0], b[..., 1]], axis=1)
+            return pd.DataFrame(data, index=pd.Index(list(self.stations), name=STATION_COLUMN), columns=cols)
+
+    def score(self, df: pd.DataFrame, pollutants: Optional[Sequence[str]] = None) -> pd.DataFrame:
+        """
+        用当前的上下界检查一批读数（不更新草图），返回异常读数：
+        Datetime, Station, Pollutant, Value, Lower, Upper
+        查表是向量化的，代价与 df 的行数成正比，与历史长度无关
+        """
+        pollutants = [p for p in (pollutants or self.pollutants) if p in df.columns and p in self.counts]
+        if df.empty or not pollutants:
+            return pd.DataFrame(columns=ANOMALY_COLUMNS)
+        times = pd.DatetimeIndex(df[DATETIME_COLUMN])
+        with self._lock:
+            rows = pd.Series(self.stations, dtype=np.float64).reindex(df[STATION_COLUMN].to_numpy()).to_numpy()
+            known = ~np.isnan(rows)
+            r = np.nan_to_num(rows, nan=0).astype(np.int64)
+            h = times.hour.to_numpy()
+            parts = []
+            for p in pollutants:
+                v = pd.to_numeric(df[p], errors='coerce').to_numpy(dtype=np.float64)
+                b = self._bounds[p][r, h]
+                hit = known & ((v < b[:, 0]) | (v > b[:, 1]))
+                if hit.any():
+                    parts.append(pd.DataFrame({
+                        DATETIME_COLUMN: times[hit], STATION_COLUMN: df[STATION_COLUMN].to_numpy()[hit],
+                        'Pollutant': p, 'Value': v[hit], 'Lower': b[hit, 0], 'Upper': b[hit, 1],
+                    }))
+        if not parts:
+            return pd.DataFrame(columns=ANOMALY_COLUMNS)
+        return pd.concat(parts, ignore_index=True).sort_values(DATETIME_COLUMN, kind='stable').reset_index(drop=True)
+
+    # ---- 增量 ----
+    def update(self, station, time, values: Dict[str, float]) -> List[dict]:
+        """
+        新到的一条逐小时读数：先按加入前的上下界判断是否异常，再把读数加入草图
+        只处理对应的一个 (站点, 小时) 单元，返回异常列表（每项与 score 的一行相同）
+        """
+        ts = np.datetime64(pd.Timestamp(time).to_datetime64(), 's')
+        hour = pd.Timestamp(time).hour
+        alerts = []
+        with self._lock:
+            row = self._row(station)
+            last = self.updated[row, hour]
+            if not np.isnat(last) and ts > last:
+                decay = float(self._decay(last, ts))
+                for p in self.pollutants:
+                    self.counts[p][row, hour] *= decay
+            # 迟到的读数按它自己的时间衰减后加入，不回退单元的时间
+            weight = float(self._decay(ts, last)) if not np.isnat(last) and ts < last else 1.0
+            self.updated[row, hour] = ts if np.isnat(last) else max(last, ts)
+            for p, v in values.items():
+                if p not in self.counts or v is None or pd.isna(v):
+                    continue
+                lower, upper = self._bounds[p][row, hour]
+                if v < lower or v > upper:
+                    alerts.append({DATETIME_COLUMN: pd.Timestamp(time), STATION_COLUMN: station,
+                                   'Pollutant': p, 'Value': float(v), 'Lower': lower, 'Upper': upper})
+                self.counts[p][row, hour, sketch_bins(np.array([v], dtype=np.float64))[0]] += weight
+            # 衰减对所有污染物都生效，没有新值的污染物也要重新计算上下界
+            for p in self.pollutants:
+                self._refresh(p, np.array([row]), np.array([hour]))
+        return alerts
+
+    def merge(self, other: 'SeasonalIQRDetector') -> 'SeasonalIQRDetector':
+        """
+        合并另一个检测器（例如按分区分别 fit 的结果）：两边衰减到同一时间后桶计数相加
+        """
+        with self._lock, other._lock:
+            for station, src in other.stations.items():
+                dst = self._row(station)
+                for hour in range(SEASONS):
+                    a, b = self.updated[dst, hour], other.updated[src, hour]
+                    if np.isnat(b):
+                        continue
+                    now = b if np.isnat(a) else max(a, b)
+                    da = float(self._decay(a, now)) if not np.isnat(a) else 1.0
+                    db = float(self._decay(b, now))
+                    for p in self.pollutants:
+                        if p not in other.counts:
+                            continue
+                        self.counts[p][dst, hour] = self.counts[p][dst, hour] * da + other.counts[p][src, hour] * db
+                    self.updated[dst, hour] = now
+                rows, hours = np.full(SEASONS, dst), np.arange(SEASONS)
+                for p in self.pollutants:
+                    self._refresh(p, rows, hours)
+        return self
@@ -4,13 +4,19 @@ import os
 import streamlit as st
 import pandas as pd
 
-from streamlit_echarts import st_pyecharts
+from streamlit_echarts import st_echarts
 from streamlit_folium import st_folium
 import folium
 from folium.plugins import TimestampedGeoJson
 import plotly.io as pio
 import plotly.graph_objects as go
 
+from anomaly import SeasonalIQRDetector
+from chartcache import cached_chart
+from dataset import DataIndex, open_shared
+from downsample import target_points
+from exports import csv_bytes, export_button
+from rollup import ensure_rollup
 from viz import (
     filter_data,
     make_dynamic_line,
@@ -20,12 +26,13 @@ from viz import (
     make_aqi_level_chart,
     make_city_bubble_map,
     #make_city_bubble_scatter,
-    #make_map_timeline,
+    make_map_timeline,
     make_heatmap_corr,
     make_stacked_bar,
     make_calendar_plot,
     make_3d_surface,
     iqr_anomaly_detection,
+    hourly_iqr_bounds,
     get_daily_mean,
 )
 
@@ -50,6 +57,10 @@ st.markdown(
     unsafe_allow_html=True,
 )
 
+# 显示缓存的 pyecharts 图表：与 st_pyecharts 相同，但配置只在第一次显示时生成
+def show_echarts(entry, height="500px", width="100%"):
+    st_echarts(options=entry.options, height=height, width=width)
+
 # 城市气泡图展示函数
 def display_bubble_map(df: pd.DataFrame, pollutants: list):
     st.subheader("🔵 城市空气质量气泡图")
@@ -72,41 +83,63 @@ def display_bubble_map(df: pd.DataFrame, pollutants: list):
         fig = make_city_bubble_scatter(df2, metrics)
     if fig and fig.data:
         st.plotly_chart(fig, use_container_width=True)
-        html = fig.to_html(full_html=False).encode('utf-8')
-        st.download_button("下载 HTML", html, "bubble_map.html", "text/html")
+        # HTML 和 PNG 只在下载时生成
+        params = (mode, metrics)
+        export_button("下载 HTML", lambda: fig.to_html(full_html=False), "bubble_map.html", "text/html",
+                      params, cache=False)
         try:
-            png = pio.to_image(fig, format="png", width=800, height=600, scale=2, engine="orca")
-            st.download_button("下载 PNG", png, "bubble_map.png", "image/png")
+            export_button("下载 PNG",
+                          lambda: pio.to_image(fig, format="png", width=800, height=600, scale=2, engine="orca"),
+                          "bubble_map.png", "image/png", params, cache=False)
         except Exception as e:
             st.warning(f"Orca 渲染失败：{e}")
     else:
         st.warning("⚠️ 数据不足，无法生成气泡图。")
 
 # 数据加载
-@st.cache_data(show_spinner=True)
+DATA_PATH = os.path.join(os.path.dirname(__file__), "data/processed/china_50_cities.csv")
+# 趋势图最多保留的点数：页面为 wide 布局，按约 1200 像素宽计算
+TREND_POINTS = target_points(1200)
+
+@st.cache_resource(show_spinner=True)
 def load_data():
-    path = os.path.join(os.path.dirname(__file__), "data/processed/china_50_cities.csv")
-    df = pd.read_csv(path, parse_dates=["Datetime"] )
-    df["Date"] = df["Datetime"].dt.date
-    df["Hour"] = pd.to_numeric(df.get("Hour",0), errors="coerce").fillna(0).astype(int)
-    df["Station"] = df["Station"].astype(str)
-    return df
+    # 内存映射的列文件，所有会话共用同一个只读 DataFrame，CSV 变化时自动重建（见 dataset.py）
+    # 不要原地修改 df，需要新列时先筛选或 copy
+    return open_shared(DATA_PATH)
+
+@st.cache_resource(show_spinner=False)
+def load_index():
+    # 站点/时间索引，加载后只建一次，筛选时不再扫描整表
+    return DataIndex(load_data())
+
+@st.cache_resource(show_spinner=False)
+def load_rollup():
+    # 预处理时生成的 小时/天/月 × 站点 × 污染物 汇总，图表直接查询汇总
+    return ensure_rollup(DATA_PATH)
+
+@st.cache_resource(show_spinner=False)
+def load_detector():
+    # 按 (站点, 小时) 的分位数草图，启动时用全部历史建一次；新读数用 detector.update 增量加入
+    return SeasonalIQRDetector().fit(load_data())
 
 df = load_data()
+data_index = load_index()
+rollup = load_rollup()
+detector = load_detector()
 
 # 侧边栏筛选
 st.sidebar.header("筛选条件")
-cities = df["Station"].unique().tolist()
+cities = list(data_index.stations)
 selected_cities = st.sidebar.multiselect("城市", cities, default=cities)
 pollutants_all = ["CO(GT)","NMHC(GT)","C6H6(GT)","NOx(GT)","NO2(GT)"]
 selected_pollutants = st.sidebar.multiselect("污染物", pollutants_all, default=[pollutants_all[0]])
-date_min, date_max = df["Date"].min(), df["Date"].max()
+date_min, date_max = df["Date"].min().date(), df["Date"].max().date()
 date_range = st.sidebar.date_input("日期范围", [date_min,date_max], min_value=date_min, max_value=date_max)
 # 时空地图粒度
 agg = st.sidebar.radio("时空地图粒度", ["Daily","Hourly"])
 aggregate = 'D' if agg=='Daily' else 'H'
 # 动态时间
-unique_dates = pd.to_datetime(sorted(df["Date"].unique()))
+unique_dates = data_index.days
 idx_min,idx_max=0,len(unique_dates)-1
 st.session_state.setdefault('play',False)
 st.session_state.setdefault('idx',idx_min)
@@ -127,8 +160,13 @@ else:
     st.session_state.idx=date_idx
 
 # 数据过滤
-filtered=filter_data(df, selected_cities, date_range[0], date_range[1])
-filtered_date=filtered[filtered['Date']==selected_date]
+filtered=filter_data(df, selected_cities, date_range[0], date_range[1], index=data_index)
+filtered_date=filtered[filtered['Date']==pd.Timestamp(selected_date)]
+cube=rollup.view(selected_cities, date_range[0], date_range[1])
+cube_date=cube.restrict(selected_date, selected_date)
+# 图表缓存键：数据版本 + 城市 + 日期范围；参数不变的图表在重新运行时直接复用
+range_key=cube.key
+day_key=cube_date.key
 
 # 主页面
 st.title(f"🌍 空气质量可视化 - {selected_date}")
@@ -142,43 +180,56 @@ else:
     for p in selected_pollutants:
         st.markdown(f"#### {p}")
         try:
-            c=make_aqi_rank_chart(filtered_date,p)
-            st_pyecharts(c)
-            st.download_button(f"下载 {p}",c.render_embed().encode(),f"{p}_rank.html")
+            c=cached_chart("aqi_rank",(day_key,p),lambda: make_aqi_rank_chart(filtered_date,p,cube=cube_date))
+            show_echarts(c)
+            export_button(f"下载 {p}",lambda c=c: c.html,f"{p}_rank.html",params=(day_key,p),cache=False)
         except: st.error(f"{p} 排名失败")
 
     # 2. 单污染物趋势
     st.subheader("📈 单污染物趋势")
     sel=st.selectbox("污染物",pollutants_all)
-    d=get_daily_mean(filtered,sel)
-    l=make_line_trend(d,sel)
-    a=iqr_anomaly_detection(d,[sel])
+    d=cached_chart("daily_mean",(range_key,sel),lambda: get_daily_mean(filtered,sel,cube=cube)).value
+    l=cached_chart("line_trend",(range_key,sel,TREND_POINTS),
+                   lambda: make_line_trend(d.copy(),sel,max_points=TREND_POINTS))
+    a=cached_chart("anomaly",(range_key,[sel]),lambda: iqr_anomaly_detection(d,[sel])).value
     st.write(f"异常点：{len(a)}")
     st.dataframe(a)
-    st_pyecharts(l)
-    st.download_button("下载趋势",l.render_embed().encode(),f"trend_{sel}.html")
+    # 逐小时读数与同一站点、同一时段的历史分布比较，只查表，不重新计算分位数
+    ha=cached_chart("hourly_anomaly",(range_key,sel),lambda: detector.score(filtered,[sel])).value
+    st.write(f"站点逐小时异常：{len(ha)}")
+    st.dataframe(ha)
+    b=cached_chart("hourly_iqr",(range_key,sel),lambda: hourly_iqr_bounds(cube,sel)).value
+    st.caption(f"所选范围逐小时读数：Q1 {b['Q1']:.1f}，Q3 {b['Q3']:.1f}，"
+               f"IQR 范围 [{b['Lower']:.1f}, {b['Upper']:.1f}]（由汇总草图估计）")
+    show_echarts(l)
+    export_button("下载趋势",lambda: l.html,f"trend_{sel}.html",params=(range_key,sel),cache=False)
 
     # 3. 多污染物对比
     st.subheader("📈 多污染物趋势对比")
-    dm=get_daily_mean(filtered,selected_pollutants)
-    ml=make_multi_pollutant_trend(dm,selected_pollutants)
-    an=iqr_anomaly_detection(dm,selected_pollutants)
+    dm=cached_chart("daily_mean",(range_key,selected_pollutants),
+                    lambda: get_daily_mean(filtered,selected_pollutants,cube=cube)).value
+    ml=cached_chart("multi_trend",(range_key,selected_pollutants,TREND_POINTS),
+                    lambda: make_multi_pollutant_trend(dm.copy(),selected_pollutants,max_points=TREND_POINTS))
+    an=cached_chart("anomaly",(range_key,selected_pollutants),
+                    lambda: iqr_anomaly_detection(dm,selected_pollutants)).value
     st.write(f"异常点：{len(an)}")
     st.dataframe(an)
-    st_pyecharts(ml)
-    st.download_button("下载多趋势",ml.render_embed().encode(),"trend_multi.html")
+    show_echarts(ml)
+    export_button("下载多趋势",lambda: ml.html,"trend_multi.html",params=(range_key,selected_pollutants),cache=False)
 
     # 4. 堆叠 & 等级
     st.subheader("📊 月均堆叠")
     try:
-        sb=make_stacked_bar(filtered,selected_pollutants[0])
-        st_pyecharts(sb)
-        st.download_button("下载堆叠",sb.render_embed().encode(),"stacked_bar.html")
+        sb=cached_chart("stacked_bar",(range_key,selected_pollutants[0]),
+                        lambda: make_stacked_bar(filtered,selected_pollutants[0],cube=cube))
+        show_echarts(sb)
+        export_button("下载堆叠",lambda: sb.html,"stacked_bar.html",params=(range_key,selected_pollutants[0]),cache=False)
     except: st.info("堆叠失败")
     st.subheader("🌈 AQI 等级")
-    lv=make_aqi_level_chart(filtered_date,selected_pollutants)
-    st_pyecharts(lv)
-    st.download_button("下载等级",lv.render_embed().encode(),"aqi_level.html")
+    lv=cached_chart("aqi_level",(day_key,selected_pollutants),
+                    lambda: make_aqi_level_chart(filtered_date,selected_pollutants))
+    show_echarts(lv)
+    export_button("下载等级",lambda: lv.html,"aqi_level.html",params=(day_key,selected_pollutants),cache=False)
 
     #5. 气泡图
     st.subheader("🏙️ 城市空气质量气泡图")
@@ -188,7 +239,7 @@ else:
         import plotly.graph_objects as go
 
         df2 = df.dropna(subset=['Latitude', 'Longitude'] + pollutants)
-        grouped = df2.groupby('Station')[pollutants + ['Latitude', 'Longitude']].mean().reset_index()
+        grouped = df2.groupby('Station', observed=True)[pollutants + ['Latitude', 'Longitude']].mean().reset_index()
 
         fig = go.Figure()
         buttons = []
@@ -229,98 +280,58 @@ else:
             height=600
         )
         return fig
-    bubble_fig = make_city_bubble_map(df, selected_pollutants)
+    bubble_fig = cached_chart("bubble_map", (rollup.version, selected_pollutants),
+                              lambda: make_city_bubble_map(df, selected_pollutants)).chart
     st.plotly_chart(bubble_fig, use_container_width=True)
 
 
+    # 6. 时空动态地图：按侧边栏的城市和日期范围，从汇总数据生成，GeoJSON 有缓存
+    st.subheader("🗺️ 时空动态地图")
     auto_play = st.session_state.play
-    def make_map_timeline(df, pollutant, aggregate='D', auto_play=False):
-        import folium
-        from folium.plugins import TimestampedGeoJson
-
-        df['Datetime'] = df['Datetime'].dt.to_period(aggregate).dt.to_timestamp()
-
-        features = []
-        for _, row in df.iterrows():
-            if pd.isna(row[pollutant]) or pd.isna(row['Latitude']) or pd.isna(row['Longitude']):
-                continue
-            features.append({
-                'type': 'Feature',
-                'geometry': {'type': 'Point', 'coordinates': [row['Longitude'], row['Latitude']]},
-                'properties': {
-                    'time': row['Datetime'].strftime('%Y-%m-%dT%H:%M:%S'),
-                    'popup': f"{row['Station']} {pollutant}: {row[pollutant]:.2f}",
-                    'icon': 'circle',
-                    'iconstyle': {
-                        'fillColor': '#3186cc',
-                        'fillOpacity': 0.7,
-                        'radius': 6
-                    }
-                }
-            })
-
-        m = folium.Map(location=[df['Latitude'].mean(), df['Longitude'].mean()], zoom_start=6)
-        TimestampedGeoJson(
-            {'type': 'FeatureCollection', 'features': features},
-            period=f'P1{aggregate}',
-            add_last_point=True,
-            auto_play=auto_play,
-            loop=False,
-            max_speed=1,
-            loop_button=True,
-            time_slider_drag_update=True
-        ).add_to(m)
-        return m
-
-    # 调用函数时传入 auto_play 参数
-    tl_map = make_map_timeline(
-        df=df,
-        pollutant=selected_pollutants[0],
-        aggregate=aggregate,
-        auto_play=auto_play  # 确保这里传入了 auto_play 参数
+    tl_entry = cached_chart(
+        "map_timeline",
+        (range_key, selected_pollutants[0], aggregate, auto_play),
+        lambda: make_map_timeline(cube, pollutant=selected_pollutants[0],
+                                  aggregate=aggregate, auto_play=auto_play)
     )
+    tl_map = tl_entry.chart
 
     # 使用 streamlit-folium 显示地图
     st_data = st_folium(tl_map, width=800, height=600)
 
     # 提供下载地图的选项
-    html_map = tl_map.get_root().render()
-    st.download_button(
-        label="📥 下载时空地图（HTML）",
-        data=html_map,
-        file_name="map_timeline.html",
-        mime="text/html"
-    )
-    # 6. 时空动态地图
-    st.subheader("🗺️ 时空动态地图")
-
-
-    # ✅ 修改后（正确）：
-    tl_map = make_map_timeline(
-        df=df,
-        pollutant=selected_pollutants[0],
-        auto_play=auto_play
+    export_button(
+        "📥 下载时空地图（HTML）",
+        lambda: tl_entry.html,
+        "map_timeline.html",
+        "text/html",
+        params=(range_key, selected_pollutants[0], aggregate, auto_play),
+        cache=False
     )
 
     # 7. 相关性 热力 日历 3D 相关性 热力 日历 3D
     st.subheader("🔥 相关性热力图")
-    hm=make_heatmap_corr(filtered_date[selected_pollutants])
-    st_pyecharts(hm)
-    st.download_button("下载热力",hm.render_embed().encode(),"heatmap.html")
+    hm=cached_chart("heatmap",(day_key,selected_pollutants),
+                    lambda: make_heatmap_corr(filtered_date[selected_pollutants]))
+    show_echarts(hm)
+    export_button("下载热力",lambda: hm.html,"heatmap.html",params=(day_key,selected_pollutants),cache=False)
     st.subheader("📅 日历图")
-    cl=make_calendar_plot(filtered,selected_pollutants[0])
-    if cl.options.get('series') and cl.options['series'][0].get('data'):
-        st_pyecharts(cl,height='400px',width='100%')
-        st.download_button("下载日历",cl.render_embed().encode(),"calendar.html")
+    cl=cached_chart("calendar",(range_key,selected_pollutants[0]),
+                    lambda: make_calendar_plot(filtered,selected_pollutants[0],cube=cube))
+    if cl.chart.options.get('series') and cl.chart.options['series'][0].get('data'):
+        show_echarts(cl,height='400px',width='100%')
+        export_button("下载日历",lambda: cl.html,"calendar.html",params=(range_key,selected_pollutants[0]),cache=False)
     else: st.info("无日历数据")
     st.subheader("📊 3D 表面")
-    sf=make_3d_surface(filtered,selected_pollutants[0])
-    st_pyecharts(sf,height='400px')
-    st.download_button("下载3D",sf.render_embed().encode(),"surface3d.html")
+    sf=cached_chart("surface3d",(range_key,selected_pollutants[0]),
+                    lambda: make_3d_surface(filtered,selected_pollutants[0]))
+    show_echarts(sf,height='400px')
+    export_button("下载3D",lambda: sf.html,"surface3d.html",params=(range_key,selected_pollutants[0]),cache=False)
 
     # 8. 导出
     st.markdown("---")
-    st.download_button("下载CSV",filtered_date.to_csv(index=False).encode(),"data.csv")
+    # CSV 点击下载时才分块生成，按筛选条件缓存
+    export_button("下载CSV",lambda: csv_bytes(filtered_date),"data.csv","text/csv",params=day_key)
 
 st.markdown("---")
 st.markdown("**说明：支持粒度选择及完整可视化**")
@@ -5,11 +5,22 @@ import plotly.express as px
 from plotly.subplots import make_subplots
 from pathlib import Path
 
+from aqi import classify
+from dataset import open_shared
+from downsample import box_outliers, box_stats, downsample, target_points
+
+POLLUTANTS = ['CO(GT)', 'NO2(GT)', 'C6H6(GT)', 'NMHC(GT)']
+# 仪表盘宽度（像素），两列子图各占一半，用来决定折线保留的点数
+FIG_WIDTH = 1200
+PANEL_WIDTH = FIG_WIDTH // 2
+# 本页按原始浓度分级的界限
+LEVEL_EDGES = [1, 2, 10]
+
 # 页面配置
 st.set_page_config(page_title="Air Quality Dashboard", layout="wide")
 
 # ==== 数据加载 & 预处理 ====
-@st.cache_data(ttl=3600)
+@st.cache_resource
 def load_data():
     # 自动定位项目根目录
     app_dir = Path(__file__).resolve().parent
@@ -20,10 +31,35 @@ def load_data():
         st.error(f"数据文件未找到：{data_path}")
         return pd.DataFrame()
 
-    df = pd.read_csv(data_path, parse_dates=['Datetime'])
-    df = df.set_index('Datetime').sort_index()
+    # 只映射本页用到的列，Datetime 直接作为索引，所有会话共用
+    df = open_shared(str(data_path), columns=['Station'] + POLLUTANTS, index='Datetime')
+    if not df.index.is_monotonic_increasing:
+        df = df.sort_index()
     return df
 
+def add_box(fig, values, groups, row, col, label='Boxplot'):
+    """箱线图统计量在服务端算好，只把须以外最极端的点画成散点，不再发送全部原始值"""
+    stats = box_stats(values, groups)
+    if stats.empty:
+        return
+    names = [label] if groups is None else [str(g) for g in stats.index]
+    fig.add_trace(
+        go.Box(
+            x=names, q1=stats['q1'], median=stats['median'], q3=stats['q3'],
+            lowerfence=stats['lowerfence'], upperfence=stats['upperfence'],
+            mean=stats['mean'], boxpoints=False, name=label
+        ),
+        row=row, col=col
+    )
+    outliers = box_outliers(values, groups, stats)
+    if not outliers.empty:
+        x = [label] * len(outliers) if groups is None else outliers['group'].astype(str)
+        fig.add_trace(
+            go.Scatter(x=x, y=outliers['value'], mode='markers',
+                       marker={'size': 4, 'color': '#EE6666'}, name='Outliers'),
+            row=row, col=col
+        )
+
 # 主程序
 if __name__ == "__main__":
     df = load_data()
@@ -68,19 +104,9 @@ if __name__ == "__main__":
         'Value': hourly_series.values
     })
 
-    # AQI 分级
-    def classify_aqi(val):
-        if pd.isna(val):
-            return 'Unknown'
-        if val <= 1:
-            return 'Good'
-        if val <= 2:
-            return 'Moderate'
-        if val <= 10:
-            return 'Unhealthy'
-        return 'Hazardous'
-
-    df['AQI_Level'] = df[pollutant].apply(classify_aqi)
+    # AQI 分级：整列一次分级
+    df['AQI_Level'] = classify(df[pollutant], edges=LEVEL_EDGES,
+                               labels=['Good', 'Moderate', 'Unhealthy', 'Hazardous'], missing='Unknown')
 
     # 视图切换
     view = st.sidebar.radio(
@@ -112,10 +138,7 @@ if __name__ == "__main__":
         fig.update_yaxes(title_text=display_name, row=1, col=2)
 
         # 箱线图
-        fig.add_trace(
-            go.Box(y=df[pollutant].dropna(), name='Boxplot'),
-            row=2, col=1
-        )
+        add_box(fig, df[pollutant], None, row=2, col=1)
         fig.update_xaxes(title_text='', row=2, col=1)
         fig.update_yaxes(title_text=display_name, row=2, col=1)
 
@@ -134,9 +157,11 @@ if __name__ == "__main__":
         fig.update_xaxes(title_text='Pollutant', row=2, col=2)
         fig.update_yaxes(title_text='Pollutant', row=2, col=2)
 
-        # 7 天滑动平均
+        # 7 天滑动平均：按子图宽度用 LTTB 降采样，日期范围越小保留的细节越多
+        ma_x, ma_y = downsample(df.index.to_numpy(), df['rolling_avg'].to_numpy(),
+                                target_points(PANEL_WIDTH))
         fig.add_trace(
-            go.Scatter(x=df.index, y=df['rolling_avg'], name='7-day MA'),
+            go.Scatter(x=ma_x, y=ma_y, name='7-day MA'),
             row=3, col=1
         )
         fig.update_xaxes(title_text='Datetime', row=3, col=1)
@@ -144,16 +169,12 @@ if __name__ == "__main__":
 
         # 按站点箱线图
         if 'Station' in df.columns:
-            for station in df['Station'].unique():
-                fig.add_trace(
-                    go.Box(y=df[df['Station'] == station][pollutant], name=str(station)),
-                    row=3, col=2
-                )
+            add_box(fig, df[pollutant], df['Station'], row=3, col=2, label='Station')
         fig.update_xaxes(title_text='Station', row=3, col=2)
         fig.update_yaxes(title_text=display_name, row=3, col=2)
 
         fig.update_layout(
-            height=900, width=1200,
+            height=900, width=FIG_WIDTH,
             title_text=f"{display_name} Analysis Summary",
             showlegend=False
         )
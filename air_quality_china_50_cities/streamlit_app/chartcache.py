@@ -0,0 +1,139 @@
+import datetime
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Optional
+
+import numpy as np
+import pandas as pd
+
+# 进程内最多缓存的图表个数，所有会话共用
+CHART_CACHE_SIZE = 128
+
+
+def _normalize(value):
+    # 把筛选参数转换成 repr 稳定的形式：集合排序、时间转 ISO 字符串、numpy 标量转 python 标量
+    if isinstance(value, (set, frozenset)):
+        return tuple(sorted((_normalize(v) for v in value), key=repr))
+    if isinstance(value, (list, tuple)):
+        return tuple(_normalize(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((str(k), _normalize(v)) for k, v in value.items()))
+    if isinstance(value, (pd.Timestamp, datetime.date, datetime.datetime)):
+        return value.isoformat()
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def content_key(*parts) -> str:
+    """
+    由图表名和筛选参数（城市、日期范围、污染物、数据版本等）计算的内容键
+    不对 DataFrame 做哈希：相同参数在同一份数据上一定得到相同的图表
+    """
+    return hashlib.sha1(repr(_normalize(parts)).encode('utf-8')).hexdigest()
+
+
+def render_html(chart) -> str:
+    """pyecharts / plotly / folium 图表的 HTML"""
+    if hasattr(chart, 'render_embed'):
+        return chart.render_embed()
+    if hasattr(chart, 'to_html'):
+        return chart.to_html(full_html=False, include_plotlyjs='cdn')
+    if hasattr(chart, 'get_root'):
+        return chart.get_root().render()
+    raise TypeError(f'无法渲染 {type(chart).__name__}')
+
+
+class CachedChart:
+    """
+    缓存的图表对象；HTML 和 echarts 配置在第一次用到时才生成，之后直接复用
+    value 可以是任意结果（例如异常点表），只有图表才会用到 html / options
+    """
+
+    def __init__(self, value: Any):
+        self.value = value
+        self._html: Optional[str] = None
+        self._options: Optional[dict] = None
+        self._lock = threading.Lock()
+
+    @property
+    def chart(self):
+        return self.value
+
+    @property
+    def html(self) -> str:
+        with self._lock:
+            if self._html is None:
+                self._html = render_html(self.value)
+            return self._html
+
+    @property
+    def options(self) -> dict:
+        """pyecharts 图表的配置，与 st_pyecharts 内部生成的相同，可以直接传给 st_echarts"""
+        with self._lock:
+            if self._options is None:
+                self._options = json.loads(self.value.dump_options_with_quotes())
+            return self._options
+
+
+class ChartCache:
+    """按内容键缓存图表的 LRU，超过 maxsize 时淘汰最久未使用的"""
+
+    def __init__(self, maxsize: int = CHART_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, name: str, params, build: Callable[[], Any]) -> CachedChart:
+        """返回 (name, params) 对应的图表，没有缓存时调用 build() 生成"""
+        key = content_key(name, params)
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is not None:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+        # 在锁外生成；并发时同一图表可能生成两次，结果相同
+        entry = CachedChart(build())
+        with self._lock:
+            self._items[key] = entry
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'size': len(self._items), 'hits': self.hits, 'misses': self.misses}
+
+
+_cache: Optional[ChartCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_chart_cache() -> ChartCache:
+    """进程内共用的图表缓存"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ChartCache()
+    return _cache
+
+
+def cached_chart(name: str, params, build: Callable[[], Any]) -> CachedChart:
+    """
+    按 (图表名, 筛选参数) 复用图表，例如：
+        c = cached_chart('rank', (cube.key, p), lambda: make_aqi_rank_chart(df, p, cube=cube))
+    params 必须包含决定图表内容的全部参数
+    """
+    return get_chart_cache().get(name, params, build)
@@ -0,0 +1,353 @@
+import hashlib
+import io
+import json
+import os
+import shutil
+import threading
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+# 数据集中的时间、站点和整数列
+DATETIME_COLUMN = 'Datetime'
+DATE_COLUMN = 'Date'
+STATION_COLUMN = 'Station'
+TIME_COLUMN = 'Time'
+INT_COLUMNS = {'Year': np.int16, 'Month': np.int8, 'Day': np.int8, 'Hour': np.int8, 'Weekday': np.int8}
+# 经纬度保留 float64，其余浮点列（污染物、传感器、气象指标）都转为 float32
+FLOAT64_COLUMNS = {'Latitude', 'Longitude'}
+# 缓存格式版本，typed_frame 的输出类型变化时加 1，旧缓存自动失效
+CACHE_VERSION = 2
+
+# 本进程已打开的共享数据集：(列目录, 列, 索引列) -> DataFrame
+_SHARED: Dict[Tuple, pd.DataFrame] = {}
+_SHARED_LOCK = threading.Lock()
+
+
+def _cache_dir(source: str) -> str:
+    return os.path.join(os.path.dirname(os.path.abspath(source)), 'cache')
+
+
+def _meta_path(source: str) -> str:
+    return os.path.join(_cache_dir(source), os.path.basename(source) + '.meta.json')
+
+
+def file_sha1(path: str, block: int = 1 << 20) -> str:
+    """文件内容的 sha1"""
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for data in iter(lambda: f.read(block), b''):
+            h.update(data)
+    return h.hexdigest()
+
+
+def typed_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    把 china_50_cities.csv 读出的原始列转换为紧凑的类型：
+    Datetime -> datetime64，Date -> 当天零点的 datetime64，Station/Time -> category，
+    整数列 -> int8/int16，浮点列 -> float32（经纬度除外）
+    Date 不再用 python date 对象，这样所有列都是定长数组，可以内存映射
+    """
+    out = {}
+    for c in df.columns:
+        s = df[c]
+        if c == DATETIME_COLUMN:
+            s = pd.to_datetime(s, format='%Y-%m-%d %H:%M:%S')
+        elif c == DATE_COLUMN:
+            continue
+        elif c in (STATION_COLUMN, TIME_COLUMN):
+            s = s.astype(str).astype('category')
+        elif c in INT_COLUMNS:
+            s = pd.to_numeric(s, errors='coerce').fillna(0).astype(INT_COLUMNS[c])
+        elif pd.api.types.is_float_dtype(s) and c not in FLOAT64_COLUMNS:
+            s = s.astype(np.float32)
+        out[c] = s
+    typed = pd.DataFrame(out)
+    if DATETIME_COLUMN in typed.columns:
+        # Date 为 Datetime 的日期部分
+        typed.insert(1, DATE_COLUMN, typed[DATETIME_COLUMN].dt.normalize())
+    return typed
+
+
+def _build_cache(source: str, sha1: str) -> str:
+    cache_dir = _cache_dir(source)
+    os.makedirs(cache_dir, exist_ok=True)
+    name = os.path.splitext(os.path.basename(source))[0]
+    cache = os.path.join(cache_dir, f'{name}.{sha1[:12]}.v{CACHE_VERSION}.parquet')
+    if not os.path.exists(cache):
+        df = typed_frame(pd.read_csv(source))
+        tmp = cache + '.tmp'
+        df.to_parquet(tmp, index=False)
+        os.replace(tmp, cache)
+    remove_stale(source, cache)
+    return cache
+
+
+def remove_stale(source: str, cache: str):
+    """删除同一源文件的旧缓存（Parquet 文件，以及由它导出的列目录、汇总目录）"""
+    cache_dir = _cache_dir(source)
+    name = os.path.splitext(os.path.basename(source))[0]
+    stem = os.path.splitext(cache)[0]
+    for f in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, f)
+        if not f.startswith(name + '.') or path.startswith(stem):
+            continue
+        if f.endswith('.parquet'):
+            os.remove(path)
+        elif f.endswith(('.cols', '.rollup')) and os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def _write_meta(source: str, sha1: str, cache: str):
+    st = os.stat(source)
+    meta = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'sha1': sha1,
+            'version': CACHE_VERSION, 'cache': cache}
+    meta_path = _meta_path(source)
+    os.makedirs(os.path.dirname(meta_path), exist_ok=True)
+    with open(meta_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False)
+
+
+def ensure_cache(source: str) -> str:
+    """
+    返回源 CSV 对应的 Parquet 缓存路径，必要时重建
+    大小和修改时间都没变时直接使用缓存；否则重新计算内容哈希，哈希变了才重建
+    """
+    st = os.stat(source)
+    meta_path = _meta_path(source)
+    try:
+        with open(meta_path, encoding='utf-8') as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        meta = {}
+    cache = meta.get('cache')
+    if (cache and os.path.exists(cache) and meta.get('version') == CACHE_VERSION
+            and meta.get('size') == st.st_size and meta.get('mtime_ns') == st.st_mtime_ns):
+        return cache
+
+    sha1 = file_sha1(source)
+    if not (cache and os.path.exists(cache) and meta.get('sha1') == sha1
+            and meta.get('version') == CACHE_VERSION):
+        cache = _build_cache(source, sha1)
+    _write_meta(source, sha1, cache)
+    return cache
+
+
+def _concat_typed(old: pd.DataFrame, new: pd.DataFrame) -> pd.DataFrame:
+    # category 列取类别并集（按字典序，与整表 astype('category') 相同），其余列直接拼接
+    out = {}
+    for c in old.columns:
+        a, b = old[c], new[c]
+        if isinstance(a.dtype, pd.CategoricalDtype):
+            u = union_categoricals([a.array, b.array], sort_categories=True)
+            out[c] = pd.Series(u, name=c)
+        else:
+            out[c] = pd.concat([a, b.astype(a.dtype)], ignore_index=True)
+    return pd.DataFrame(out)
+
+
+def append_cache(source: str, appended: bytes) -> Tuple[Optional[str], str, Optional[pd.DataFrame]]:
+    """
+    源 CSV 末尾刚追加了 appended（CSV 文本，不含表头）之后调用：
+    只解析追加的部分，与旧缓存拼接后写出新缓存，不重新解析整个 CSV
+    新版本号由旧哈希和追加内容的哈希链式计算，不重新读取整个文件
+    返回 (旧缓存, 新缓存, 追加的类型化行)；旧缓存不存在或与追加前的文件不一致时整表重建，
+    此时旧缓存和追加的行为 None
+    旧缓存及其列目录、汇总目录在调用方更新完下游数据后用 remove_stale 删除
+    """
+    st = os.stat(source)
+    try:
+        with open(_meta_path(source), encoding='utf-8') as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        meta = {}
+    old = meta.get('cache')
+    if not (old and os.path.exists(old) and meta.get('version') == CACHE_VERSION
+            and meta.get('size') == st.st_size - len(appended)):
+        return None, ensure_cache(source), None
+
+    sha1 = hashlib.sha1((meta['sha1'] + hashlib.sha1(appended).hexdigest()).encode('ascii')).hexdigest()
+    with open(source, 'rb') as f:
+        header = f.readline()
+    new_rows = typed_frame(pd.read_csv(io.BytesIO(header + appended)))
+    name = os.path.splitext(os.path.basename(source))[0]
+    cache = os.path.join(_cache_dir(source), f'{name}.{sha1[:12]}.v{CACHE_VERSION}.parquet')
+    df = _concat_typed(pd.read_parquet(old), new_rows)
+    tmp = cache + '.tmp'
+    df.to_parquet(tmp, index=False)
+    os.replace(tmp, cache)
+    _write_meta(source, sha1, cache)
+    return old, cache, new_rows
+
+
+def load_dataset(source: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    读取空气质量数据集，只读取 columns 中的列（None 表示全部）
+    优先从类型化的 Parquet 缓存读取；没有安装 pyarrow 时退回到直接解析 CSV
+    """
+    try:
+        cache = ensure_cache(source)
+    except ImportError:
+        df = typed_frame(pd.read_csv(source))
+        return df if columns is None else df[columns]
+    return pd.read_parquet(cache, columns=columns)
+
+
+def shared_dir(cache: str) -> str:
+    """Parquet 缓存对应的列目录：每列一个 .npy 文件，外加 schema.json"""
+    return os.path.splitext(cache)[0] + '.cols'
+
+
+def export_shared(source: str) -> str:
+    """
+    把类型化缓存按列导出为未压缩的 .npy 文件，返回列目录
+    category 列保存编码数组，类别写在 schema.json 里
+    """
+    cache = ensure_cache(source)
+    out = shared_dir(cache)
+    if os.path.exists(os.path.join(out, 'schema.json')):
+        return out
+
+    df = pd.read_parquet(cache)
+    tmp = out + '.tmp'
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    schema = []
+    for i, c in enumerate(df.columns):
+        s = df[c]
+        entry = {'name': c, 'file': f'{i}.npy'}
+        if isinstance(s.dtype, pd.CategoricalDtype):
+            entry['kind'] = 'category'
+            entry['categories'] = [str(v) for v in s.cat.categories]
+            arr = s.cat.codes.to_numpy()
+        elif pd.api.types.is_datetime64_any_dtype(s):
+            entry['kind'] = 'datetime'
+            arr = s.to_numpy()
+        else:
+            entry['kind'] = 'numeric'
+            arr = s.to_numpy()
+        np.save(os.path.join(tmp, entry['file']), arr)
+        schema.append(entry)
+    with open(os.path.join(tmp, 'schema.json'), 'w', encoding='utf-8') as f:
+        json.dump({'rows': len(df), 'columns': schema}, f, ensure_ascii=False)
+    # 其他进程可能同时导出，先到先得
+    try:
+        os.replace(tmp, out)
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return out
+
+
+def _mapped_column(path: str, entry: dict):
+    # 只读映射的 ndarray 视图，不复制数据
+    arr = np.asarray(np.load(os.path.join(path, entry['file']), mmap_mode='r'))
+    if entry['kind'] == 'category':
+        dtype = pd.CategoricalDtype(entry['categories'])
+        return pd.Categorical.from_codes(arr, dtype=dtype, validate=False)
+    if entry['kind'] == 'datetime':
+        return pd.DatetimeIndex(arr, copy=False)
+    return arr
+
+
+def open_shared(source: str, columns: Optional[List[str]] = None,
+                index: Optional[str] = None) -> pd.DataFrame:
+    """
+    以内存映射方式打开数据集，列数据直接引用 .npy 文件的只读映射，不复制
+    同一进程内相同参数只打开一次；多个进程映射同一批文件，共用操作系统的页缓存
+    index 不为空时用该列作为索引（例如 Datetime）
+
+    返回的 DataFrame 由所有调用方共享，只能读：新增或替换列可以，
+    原地修改已有列的值会因为映射只读而报错
+    """
+    path = export_shared(source)
+    key = (path, tuple(columns) if columns is not None else None, index)
+    with _SHARED_LOCK:
+        df = _SHARED.get(key)
+        if df is not None:
+            return df
+        with open(os.path.join(path, 'schema.json'), encoding='utf-8') as f:
+            schema = json.load(f)
+        entries = {e['name']: e for e in schema['columns']}
+        names = [c for c in (columns if columns is not None else entries) if c != index]
+        idx = None
+        if index is not None:
+            idx = pd.Index(_mapped_column(path, entries[index]), name=index, copy=False)
+        data = {c: pd.Series(_mapped_column(path, entries[c]), index=idx, name=c, copy=False)
+                for c in names}
+        df = pd.DataFrame(data, copy=False)
+        _SHARED[key] = df
+        return df
+
+
+class DataIndex:
+    """
+    按站点和时间预先建好的行索引，加载数据后建一次
+    筛选 (城市, 日期范围) 时对每个站点做二分查找，不再扫描整表：
+    选中全部站点时直接返回按时间排序的连续切片（不复制），
+    否则只取出命中的行，耗时与结果行数成正比，与总行数无关
+    """
+
+    def __init__(self, df: pd.DataFrame, station: str = STATION_COLUMN,
+                 time: str = DATETIME_COLUMN):
+        self.frame = df
+        times = df[time].to_numpy()
+        # open_shared 的数据已按时间排序，此时不需要额外的行号映射
+        self.time_sorted = bool(df[time].is_monotonic_increasing)
+        order = None if self.time_sorted else np.argsort(times, kind='stable')
+        self.order = order
+        self.times = times if order is None else times[order]
+
+        s = df[station]
+        if isinstance(s.dtype, pd.CategoricalDtype):
+            codes, stations = s.cat.codes.to_numpy(), list(s.cat.categories)
+        else:
+            codes, stations = pd.factorize(s)
+            stations = list(stations)
+        self.stations = stations
+        self.codes = {name: i for i, name in enumerate(stations)}
+
+        # 每个站点的行号按时间排列，站点之间首尾相接；offsets[c]:offsets[c+1] 为站点 c 的范围
+        codes = np.asarray(codes) if order is None else np.asarray(codes)[order]
+        by_station = np.argsort(codes, kind='stable')
+        missing = int((codes < 0).sum())
+        counts = np.bincount(codes[codes >= 0], minlength=len(stations))
+        self.offsets = missing + np.concatenate([[0], np.cumsum(counts)])
+        self.station_times = self.times[by_station]
+        # 统一记录原始行号
+        self.rows = by_station if order is None else order[by_station]
+        # 数据中出现过的日期（升序），供日期滑块使用
+        days = self.times[~np.isnat(self.times)].astype('datetime64[D]')
+        self.days = pd.DatetimeIndex(np.unique(days).astype(self.times.dtype))
+
+    def _bounds(self, start_date, end_date):
+        # 与 Date.between(start, end) 一致：[start 当天零点, end 次日零点)
+        lo = pd.Timestamp(start_date).normalize()
+        hi = pd.Timestamp(end_date).normalize() + pd.Timedelta(days=1)
+        return np.array([lo.to_datetime64(), hi.to_datetime64()]).astype(self.times.dtype)
+
+    def positions(self, cities, start_date, end_date) -> Union[slice, np.ndarray]:
+        """命中行的原始行号（升序）；可以用连续切片表示时返回 slice"""
+        bounds = self._bounds(start_date, end_date)
+        codes = sorted({self.codes[c] for c in cities if c in self.codes})
+        if len(codes) == len(self.stations):
+            lo, hi = np.searchsorted(self.times, bounds)
+            if self.order is None:
+                return slice(int(lo), int(hi))
+            return np.sort(self.order[lo:hi])
+        parts = []
+        for c in codes:
+            a, b = self.offsets[c], self.offsets[c + 1]
+            lo, hi = a + np.searchsorted(self.station_times[a:b], bounds)
+            parts.append(self.rows[lo:hi])
+        if not parts:
+            return slice(0, 0)
+        return np.sort(np.concatenate(parts))
+
+    def filter(self, cities, start_date, end_date) -> pd.DataFrame:
+        """与 viz.filter_data 结果相同（行和顺序一致），返回的切片与原数据共享内存"""
+        pos = self.positions(cities, start_date, end_date)
+        if isinstance(pos, slice):
+            return self.frame.iloc[pos]
+        return self.frame.take(pos)
@@ -0,0 +1,164 @@
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+# 每个像素最多保留的点数，以及默认的图表宽度（像素）
+POINTS_PER_PIXEL = 2
+DEFAULT_WIDTH = 1200
+# 少于这个点数时不降采样
+MIN_POINTS = 100
+
+
+def target_points(width_px: Optional[int] = None, points_per_px: int = POINTS_PER_PIXEL) -> int:
+    """按图表宽度决定保留的点数：超过每像素 2 个点浏览器也画不出差别"""
+    return max(MIN_POINTS, int((width_px or DEFAULT_WIDTH) * points_per_px))
+
+
+def _as_float(x) -> np.ndarray:
+    arr = np.asarray(x)
+    if np.issubdtype(arr.dtype, np.datetime64):
+        return arr.astype('datetime64[ns]').astype(np.int64).astype(np.float64)
+    return arr.astype(np.float64)
+
+
+def lttb_indices(x, y, n_out: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets 降采样，返回保留点的下标（升序）
+    首尾两点保留；中间分成 n_out - 2 个桶，每个桶取与上一个选中点、下一个桶均值
+    构成三角形面积最大的点，折线形状和峰值都能保留。y 中不能有 NaN
+    """
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = _as_float(x)
+    y = np.asarray(y, dtype=np.float64)
+    every = (n - 2) / (n_out - 2)
+    edges = (np.floor(np.arange(n_out - 1) * every) + 1).astype(np.int64)
+    edges[-1] = n - 1
+    out = np.empty(n_out, dtype=np.int64)
+    out[0], out[-1] = 0, n - 1
+    a = 0
+    # 每个桶的选择依赖上一个桶的结果，只能逐桶进行；桶内是整段数组运算
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        nlo, nhi = hi, (edges[i + 2] if i + 2 < len(edges) else n)
+        avg_x, avg_y = x[nlo:nhi].mean(), y[nlo:nhi].mean()
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(np.argmax(area))
+        out[i + 1] = a
+    return out
+
+
+def minmax_indices(y, n_buckets: int) -> np.ndarray:
+    """
+    把序列等分成 n_buckets 个桶，每个桶保留最小值和最大值所在的点（升序下标）
+    完全向量化，适合保证尖峰和异常值一定出现在图上；NaN 不会被选中
+    """
+    y = np.asarray(y, dtype=np.float64)
+    n = len(y)
+    if n == 0 or 2 * n_buckets + 2 >= n:
+        return np.flatnonzero(~np.isnan(y))
+    edges = np.linspace(0, n, n_buckets + 1).astype(np.int64)
+    bucket = np.repeat(np.arange(n_buckets), np.diff(edges))
+    nan = np.isnan(y)
+    lo_y = np.where(nan, np.inf, y)
+    hi_y = np.where(nan, -np.inf, y)
+    mins = np.minimum.reduceat(lo_y, edges[:-1])
+    maxs = np.maximum.reduceat(hi_y, edges[:-1])
+    # 每个桶第一个等于最小值 / 最大值的位置
+    _, first_min = np.unique(bucket[lo_y == mins[bucket]], return_index=True)
+    _, first_max = np.unique(bucket[hi_y == maxs[bucket]], return_index=True)
+    idx = np.concatenate([np.flatnonzero(lo_y == mins[bucket])[first_min],
+                          np.flatnonzero(hi_y == maxs[bucket])[first_max],
+                          [0, n - 1]])
+    idx = np.unique(idx)
+    return idx[~nan[idx]]
+
+
+def window(x, x_range: Optional[Tuple] = None) -> slice:
+    """x 升序时，x_range（缩放范围）内的下标切片，两端各多留一个点保证线连到边界"""
+    if x_range is None:
+        return slice(0, len(x))
+    x = np.asarray(x)
+    lo, hi = (np.asarray(v, dtype=x.dtype) if v is not None else None for v in x_range)
+    a = 0 if lo is None else max(int(np.searchsorted(x, lo, side='left')) - 1, 0)
+    b = len(x) if hi is None else min(int(np.searchsorted(x, hi, side='right')) + 1, len(x))
+    return slice(a, b)
+
+
+def downsample(x, y, n_out: Optional[int] = None, method: str = 'lttb',
+               x_range: Optional[Tuple] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    折线图降采样，返回 (x, y)
+    n_out: 保留的点数，默认按 DEFAULT_WIDTH 计算；x_range: 当前缩放范围，只保留范围内的点
+    method: 'lttb' 保持形状，'minmax' 保证每个区间的极值都保留
+    """
+    x, y = np.asarray(x), np.asarray(y, dtype=np.float64)
+    sl = window(x, x_range)
+    x, y = x[sl], y[sl]
+    keep = ~np.isnan(y)
+    x, y = x[keep], y[keep]
+    n_out = n_out or target_points()
+    if len(y) <= n_out:
+        return x, y
+    if method == 'minmax':
+        idx = minmax_indices(y, max(n_out // 2, 1))
+    else:
+        idx = lttb_indices(x, y, n_out)
+    return x[idx], y[idx]
+
+
+def downsample_frame(df: pd.DataFrame, columns: Sequence[str], n_out: int) -> pd.DataFrame:
+    """
+    共用一个 x 轴的多条曲线：每列各取 min/max 点后取并集，保证所有曲线的峰值都在
+    返回的行数不超过约 n_out
+    """
+    if len(df) <= n_out or not columns:
+        return df
+    buckets = max(n_out // (2 * len(columns)), 1)
+    idx = np.unique(np.concatenate([minmax_indices(df[c].to_numpy(dtype=np.float64), buckets)
+                                    for c in columns]))
+    return df.iloc[idx]
+
+
+def box_stats(values: pd.Series, groups: Optional[pd.Series] = None) -> pd.DataFrame:
+    """
+    在服务端算好箱线图的统计量（q1/median/q3/上下须/均值），plotly 只需要每组 6 个数，
+    不再把全部原始值发送到浏览器。须按 1.5 倍 IQR 以内的最小、最大实际值计算
+    """
+    s = pd.Series(np.asarray(values, dtype=np.float64), name='value')
+    if groups is None:
+        g = pd.Series(np.zeros(len(s), dtype=np.int8), name='group')
+    else:
+        g = pd.Series(np.asarray(groups), name='group')
+    frame = pd.DataFrame({'group': g, 'value': s}).dropna(subset=['value'])
+    if frame.empty:
+        return pd.DataFrame(columns=['q1', 'median', 'q3', 'lowerfence', 'upperfence', 'mean'])
+    grouped = frame.groupby('group', observed=True, sort=False)['value']
+    q = grouped.quantile([0.25, 0.5, 0.75]).unstack()
+    q.columns = ['q1', 'median', 'q3']
+    lim = frame.join(q, on='group')
+    spread = 1.5 * (lim['q3'] - lim['q1'])
+    value = lim['value']
+    q['lowerfence'] = value[value >= lim['q1'] - spread].groupby(lim['group'], observed=True).min()
+    q['upperfence'] = value[value <= lim['q3'] + spread].groupby(lim['group'], observed=True).max()
+    q['mean'] = grouped.mean()
+    return q
+
+
+def box_outliers(values: pd.Series, groups: Optional[pd.Series], stats: pd.DataFrame,
+                 limit: int = 50) -> pd.DataFrame:
+    """
+    须以外的点，每组只保留离中位数最远的 limit 个，配合 box_stats 画出异常值
+    返回 group / value 两列
+    """
+    frame = pd.DataFrame({
+        'group': np.zeros(len(values), dtype=np.int8) if groups is None else np.asarray(groups),
+        'value': np.asarray(values, dtype=np.float64),
+    }).dropna(subset=['value'])
+    lim = frame.join(stats[['median', 'lowerfence', 'upperfence']], on='group')
+    out = lim[(lim['value'] < lim['lowerfence']) | (lim['value'] > lim['upperfence'])]
+    dist = (out['value'] - out['median']).abs()
+    top = out.assign(dist=dist).sort_values('dist', ascending=False)
+    return top.groupby('group', observed=True, sort=False).head(limit)[['group', 'value']]
@@ -0,0 +1,121 @@
+import io
+import threading
+from collections import OrderedDict
+from typing import Callable, Iterator, Optional, Union
+
+import pandas as pd
+import streamlit as st
+
+from chartcache import content_key
+
+# 导出文件缓存的总字节数上限，所有会话共用
+EXPORT_CACHE_BYTES = 64 << 20
+# 导出 CSV 时每次转换的行数
+CSV_CHUNK_ROWS = 50000
+
+
+def _version(v: str) -> tuple:
+    return tuple(int(x) for x in v.split('.')[:2] if x.isdigit())
+
+
+# st.download_button 从 1.52 起接受函数作为 data，点击时才在后台线程中生成内容
+DEFERRED_DOWNLOAD = _version(st.__version__) >= (1, 52)
+
+
+class ExportCache:
+    """按内容键缓存导出文件的 LRU，按字节数限制大小"""
+
+    def __init__(self, max_bytes: int = EXPORT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def peek(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            data = self._items.get(key)
+            if data is not None:
+                self._items.move_to_end(key)
+            return data
+
+    def get(self, key: str, build: Callable[[], Union[str, bytes]]) -> bytes:
+        data = self.peek(key)
+        if data is not None:
+            return data
+        data = build()
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        with self._lock:
+            if key not in self._items and len(data) <= self.max_bytes:
+                self._items[key] = data
+                self._size += len(data)
+                while self._size > self.max_bytes:
+                    _, old = self._items.popitem(last=False)
+                    self._size -= len(old)
+        return data
+
+
+_cache: Optional[ExportCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_export_cache() -> ExportCache:
+    """进程内共用的导出缓存"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ExportCache()
+    return _cache
+
+
+def iter_csv(df: pd.DataFrame, chunk_rows: int = CSV_CHUNK_ROWS, index: bool = False) -> Iterator[bytes]:
+    """分块把 DataFrame 转成 CSV，每次只转换 chunk_rows 行，不生成整个表的字符串"""
+    yield df.iloc[:0].to_csv(index=index).encode('utf-8')
+    for start in range(0, len(df), chunk_rows):
+        yield df.iloc[start:start + chunk_rows].to_csv(index=index, header=False).encode('utf-8')
+
+
+def csv_bytes(df: pd.DataFrame, chunk_rows: int = CSV_CHUNK_ROWS, index: bool = False) -> bytes:
+    """
+    与 df.to_csv(index=index).encode() 相同，分块转换后依次写入同一个缓冲区，
+    不生成整个表的 CSV 字符串及其编码副本
+    st.download_button 只接受完整的内容，不能边生成边发送，结果仍是一个完整的 bytes
+    """
+    buf = io.BytesIO()
+    for chunk in iter_csv(df, chunk_rows, index):
+        buf.write(chunk)
+    return buf.getvalue()
+
+
+def _mark_ready(flag: str):
+    st.session_state[flag] = True
+
+
+def export_button(label: str, build: Callable[[], Union[str, bytes]], file_name: str,
+                  mime: Optional[str] = None, params=None, cache: bool = True):
+    """
+    按需生成的下载按钮
+    build() 只在用户需要下载时调用，不再在每次重新运行时序列化。
+    params 为决定内容的全部筛选参数；cache=True 时结果按 (file_name, params) 缓存，
+    build 自己已有缓存（例如 CachedChart.html）时传 cache=False。
+    旧版本 streamlit 不支持延迟生成，先显示“准备”按钮，点击后才生成并显示下载按钮
+    """
+    key = content_key('export', file_name, params)
+
+    def produce() -> bytes:
+        if not cache:
+            data = build()
+            return data.encode('utf-8') if isinstance(data, str) else data
+        return get_export_cache().get(key, build)
+
+    if DEFERRED_DOWNLOAD:
+        return st.download_button(label, produce, file_name, mime, on_click='ignore')
+
+    # 按钮的值只在点击后的那次运行中为 True，“已准备”另存在会话状态中，由点击回调设置
+    flag = 'export-ready:' + key + ':done'
+    ready = st.session_state.get(flag) or (cache and get_export_cache().peek(key) is not None)
+    if not ready:
+        st.button(f'准备{label}', key='export-ready:' + key, on_click=_mark_ready, args=(flag,))
+        return False
+    return st.download_button(label, produce(), file_name, mime)
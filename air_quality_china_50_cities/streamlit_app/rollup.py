@@ -0,0 +1,353 @@
+import os
+import shutil
+import threading
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from dataset import DATETIME_COLUMN, STATION_COLUMN, ensure_cache, load_dataset
+
+# 预聚合的污染物列
+ROLLUP_COLUMNS = ['CO(GT)', 'NMHC(GT)', 'C6H6(GT)', 'NOx(GT)', 'NO2(GT)']
+# 时间粒度：小时、天、月（numpy datetime64 的单位）
+GRAINS = ('h', 'D', 'M')
+# 分位数草图只保存天和月粒度；小时粒度每个单元只有一个读数，min/max 就是精确值
+SKETCH_GRAINS = ('D', 'M')
+# 草图为对数刻度的固定分桶直方图，可以直接相加合并：
+# 第 0 桶放 <= SKETCH_MIN 的值（包括 0 和负数），1..SKETCH_BINS 均分 [SKETCH_MIN, SKETCH_MAX] 的对数区间，
+# 超过 SKETCH_MAX 的值计入最后一桶；取桶中点时相对误差约 6%
+SKETCH_MIN, SKETCH_MAX, SKETCH_BINS = 1e-3, 1e4, 128
+_LOG_MIN = np.log10(SKETCH_MIN)
+_LOG_WIDTH = (np.log10(SKETCH_MAX) - _LOG_MIN) / SKETCH_BINS
+
+# 站点坐标列
+COORD_COLUMNS = ['Latitude', 'Longitude']
+PERIOD_COLUMN = 'Period'
+POLLUTANT_COLUMN = 'Pollutant'
+KEYS = [PERIOD_COLUMN, STATION_COLUMN, POLLUTANT_COLUMN]
+
+# 本进程已加载的汇总：汇总目录 -> Rollup
+_ROLLUPS: Dict[str, 'Rollup'] = {}
+_ROLLUPS_LOCK = threading.Lock()
+
+
+def period_start(times, grain: str) -> np.ndarray:
+    """每个时间所在小时/天/月的起点，保持原来的 datetime64 精度"""
+    arr = np.asarray(times)
+    return arr.astype(f'datetime64[{grain}]').astype(arr.dtype)
+
+
+def sketch_bins(values: np.ndarray) -> np.ndarray:
+    """值 -> 草图桶号"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        b = np.floor((np.log10(values) - _LOG_MIN) / _LOG_WIDTH) + 1
+    b = np.nan_to_num(b, nan=0, neginf=0, posinf=SKETCH_BINS)
+    return np.clip(b, 0, SKETCH_BINS).astype(np.int16)
+
+
+def bin_values(bins: np.ndarray) -> np.ndarray:
+    """桶号 -> 桶的代表值（对数中点）"""
+    bins = np.asarray(bins, dtype=np.float64)
+    return np.where(bins > 0, 10 ** (_LOG_MIN + (bins - 0.5) * _LOG_WIDTH), SKETCH_MIN)
+
+
+def _concat_nonempty(frames: List[pd.DataFrame]) -> pd.DataFrame:
+    """拼接非空的表；全部为空时返回第一个"""
+    nonempty = [f for f in frames if len(f)]
+    return pd.concat(nonempty, ignore_index=True) if nonempty else frames[0].reset_index(drop=True)
+
+
+def _long(parts: List[pd.DataFrame], columns: Sequence[str]) -> pd.DataFrame:
+    # 某个污染物全部缺失时它的部分为空表
+    out = _concat_nonempty(parts)
+    out[POLLUTANT_COLUMN] = pd.Categorical(out[POLLUTANT_COLUMN], categories=list(columns))
+    # 按时间段排序，查询时用二分查找定位时间范围
+    return out.sort_values(PERIOD_COLUMN, kind='stable').reset_index(drop=True)
+
+
+def build_stats(df: pd.DataFrame, grain: str, columns: Sequence[str] = ROLLUP_COLUMNS) -> pd.DataFrame:
+    """
+    按 (时间段, 站点) 汇总每个污染物的 sum/count/min/max
+    长表格式：Period, Station, Pollutant, sum, count, min, max；count 只计非缺失值
+    """
+    period = pd.Series(period_start(df[DATETIME_COLUMN], grain), index=df.index, name=PERIOD_COLUMN)
+    values = df[list(columns)].astype(np.float64)
+    g = values.groupby([period, df[STATION_COLUMN]], observed=True, sort=True).agg(['sum', 'count', 'min', 'max'])
+    parts = []
+    for p in columns:
+        part = g[p].reset_index()
+        part.insert(2, POLLUTANT_COLUMN, p)
+        parts.append(part)
+    out = _long(parts, columns)
+    return out.astype({'count': np.int32})
+
+
+def merge_stats(stats: pd.DataFrame, grain: str) -> pd.DataFrame:
+    """把细粒度的汇总合并到更粗的粒度（例如天 -> 月），与直接从原始数据汇总结果相同"""
+    period = pd.Series(period_start(stats[PERIOD_COLUMN], grain), index=stats.index, name=PERIOD_COLUMN)
+    g = stats.groupby([period, stats[STATION_COLUMN], stats[POLLUTANT_COLUMN]], observed=True, sort=True)
+    out = g.agg({'sum': 'sum', 'count': 'sum', 'min': 'min', 'max': 'max'}).reset_index()
+    return out.sort_values(PERIOD_COLUMN, kind='stable').reset_index(drop=True)
+
+
+def build_sketch(df: pd.DataFrame, grain: str, columns: Sequence[str] = ROLLUP_COLUMNS) -> pd.DataFrame:
+    """
+    按 (时间段, 站点) 统计每个污染物落在各草图桶中的读数个数
+    只保存非零的桶：Period, Station, Pollutant, bin, count
+    """
+    period = period_start(df[DATETIME_COLUMN], grain)
+    stations = df[STATION_COLUMN].array
+    parts = []
+    for p in columns:
+        v = df[p].to_numpy(dtype=np.float64)
+        ok = ~np.isnan(v)
+        frame = pd.DataFrame({PERIOD_COLUMN: period[ok], STATION_COLUMN: stations[ok], 'bin': sketch_bins(v[ok])})
+        part = frame.groupby([PERIOD_COLUMN, STATION_COLUMN, 'bin'], observed=True, sort=True).size()
+        part = part.rename('count').reset_index()
+        part.insert(2, POLLUTANT_COLUMN, p)
+        parts.append(part)
+    out = _long(parts, columns)
+    return out.astype({'count': np.int32})
+
+
+def merge_sketch(sketch: pd.DataFrame, grain: str) -> pd.DataFrame:
+    """把细粒度的草图合并到更粗的粒度，桶计数直接相加"""
+    period = pd.Series(period_start(sketch[PERIOD_COLUMN], grain), index=sketch.index, name=PERIOD_COLUMN)
+    g = sketch.groupby([period, sketch[STATION_COLUMN], sketch[POLLUTANT_COLUMN], sketch['bin']],
+                       observed=True, sort=True)
+    out = g['count'].sum().reset_index()
+    return out.sort_values(PERIOD_COLUMN, kind='stable').reset_index(drop=True)
+
+
+def quantiles_from_counts(bins: np.ndarray, counts: np.ndarray, qs: Sequence[float],
+                          lo: float = -np.inf, hi: float = np.inf) -> List[float]:
+    """由合并后的桶计数估计分位数，结果限制在实际的 [lo, hi] 内"""
+    total = counts.sum()
+    if total == 0:
+        return [np.nan for _ in qs]
+    order = np.argsort(bins)
+    bins, cum = bins[order], np.cumsum(counts[order])
+    idx = np.searchsorted(cum, np.asarray(qs, dtype=np.float64) * total, side='left')
+    vals = bin_values(bins[np.minimum(idx, len(bins) - 1)])
+    return np.clip(vals, lo, hi).tolist()
+
+
+def _categories(s: pd.Series) -> list:
+    return list(s.cat.categories) if isinstance(s.dtype, pd.CategoricalDtype) else list(s.dropna().unique())
+
+
+def _append_table(old: pd.DataFrame, new: pd.DataFrame, grain: str, merge) -> pd.DataFrame:
+    """把新数据的汇总表并入按时间段排序的旧表，重新合并的只有旧表末尾与新数据时间段重叠的部分"""
+    if new.empty:
+        return old
+    periods = old[PERIOD_COLUMN].to_numpy()
+    a = np.searchsorted(periods, new[PERIOD_COLUMN].to_numpy().min().astype(periods.dtype))
+    # 不拼接空表：空表参与 concat 时结果类型随 pandas 版本变化（并产生 FutureWarning）
+    merged = merge(_concat_nonempty([old.iloc[a:], new]), grain)
+    out = _concat_nonempty([old.iloc[:a], merged])
+    # 站点取类别并集（按字典序，与整表构建相同），其余列保持旧表的类型
+    stations = sorted(set(_categories(old[STATION_COLUMN])) | set(_categories(new[STATION_COLUMN])))
+    out[STATION_COLUMN] = out[STATION_COLUMN].astype(pd.CategoricalDtype(stations))
+    return out.astype(old.dtypes.drop(STATION_COLUMN).to_dict())
+
+
+class Rollup:
+    """
+    预聚合的汇总立方体：小时/天/月 × 站点 × 污染物 的 sum/count/min/max，
+    以及天/月粒度的分位数草图。图表通过 view() 按城市和日期范围查询，
+    查询只读汇总表，耗时与原始数据行数无关
+    coords 为各站点的经纬度（索引为 Station）；version 标识数据版本，用作缓存键的一部分
+    """
+
+    def __init__(self, stats: Dict[str, pd.DataFrame], sketches: Dict[str, pd.DataFrame],
+                 coords: pd.DataFrame, version: str = ''):
+        self.stats = stats
+        self.sketches = sketches
+        self.coords = coords
+        self.version = version or f'memory-{id(self):x}'
+
+    @classmethod
+    def build(cls, df: pd.DataFrame, columns: Sequence[str] = ROLLUP_COLUMNS) -> 'Rollup':
+        """从逐小时数据构建；天和月粒度由更细的粒度合并得到"""
+        columns = [c for c in columns if c in df.columns]
+        hourly = build_stats(df, 'h', columns)
+        daily = merge_stats(hourly, 'D')
+        sketch = build_sketch(df, 'D', columns)
+        coords = df.groupby(STATION_COLUMN, observed=True)[COORD_COLUMNS].first()
+        return cls({'h': hourly, 'D': daily, 'M': merge_stats(daily, 'M')},
+                   {'D': sketch, 'M': merge_sketch(sketch, 'M')}, coords)
+
+    def append(self, df: pd.DataFrame) -> 'Rollup':
+        """
+        并入新的逐小时数据，返回新的汇总（不修改自身）
+        只有不早于新数据最早时间段的单元需要重新合并，代价与新数据量成正比
+        """
+        columns = list(self.stats['h'][POLLUTANT_COLUMN].cat.categories)
+        new = Rollup.build(df, columns)
+        stats = {g: _append_table(t, new.stats[g], g, merge_stats) for g, t in self.stats.items()}
+        sketches = {g: _append_table(t, new.sketches[g], g, merge_sketch) for g, t in self.sketches.items()}
+        return Rollup(stats, sketches, self.coords.combine_first(new.coords))
+
+    def save(self, path: str) -> str:
+        """每张表一个 Parquet 文件，先写临时目录再替换"""
+        tmp = path + '.tmp'
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        for g, t in self.stats.items():
+            t.to_parquet(os.path.join(tmp, f'stats_{g}.parquet'), index=False)
+        for g, t in self.sketches.items():
+            t.to_parquet(os.path.join(tmp, f'sketch_{g}.parquet'), index=False)
+        self.coords.to_parquet(os.path.join(tmp, 'stations.parquet'))
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp, path)
+        return path
+
+    @classmethod
+    def load(cls, path: str) -> 'Rollup':
+        """读取保存的汇总；目录名含源文件哈希，用作数据版本"""
+        stats = {g: pd.read_parquet(os.path.join(path, f'stats_{g}.parquet')) for g in GRAINS}
+        sketches = {g: pd.read_parquet(os.path.join(path, f'sketch_{g}.parquet')) for g in SKETCH_GRAINS}
+        return cls(stats, sketches, pd.read_parquet(os.path.join(path, 'stations.parquet')),
+                   os.path.basename(path))
+
+    def view(self, cities=None, start_date=None, end_date=None) -> 'RollupView':
+        """限定城市和日期范围（含两端日期）的查询视图"""
+        lo = pd.Timestamp(start_date).normalize() if start_date is not None else None
+        hi = pd.Timestamp(end_date).normalize() + pd.Timedelta(days=1) if end_date is not None else None
+        return RollupView(self, None if cities is None else set(cities), lo, hi)
+
+
+class RollupView:
+    """Rollup 上的 (城市, [lo, hi)) 查询"""
+
+    def __init__(self, rollup: Rollup, cities: Optional[set], lo: Optional[pd.Timestamp],
+                 hi: Optional[pd.Timestamp]):
+        self.rollup = rollup
+        self.cities = cities
+        self.lo = lo
+        self.hi = hi
+
+    @property
+    def key(self) -> tuple:
+        """(数据版本, 城市, 日期范围)，可直接用作缓存键"""
+        cities = None if self.cities is None else tuple(sorted(self.cities))
+        return (self.rollup.version, cities,
+                None if self.lo is None else self.lo.isoformat(),
+                None if self.hi is None else self.hi.isoformat())
+
+    def restrict(self, start_date, end_date) -> 'RollupView':
+        """与另一个日期范围取交集"""
+        lo = pd.Timestamp(start_date).normalize()
+        hi = pd.Timestamp(end_date).normalize() + pd.Timedelta(days=1)
+        lo = lo if self.lo is None else max(lo, self.lo)
+        hi = hi if self.hi is None else min(hi, self.hi)
+        return RollupView(self.rollup, self.cities, lo, max(lo, hi))
+
+    def coords(self) -> pd.DataFrame:
+        """所选站点的经纬度"""
+        c = self.rollup.coords
+        return c if self.cities is None else c[c.index.isin(self.cities)]
+
+    def _month_aligned(self) -> bool:
+        return all(t is None or (t.day == 1 and t == t.normalize()) for t in (self.lo, self.hi))
+
+    def _slice(self, table: pd.DataFrame, pollutants: Optional[Sequence[str]]) -> pd.DataFrame:
+        periods = table[PERIOD_COLUMN].to_numpy()
+        a = 0 if self.lo is None else np.searchsorted(periods, self.lo.to_datetime64().astype(periods.dtype))
+        b = len(periods) if self.hi is None else np.searchsorted(periods, self.hi.to_datetime64().astype(periods.dtype))
+        t = table.iloc[a:b]
+        mask = np.ones(len(t), dtype=bool)
+        if self.cities is not None:
+            mask &= t[STATION_COLUMN].isin(self.cities).to_numpy()
+        if pollutants is not None:
+            mask &= t[POLLUTANT_COLUMN].isin(pollutants).to_numpy()
+        return t[mask]
+
+    def cells(self, grain: str = 'D', pollutants: Optional[Sequence[str]] = None) -> pd.DataFrame:
+        """
+        范围内 grain 粒度的汇总单元
+        日期范围不是整月时，月粒度由天粒度合并得到，保证结果与按原始数据筛选一致
+        """
+        if grain == 'M' and not self._month_aligned():
+            return merge_stats(self._slice(self.rollup.stats['D'], pollutants), 'M')
+        return self._slice(self.rollup.stats[grain], pollutants)
+
+    def means(self, pollutants: Sequence[str], grain: str = 'D') -> pd.DataFrame:
+        """各时间段所选站点的均值（sum / count），索引为 Period，列为污染物"""
+        t = self.cells(grain, pollutants)
+        g = t.groupby([PERIOD_COLUMN, POLLUTANT_COLUMN], observed=True)[['sum', 'count']].sum()
+        mean = (g['sum'] / g['count'].where(g['count'] > 0)).unstack(POLLUTANT_COLUMN)
+        mean = mean.reindex(columns=list(pollutants))
+        mean.columns.name = None
+        return mean
+
+    def station_means(self, pollutants: Sequence[str]) -> pd.DataFrame:
+        """范围内每个站点的均值，索引为 Station，列为污染物"""
+        t = self.cells('M' if self._month_aligned() else 'D', pollutants)
+        g = t.groupby([STATION_COLUMN, POLLUTANT_COLUMN], observed=True)[['sum', 'count']].sum()
+        mean = (g['sum'] / g['count'].where(g['count'] > 0)).unstack(POLLUTANT_COLUMN)
+        mean = mean.reindex(columns=list(pollutants))
+        mean.columns.name = None
+        return mean
+
+    def quantiles(self, pollutant: str, qs: Sequence[float]) -> List[float]:
+        """范围内所选站点读数的近似分位数（由草图合并）"""
+        grain = 'M' if self._month_aligned() else 'D'
+        sk = self._slice(self.rollup.sketches[grain], [pollutant])
+        t = self.cells(grain, [pollutant])
+        lo = t['min'].min() if len(t) else -np.inf
+        hi = t['max'].max() if len(t) else np.inf
+        return quantiles_from_counts(sk['bin'].to_numpy(), sk['count'].to_numpy(), qs, lo, hi)
+
+
+def rollup_dir(cache: str) -> str:
+    """Parquet 缓存对应的汇总目录"""
+    return os.path.splitext(cache)[0] + '.rollup'
+
+
+def ensure_rollup(source: str) -> Rollup:
+    """
+    返回源 CSV 对应的汇总，必要时从类型化缓存构建并保存
+    预处理脚本写出 CSV 后调用一次，应用启动时直接读取；同一进程内只加载一次
+    """
+    try:
+        cache = ensure_cache(source)
+    except ImportError:
+        # 没有 pyarrow 时无法保存，每个进程在内存中构建
+        return Rollup.build(load_dataset(source))
+    path = rollup_dir(cache)
+    with _ROLLUPS_LOCK:
+        rollup = _ROLLUPS.get(path)
+        if rollup is None:
+            try:
+                rollup = Rollup.load(path)
+            except OSError:
+                # 没有汇总，或者是缺少文件的旧版本汇总
+                rollup = Rollup.build(pd.read_parquet(cache))
+                rollup.save(path)
+                rollup.version = os.path.basename(path)
+            _ROLLUPS[path] = rollup
+        return rollup
+
+
+def append_rollup(old_cache: Optional[str], cache: str, rows: Optional[pd.DataFrame]) -> Rollup:
+    """
+    源 CSV 追加数据、dataset.append_cache 更新缓存之后调用：
+    读取旧缓存的汇总，并入追加的行，保存到新缓存对应的目录
+    旧汇总不存在（或 append_cache 已整表重建）时从新缓存整表构建
+    """
+    rollup = None
+    if old_cache is not None and rows is not None:
+        try:
+            rollup = Rollup.load(rollup_dir(old_cache)).append(rows)
+        except OSError:
+            pass
+    if rollup is None:
+        rollup = Rollup.build(pd.read_parquet(cache))
+    path = rollup_dir(cache)
+    rollup.save(path)
+    rollup.version = os.path.basename(path)
+    with _ROLLUPS_LOCK:
+        _ROLLUPS[path] = rollup
+    return rollup
@@ -1,8 +1,12 @@
-from turtle import st
-from typing import Union, List
+import io
+import json
+import threading
+from collections import OrderedDict
+from typing import Union, List, Optional
 
 import pandas as pd
 import numpy as np
+import streamlit as st
 from pyecharts.charts import (
     Line, Bar, HeatMap, Calendar, Surface3D, Timeline
 )
@@ -11,6 +15,9 @@ import folium
 from folium.plugins import TimestampedGeoJson
 import plotly.graph_objects as go
 
+from aqi import BREAKPOINTS_1H, BREAKPOINTS_24H, classify, composite_aqi, level_counts, sub_indices
+from downsample import downsample, downsample_frame
+
 # 配色方案
 PALETTE = ["#5470C6", "#91CC75", "#EE6666", "#73C0DE", "#FAC858", "#3BA272"]
 
@@ -22,6 +29,15 @@ DEFAULT_POLLUTANTS = [
 ]
 DEFAULT_METEO = ['T', 'RH', 'AH', 'W']
 
+# 时空地图：缓存的 GeoJSON 个数，以及点的样式
+GEOJSON_CACHE_SIZE = 32
+TIMELINE_ICON_STYLE = {'fillColor': '#3186cc', 'fillOpacity': 0.7, 'radius': 6}
+# 没有站点时的地图中心
+DEFAULT_CENTER = [35.0, 105.0]
+
+_geojson_cache = OrderedDict()
+_geojson_lock = threading.Lock()
+
 # --- 数据预处理辅助函数 ---
 def ensure_datetime(df: pd.DataFrame) -> pd.DataFrame:
     """
@@ -31,23 +47,26 @@ def ensure_datetime(df: pd.DataFrame) -> pd.DataFrame:
     if 'Datetime' in df.columns:
         df['Datetime'] = pd.to_datetime(df['Datetime'], errors='coerce')
         if 'Date' not in df.columns:
-            df['Date'] = df['Datetime'].dt.date
+            df['Date'] = df['Datetime'].dt.normalize()
     else:
         if 'Date' in df.columns:
-            df['Date'] = pd.to_datetime(df['Date'], errors='coerce').dt.date
+            df['Date'] = pd.to_datetime(df['Date'], errors='coerce').dt.normalize()
             df['Datetime'] = pd.to_datetime(df['Date'])
         else:
             raise ValueError("数据缺少 'Datetime' 或 'Date' 列，无法处理时间。")
     return df
 
-def filter_data(df: pd.DataFrame, cities: list, start_date, end_date) -> pd.DataFrame:
+def filter_data(df: pd.DataFrame, cities: list, start_date, end_date, index=None) -> pd.DataFrame:
     """
     按城市和日期范围筛选数据
+    index 为 dataset.DataIndex 时用二分查找代替全表扫描，结果相同
     """
+    if index is not None:
+        return index.filter(cities, start_date, end_date)
     df = ensure_datetime(df)
     filtered = df[
         df['Station'].isin(cities) &
-        df['Date'].between(pd.to_datetime(start_date).date(), pd.to_datetime(end_date).date())
+        df['Date'].between(pd.Timestamp(start_date), pd.Timestamp(end_date))
     ]
     return filtered
 
@@ -58,13 +77,13 @@ def make_dynamic_line(df: pd.DataFrame, pollutant: str) -> Timeline:
     生成污染物日均动态排名折线图 (Timeline)
     """
     df = ensure_datetime(df)
-    dates = sorted(df['Date'].dropna().unique())
+    dates = pd.to_datetime(sorted(df['Date'].dropna().unique()))
     tl = Timeline(init_opts=opts.InitOpts(width="800px", height="400px"))
     tl.add_schema(play_interval=1000, is_timeline_show=True, pos_bottom="0")
 
     for d in dates:
         sub = df[df['Date'] == d]
-        avg = sub.groupby('Station')[pollutant].mean().reset_index()
+        avg = sub.groupby('Station', observed=True)[pollutant].mean().reset_index()
         avg = avg.dropna(subset=[pollutant])
         if avg.empty:
             continue
@@ -73,30 +92,37 @@ def make_dynamic_line(df: pd.DataFrame, pollutant: str) -> Timeline:
             .add_xaxis(avg['Station'].tolist())
             .add_yaxis(pollutant, avg[pollutant].round(2).tolist(), label_opts=opts.LabelOpts(is_show=False))
             .set_global_opts(
-                title_opts=opts.TitleOpts(title=f"{d} {pollutant} 动态排名"),
+                title_opts=opts.TitleOpts(title=f"{d:%Y-%m-%d} {pollutant} 动态排名"),
                 tooltip_opts=opts.TooltipOpts(trigger="axis"),
                 datazoom_opts=[opts.DataZoomOpts()],
                 visualmap_opts=opts.VisualMapOpts(is_show=False)
             )
             .set_colors(PALETTE)
         )
-        tl.add(line, time_point=str(d))
+        tl.add(line, time_point=d.strftime('%Y-%m-%d'))
     return tl
 
 
-def make_line_trend(df: pd.DataFrame, pollutant: str) -> Line:
+def make_line_trend(df: pd.DataFrame, pollutant: str, cube=None, max_points: Optional[int] = None) -> Line:
     """
     生成污染物日均趋势折线图
+    cube 为 rollup.RollupView 时直接读取预聚合的日均值
+    max_points 不为空时用 LTTB 降采样到最多 max_points 个点（见 downsample.target_points）
     """
+    if cube is not None:
+        df = get_daily_mean(df, pollutant, cube=cube)
     df = ensure_datetime(df)
     df[pollutant] = pd.to_numeric(df[pollutant], errors='coerce')
     daily = df.groupby('Date')[pollutant].mean().reset_index()
     daily = daily.dropna(subset=[pollutant])
     if daily.empty:
         daily = pd.DataFrame({'Date': [], pollutant: []})
+    elif max_points and len(daily) > max_points:
+        x, y = downsample(daily['Date'].to_numpy(), daily[pollutant].to_numpy(), max_points)
+        daily = pd.DataFrame({'Date': x, pollutant: y})
     line = (
         Line()
-        .add_xaxis(daily['Date'].astype(str).tolist())
+        .add_xaxis(pd.to_datetime(daily['Date']).dt.strftime('%Y-%m-%d').tolist())
         .add_yaxis(pollutant, daily[pollutant].fillna(0).tolist(), is_smooth=True)
         .set_global_opts(
             title_opts=opts.TitleOpts(title=f"{pollutant} 日均趋势"),
@@ -109,17 +135,26 @@ def make_line_trend(df: pd.DataFrame, pollutant: str) -> Line:
     )
     return line
 
-def make_multi_pollutant_trend(df: pd.DataFrame, pollutants: list) -> Line:
+def make_multi_pollutant_trend(df: pd.DataFrame, pollutants: list, cube=None,
+                               max_points: Optional[int] = None) -> Line:
     """
     多污染物日均趋势折线图
+    cube 为 rollup.RollupView 时直接读取预聚合的日均值
+    max_points 不为空时按各污染物的最小/最大值降采样，保留每条曲线的峰值
     """
+    if cube is not None:
+        df = get_daily_mean(df, pollutants, cube=cube)
     df['Date'] = pd.to_datetime(df.get('Datetime', df['Date'])).dt.date
     line = Line()
     dates = sorted(df['Date'].unique())
-    line.add_xaxis([str(d) for d in dates])
+    present = [p for p in pollutants if p in df.columns]
+    daily = df.groupby('Date')[present].mean().reindex(dates)
+    if max_points:
+        daily = downsample_frame(daily, present, max_points)
+    line.add_xaxis([str(d) for d in daily.index])
     for pollutant in pollutants:
         if pollutant in df.columns:
-            daily_mean = df.groupby('Date')[pollutant].mean().reindex(dates, fill_value=np.nan).fillna(0)
+            daily_mean = daily[pollutant].fillna(0)
             line.add_yaxis(
                 pollutant,
                 daily_mean.round(2).tolist(),
@@ -137,13 +172,18 @@ def make_multi_pollutant_trend(df: pd.DataFrame, pollutants: list) -> Line:
     return line
 
 
-def make_aqi_rank_chart(df: pd.DataFrame, pollutant: str) -> Bar:
+def make_aqi_rank_chart(df: pd.DataFrame, pollutant: str, cube=None) -> Bar:
     """
     生成污染物平均值排名柱状图
+    cube 为 rollup.RollupView 时直接读取预聚合的站点均值
     """
-    df = df.copy()
-    df[pollutant] = pd.to_numeric(df[pollutant], errors='coerce')
-    avg = df.groupby('Station')[pollutant].mean().sort_values(ascending=False).reset_index()
+    if cube is not None:
+        avg = cube.station_means([pollutant])[pollutant]
+    else:
+        df = df.copy()
+        df[pollutant] = pd.to_numeric(df[pollutant], errors='coerce')
+        avg = df.groupby('Station', observed=True)[pollutant].mean()
+    avg = avg.sort_values(ascending=False).reset_index()
     bar = (
         Bar()
         .add_xaxis(avg['Station'].tolist())
@@ -158,43 +198,20 @@ def make_aqi_rank_chart(df: pd.DataFrame, pollutant: str) -> Bar:
     return bar
 
 
-from collections import Counter
-
 def make_aqi_level_chart(df: pd.DataFrame, pollutants: List[str]) -> Bar:
-    def classify(v):
-        if pd.isna(v): return "缺失"
-        elif v <= 50: return "优"
-        elif v <= 100: return "良"
-        elif v <= 150: return "轻度污染"
-        elif v <= 200: return "中度污染"
-        elif v <= 300: return "重度污染"
-        else: return "严重污染"
-
-    station_levels = {}
-
-    for pollutant in pollutants:
-        if pollutant not in df.columns:
-            continue
-        df.loc[:, pollutant] = pd.to_numeric(df[pollutant], errors='coerce')
-        df = df.copy()
-        df.loc[:, 'AQI级别'] = df[pollutant].apply(classify)
-
-        counts = df.groupby(['Station', 'AQI级别']).size()
-        for (station, level), count in counts.items():
-            if station not in station_levels:
-                station_levels[station] = Counter()
-            station_levels[station][level] += count
-
-    # 所有等级标签（固定顺序）
-    level_order = ["优", "良", "轻度污染", "中度污染", "重度污染", "严重污染", "缺失"]
+    """
+    各站点 AQI 等级分布：每个污染物的分指数分别分级后合并计数
+    所有污染物一次分级、一次计数，不复制数据
+    """
+    iaqi = sub_indices(df, pollutants).to_numpy()
+    stations = np.repeat(df['Station'].to_numpy(), iaqi.shape[1])
+    counts = level_counts(classify(iaqi.ravel()), stations).sort_index()
 
-    stations = list(station_levels.keys())
     bar = Bar()
-    bar.add_xaxis(stations)
+    bar.add_xaxis([str(s) for s in counts.index])
 
-    for level in level_order:
-        y_data = [station_levels[station][level] for station in stations]
-        bar.add_yaxis(level, y_data, stack="stack")
+    for level in counts.columns:
+        bar.add_yaxis(level, counts[level].tolist(), stack="stack")
 
     bar.set_global_opts(
         title_opts=opts.TitleOpts(title="各站点 AQI 等级分布（多污染物合并）"),
@@ -223,7 +240,7 @@ def make_city_bubble_map(df, pollutants, mapbox_token=None):
     """
     df = ensure_datetime(df)
     df2 = df.dropna(subset=['Latitude', 'Longitude'] + pollutants)
-    grouped = df2.groupby('Station')[pollutants + ['Latitude', 'Longitude']].mean().reset_index()
+    grouped = df2.groupby('Station', observed=True)[pollutants + ['Latitude', 'Longitude']].mean().reset_index()
 
     fig = go.Figure()
     buttons = []
@@ -269,6 +286,72 @@ def make_city_bubble_map(df, pollutants, mapbox_token=None):
     )
     return fig
 
+def timeline_geojson(cube, pollutant: str, grain: str = 'D') -> str:
+    """
+    时空地图的 GeoJSON 字符串：每个站点每个时间段（小时/天）一个点，值为该时段的均值
+    数据来自 rollup 汇总而不是逐行数据；要素用整列的字符串运算拼接，不逐行构造 dict
+    按 (污染物, 粒度, 城市, 日期范围) 缓存序列化结果
+    """
+    key = (cube.key, pollutant, grain)
+    with _geojson_lock:
+        if key in _geojson_cache:
+            _geojson_cache.move_to_end(key)
+            return _geojson_cache[key]
+
+    cells = cube.cells(grain, [pollutant])
+    cells = cells[cells['count'] > 0]
+    coords = cube.rollup.coords.reindex(cells['Station'].astype(str))
+    ok = coords.notna().all(axis=1).to_numpy()
+    cells, coords = cells[ok], coords[ok]
+
+    value = (cells['sum'] / cells['count']).to_numpy()
+    times = np.datetime_as_string(cells['Period'].to_numpy().astype('datetime64[s]'))
+    # popup 前缀按站点只转义一次，再按类别编码取出
+    stations = cells['Station'].astype('category')
+    prefixes = np.array([json.dumps(f"{s} {pollutant}: ", ensure_ascii=False)[:-1]
+                         for s in stations.cat.categories] or [''], dtype=object)
+    popup = prefixes[stations.cat.codes.to_numpy()] + np.char.mod('%.2f', value).astype(object)
+    lon = np.char.mod('%.6f', coords['Longitude'].to_numpy()).astype(object)
+    lat = np.char.mod('%.6f', coords['Latitude'].to_numpy()).astype(object)
+    style = json.dumps(TIMELINE_ICON_STYLE)
+    features = ('{"type":"Feature","geometry":{"type":"Point","coordinates":[' + lon + ',' + lat
+                + ']},"properties":{"time":"' + times.astype(object) + '","popup":' + popup
+                + '","icon":"circle","iconstyle":' + style + '}}')
+    geojson = '{"type":"FeatureCollection","features":[' + ','.join(features) + ']}'
+
+    with _geojson_lock:
+        _geojson_cache[key] = geojson
+        while len(_geojson_cache) > GEOJSON_CACHE_SIZE:
+            _geojson_cache.popitem(last=False)
+    return geojson
+
+
+def make_map_timeline(cube, pollutant: str, aggregate: str = 'D', auto_play: bool = False) -> folium.Map:
+    """
+    生成时空动态地图
+    cube: rollup.RollupView，按侧边栏的城市和日期范围筛选
+    aggregate: 'D' 按天，'H' 按小时
+    """
+    hourly = aggregate.upper() == 'H'
+    geojson = timeline_geojson(cube, pollutant, 'h' if hourly else 'D')
+    coords = cube.coords()
+    center = coords[['Latitude', 'Longitude']].mean().tolist() if len(coords) else DEFAULT_CENTER
+    m = folium.Map(location=center, zoom_start=6)
+    # 以文件对象传入：folium 读出字符串原样嵌入页面，不再经过 json.dumps，
+    # 仍视为内嵌数据，st_folium 可以计算范围（直接传 str 会被当作 URL）
+    TimestampedGeoJson(
+        io.StringIO(geojson),
+        period='PT1H' if hourly else 'P1D',
+        add_last_point=True,
+        auto_play=auto_play,
+        loop=False,
+        max_speed=1,
+        loop_button=True,
+        time_slider_drag_update=True
+    ).add_to(m)
+    return m
+
+
 def make_heatmap_corr(df: pd.DataFrame) -> HeatMap:
     """
     生成污染物及气象指标相关性热力图
@@ -291,13 +374,20 @@ def make_heatmap_corr(df: pd.DataFrame) -> HeatMap:
     return heat
 
 
-def make_stacked_bar(df: pd.DataFrame, pollutant: str) -> Bar:
+def make_stacked_bar(df: pd.DataFrame, pollutant: str, cube=None) -> Bar:
     """
     生成污染物月均值堆叠柱状图
+    cube 为 rollup.RollupView 时直接读取预聚合的月均值
     """
-    df[pollutant] = pd.to_numeric(df[pollutant], errors='coerce')
-    df = ensure_datetime(df)
-    monthly = df.set_index('Datetime').resample('ME')[pollutant].mean().fillna(0).reset_index()
+    if cube is not None:
+        means = cube.means([pollutant], 'M')[pollutant]
+        # 与 resample 一致：补齐首尾之间没有数据的月份
+        months = pd.date_range(means.index.min(), means.index.max(), freq='MS') if len(means) else means.index
+        monthly = means.reindex(months).fillna(0).rename_axis('Datetime').reset_index()
+    else:
+        df[pollutant] = pd.to_numeric(df[pollutant], errors='coerce')
+        df = ensure_datetime(df)
+        monthly = df.set_index('Datetime').resample('ME')[pollutant].mean().fillna(0).reset_index()
     bar = (
         Bar()
         .add_xaxis(monthly['Datetime'].dt.strftime('%Y-%m').tolist())
@@ -312,13 +402,12 @@ def make_stacked_bar(df: pd.DataFrame, pollutant: str) -> Bar:
     return bar
 
 
-def make_calendar_plot(df: pd.DataFrame, pollutant: str) -> Calendar:
+def make_calendar_plot(df: pd.DataFrame, pollutant: str, cube=None) -> Calendar:
     """
     生成污染物日历图，优化标签、配色和范围显示
+    cube 为 rollup.RollupView 时直接读取预聚合的日均值
     """
-    df = ensure_datetime(df)
-    df[pollutant] = pd.to_numeric(df[pollutant], errors='coerce')
-    cal_data = df.groupby('Date')[pollutant].mean().reset_index()
+    cal_data = get_daily_mean(df, pollutant, cube=cube)
     data_list = [[d.strftime('%Y-%m-%d'), float(v)] for d, v in zip(cal_data['Date'], cal_data[pollutant])]
     start = cal_data['Date'].min().strftime('%Y-%m-%d')
     end = cal_data['Date'].max().strftime('%Y-%m-%d')
@@ -393,14 +482,28 @@ def iqr_anomaly_detection(df: pd.DataFrame, pollutants: list, multiplier=1.5) ->
         return pd.DataFrame(columns=['Date', 'Value', 'Pollutant'])
 
 
-def get_daily_mean(df: pd.DataFrame, pollutants: Union[str, List[str]]) -> pd.DataFrame:
+def hourly_iqr_bounds(cube, pollutant: str, multiplier=1.5) -> dict:
+    """
+    所选范围内逐小时读数的四分位数和 IQR 上下限
+    cube: rollup.RollupView，四分位数由汇总草图合并估计，不扫描原始数据
+    """
+    q1, q3 = cube.quantiles(pollutant, [0.25, 0.75])
+    iqr = q3 - q1
+    return {'Q1': q1, 'Q3': q3, 'Lower': q1 - multiplier * iqr, 'Upper': q3 + multiplier * iqr}
+
+
+def get_daily_mean(df: pd.DataFrame, pollutants: Union[str, List[str]], cube=None) -> pd.DataFrame:
     """
     获取指定污染物的日均值数据。
     支持单个污染物（返回2列DataFrame）或多个污染物（返回多列）。
+    cube 为 rollup.RollupView 时从预聚合的汇总计算，不再扫描原始数据，df 可以为 None
     """
-    df = ensure_datetime(df)
     if isinstance(pollutants, str):
         pollutants = [pollutants]
+    if cube is not None:
+        return cube.means(pollutants, 'D').rename_axis('Date').reset_index()
+
+    df = ensure_datetime(df)
 
     for pollutant in pollutants:
         df[pollutant] = pd.to_numeric(df[pollutant], errors='coerce')
@@ -408,14 +511,10 @@ def get_daily_mean(df: pd.DataFrame, pollutants: Union[str, List[str]]) -> pd.Da
     daily = df.groupby('Date')[pollutants].mean().reset_index()
     return daily
 
-def calculate_composite_aqi(df: pd.DataFrame, pollutants: list) -> pd.Series:
+def calculate_composite_aqi(df: pd.DataFrame, pollutants: list, daily: bool = False) -> pd.Series:
     """
-    根据多污染物计算综合 AQI（简化示例，实际需要符合国家标准）
-    这里示例用最大值代表综合AQI
+    根据多污染物计算综合 AQI：各污染物按浓度限值插值得到分指数，取最大值（没有限值的污染物不参与）
+    daily=True 时按 24 小时平均浓度限值计算（传入日均值），否则按 1 小时限值
     """
-    df = df.copy()
-    for p in pollutants:
-        df[p] = pd.to_numeric(df[p], errors='coerce').fillna(0)
-    composite = df[pollutants].max(axis=1)
-    return composite
+    return composite_aqi(df, pollutants, BREAKPOINTS_24H if daily else BREAKPOINTS_1H)
 
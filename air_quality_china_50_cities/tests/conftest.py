@@ -0,0 +1,5 @@
+import os
+import sys
+
+# streamlit_app 中的模块互相按文件名导入
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'streamlit_app'))
@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+
+from anomaly import SEASONS, SeasonalIQRDetector
+
+POLLUTANTS = ['CO(GT)', 'NO2(GT)']
+
+
+def history(seed=0):
+    """三个站点各覆盖一年中不同的约 8 天，带缺失值"""
+    rng = np.random.default_rng(seed)
+    parts = []
+    for i, (station, start) in enumerate([('北京', '2004-03-10'), ('上海', '2004-07-01'), ('广州', '2004-12-20')]):
+        times = pd.date_range(start, periods=8 * 24, freq='h')
+        part = pd.DataFrame({
+            'Datetime': times, 'Station': station,
+            'CO(GT)': rng.gamma(2.0, 1.0 + i, len(times)),
+            'NO2(GT)': rng.gamma(4.0, 25.0, len(times)),
+        })
+        part.loc[rng.random(len(times)) < 0.1, 'CO(GT)'] = np.nan
+        parts.append(part)
+    return pd.concat(parts, ignore_index=True)
+
+
+def replay(df):
+    det = SeasonalIQRDetector(POLLUTANTS)
+    for row in df.sort_values('Datetime', kind='stable').itertuples(index=False):
+        det.update(row.Station, row.Datetime, {'CO(GT)': row[2], 'NO2(GT)': row[3]})
+    return det
+
+
+def assert_same(a, b):
+    assert set(a.stations) == set(b.stations)
+    for station in a.stations:
+        ra, rb = a.stations[station], b.stations[station]
+        np.testing.assert_array_equal(a.updated[ra], b.updated[rb])
+        for p in POLLUTANTS:
+            np.testing.assert_allclose(a.counts[p][ra], b.counts[p][rb], rtol=1e-9, atol=1e-12)
+            np.testing.assert_allclose(a._bounds[p][ra], b._bounds[p][rb], rtol=1e-9, equal_nan=True)
+
+
+def test_fit_matches_replayed_updates():
+    df = history()
+    fitted = SeasonalIQRDetector(POLLUTANTS).fit(df)
+    assert_same(fitted, replay(df))
+    # 每个站点只覆盖几天，单元仍然按自己的读数计权，不会因为其他站点的时间而失效
+    assert not np.isnan(fitted.bounds('NO2(GT)').to_numpy()).any()
+
+
+def test_merge_of_partition_fits_matches_single_fit():
+    df = history(1)
+    rng = np.random.default_rng(2)
+    mask = rng.random(len(df)) < 0.5
+    merged = SeasonalIQRDetector(POLLUTANTS).fit(df[mask]).merge(SeasonalIQRDetector(POLLUTANTS).fit(df[~mask]))
+    assert_same(merged, SeasonalIQRDetector(POLLUTANTS).fit(df))
+
+
+def test_fit_continues_from_existing_state():
+    df = history(3).sort_values('Datetime', kind='stable')
+    half = len(df) // 2
+    det = SeasonalIQRDetector(POLLUTANTS).fit(df.iloc[:half]).fit(df.iloc[half:])
+    assert_same(det, SeasonalIQRDetector(POLLUTANTS).fit(df))
+    assert det.updated.shape[1] == SEASONS
@@ -0,0 +1,36 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from aqi import BREAKPOINTS_1H, aqi_levels, composite_aqi, sub_indices
+
+
+def frame():
+    return pd.DataFrame({
+        'Station': ['北京', '北京', '上海'],
+        'CO(GT)': [2.5, np.nan, 40.0],
+        'NO2(GT)': [50.0, np.nan, 150.0],
+        'NOx(GT)': [900.0, 800.0, 700.0],
+    })
+
+
+def test_composite_ignores_pollutants_without_breakpoints():
+    df = frame()
+    with pytest.warns(UserWarning, match='NOx'):
+        aqi = composite_aqi(df, ['CO(GT)', 'NO2(GT)', 'NOx(GT)'])
+    expected = composite_aqi(df, list(BREAKPOINTS_1H))
+    np.testing.assert_allclose(aqi, expected, equal_nan=True)
+    np.testing.assert_allclose(aqi, [25.0, np.nan, 160.0], equal_nan=True)
+
+
+def test_sub_indices_pass_unrated_values_through():
+    iaqi = sub_indices(frame(), ['CO(GT)', 'NOx(GT)'])
+    assert iaqi['NOx(GT)'].tolist() == [900.0, 800.0, 700.0]
+
+
+def test_aqi_levels_without_unrated_pollutants():
+    levels = aqi_levels(frame(), list(BREAKPOINTS_1H), by='Station')
+    assert levels.loc['北京', '优'] == 1
+    assert levels.loc['北京', '缺失'] == 1
+    assert levels.loc['上海', '中度污染'] == 1
+    assert levels.to_numpy().sum() == 3
@@ -0,0 +1,53 @@
+import os
+import warnings
+
+import pandas as pd
+import pytest
+
+from dataset import DATETIME_COLUMN, typed_frame
+from rollup import Rollup
+
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'streamlit_app', 'data', 'processed',
+                    'china_50_cities.csv')
+
+
+@pytest.fixture(scope='module')
+def readings():
+    df = typed_frame(pd.read_csv(DATA))
+    return df.sort_values(DATETIME_COLUMN, kind='stable').reset_index(drop=True)
+
+
+def canonical(table):
+    # 查询只依赖按时间段排序，同一时间段内的行序不影响结果
+    keys = [c for c in ('Period', 'Station', 'Pollutant', 'bin') if c in table.columns]
+    return table.sort_values(keys, kind='stable').reset_index(drop=True)
+
+
+def assert_tables_equal(a, b):
+    for g in a.stats:
+        pd.testing.assert_frame_equal(canonical(a.stats[g]), canonical(b.stats[g]), check_exact=False)
+    for g in a.sketches:
+        pd.testing.assert_frame_equal(canonical(a.sketches[g]), canonical(b.sketches[g]))
+
+
+def test_append_matches_full_build_without_warnings(readings):
+    n = len(readings)
+    cuts = [0, n // 2, n * 3 // 4, n]
+    with warnings.catch_warnings():
+        warnings.simplefilter('error', FutureWarning)
+        rollup = Rollup.build(readings.iloc[cuts[0]:cuts[1]])
+        for lo, hi in zip(cuts[1:-1], cuts[2:]):
+            rollup = rollup.append(readings.iloc[lo:hi].reset_index(drop=True))
+    assert_tables_equal(rollup, Rollup.build(readings))
+
+
+def test_append_overlapping_periods(readings):
+    # 新读数与旧表最后一天重叠：重叠的单元重新合并
+    day = readings[DATETIME_COLUMN].dt.normalize()
+    last = day.max()
+    old, new = readings[day < last], readings[day == last]
+    head, tail = new.iloc[:len(new) // 2], new.iloc[len(new) // 2:]
+    with warnings.catch_warnings():
+        warnings.simplefilter('error', FutureWarning)
+        rollup = Rollup.build(pd.concat([old, head])).append(tail.reset_index(drop=True))
+    assert_tables_equal(rollup, Rollup.build(readings))
@@ -8,29 +8,12 @@ app.secret_key = "session_key"
 
 @app.route("/index")
 def index():
-    secondTypename, secondTypecount = get_secondType()
-    companyname, companyvalue = get_companysize()
-    workyear = get_workyear_counts()
-    education_counts = get_education()
-    city_value, city_name = get_city()
-    job_name, job_value = get_top_five_job()
-    companysum = get_count_companies()
-    companysize = get_company_size_sum()
-    return render_template(
-        "index.html",
-        secondTypename=secondTypename,
-        secondTypecount=secondTypecount,
-        companyname=companyname,
-        companyvalue=companyvalue,
-        workyear=workyear,
-        education=education_counts,
-        city_name=city_name,
-        city_value=city_value,
-        job_name=job_name,
-        job_value=job_value,
-        companysize=companysize,
-        companysum=companysum
-    )
+    # 8 个图表的数据由 2 条合并后的查询并发取出
+    dashboard = get_dashboard()
+    app.logger.info("index 查询耗时: %s", {k: round(v, 3) for k, v in dashboard.timings.items()})
+    for name, err in dashboard.errors.items():
+        app.logger.warning("index 查询 %s 失败: %s", name, err)
+    return render_template("index.html", **dashboard.as_template_context())
 
 
 
@@ -0,0 +1,36 @@
+"""批量导入的测试"""
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from utils.bulkload import bulk_upsert, iter_batches
+
+
+def frame(n):
+    salary = pd.Series(np.arange(n) * 1000.0)
+    salary[::7] = np.nan
+    return pd.DataFrame({"id": np.arange(n), "city": [f"城市{i}" for i in range(n)], "salary": salary})
+
+
+def test_batches_are_built_lazily():
+    df = frame(10)
+    batches = iter_batches(df, ["id", "city", "salary"], batch_size=4)
+    assert next(batches) == [(0, "城市0", None), (1, "城市1", 1000), (2, "城市2", 2000), (3, "城市3", 3000)]
+    rest = list(batches)
+    assert [len(b) for b in rest] == [4, 2]
+    assert rest[-1][-1] == (9, "城市9", 9000)
+    assert all(type(v) is int for b in rest for row in b for v in (row[0], row[2]) if v is not None)
+
+
+def test_bulk_upsert_writes_every_row():
+    df = frame(25)
+    con = sqlite3.connect(":memory:")
+    con.execute("CREATE TABLE JOB (id INTEGER PRIMARY KEY, city VARCHAR, salary INTEGER)")
+    report = bulk_upsert(con, df, "JOB", ["id", "city", "salary"], batch_size=10,
+                         sql="INSERT OR REPLACE INTO JOB (id, city, salary) VALUES (?, ?, ?)")
+    assert (report.rows, report.batches) == (25, 3)
+    got = pd.read_sql("SELECT * FROM JOB ORDER BY id", con)
+    assert got["salary"].isna().sum() == 4
+    assert got["id"].tolist() == list(range(25))
+    con.close()
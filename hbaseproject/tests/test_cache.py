@@ -0,0 +1,45 @@
+"""ResultCache 的测试：跨进程失效（用两个实例共享版本文件模拟）和后台刷新"""
+import threading
+
+from utils.cache import ResultCache
+
+
+def make_cache(tmp_path, **kwargs):
+    options = dict(ttl=300.0, stale_ttl=600.0, version_file=str(tmp_path / ".cache_version"),
+                   check_interval=0.0)
+    options.update(kwargs)
+    return ResultCache(**options)
+
+
+def test_invalidate_from_other_process(tmp_path):
+    web = make_cache(tmp_path)
+    loader = make_cache(tmp_path)
+    calls = []
+    compute = lambda: calls.append(1) or len(calls)
+
+    assert web.get_or_compute("k", compute) == 1
+    assert web.get_or_compute("k", compute) == 1
+    # 连续两次失效（修改时间可能相同），每次都要被发现
+    for expected in (2, 3):
+        loader.invalidate()
+        assert web.get_or_compute("k", compute) == expected
+        assert web.get_or_compute("k", compute) == expected
+
+
+def test_stale_value_refreshed_in_background(tmp_path):
+    cache = make_cache(tmp_path, ttl=0.0)
+    cache.get_or_compute("k", lambda: "old")
+    done = threading.Event()
+    threads = []
+
+    def refresh():
+        threads.append(threading.current_thread().name)
+        done.set()
+        return "new"
+
+    # 过期但在 stale_ttl 内：先返回旧值，后台刷新
+    assert cache.get_or_compute("k", refresh) == "old"
+    assert done.wait(2.0)
+    # 刷新在专用线程池上执行，不占用查询线程池
+    assert threads[0].startswith("cache-refresh")
+    assert cache.stats()["stale_hits"] == 1
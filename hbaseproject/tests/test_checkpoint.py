@@ -0,0 +1,74 @@
+"""断点续传导入的测试：用 sqlite 内存库代替 Phoenix（UPSERT 换成 INSERT OR REPLACE）"""
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from utils import deltaload
+from utils.checkpoint import CheckpointStore, checkpointed_upsert
+
+COLUMNS = ["id", "city", "salary"]
+SQL = f"INSERT OR REPLACE INTO JOB ({', '.join(COLUMNS)}) VALUES (?, ?, ?)"
+
+
+@pytest.fixture
+def con(tmp_path, monkeypatch):
+    monkeypatch.setattr(deltaload, "DATA_DIR", str(tmp_path))
+    con = sqlite3.connect(":memory:", check_same_thread=False)
+    con.execute("CREATE TABLE JOB (id INTEGER PRIMARY KEY, city VARCHAR, salary INTEGER)")
+    yield con
+    con.close()
+
+
+def frame(n):
+    return pd.DataFrame({"id": range(n), "city": [f"城市{i}" for i in range(n)], "salary": [1000 * i for i in range(n)]})
+
+
+def table(con):
+    return pd.read_sql("SELECT * FROM JOB ORDER BY id", con)
+
+
+def load(con, path, store, key="id"):
+    return checkpointed_upsert(con, str(path), "JOB", COLUMNS, batch_size=4, chunksize=5,
+                               store=store, sql=SQL, key=key)
+
+
+def test_changed_file_only_writes_changed_rows(con, tmp_path):
+    path, store = tmp_path / "job.csv", CheckpointStore(str(tmp_path / "ckpt.json"))
+    df = frame(20)
+    df.to_csv(path, index=False)
+    assert load(con, path, store).rows == 20
+    assert load(con, path, store).rows == 0
+
+    df.loc[7, "salary"] = 1
+    df.to_csv(path, index=False)
+    assert load(con, path, store).rows == 1
+    pd.testing.assert_frame_equal(table(con), df)
+    assert load(con, path, store).rows == 0
+
+
+def test_append_then_change(con, tmp_path):
+    path, store = tmp_path / "job.csv", CheckpointStore(str(tmp_path / "ckpt.json"))
+    df = frame(30)
+    df.iloc[:20].to_csv(path, index=False)
+    load(con, path, store)
+    # 末尾追加：从上次的行数之后继续
+    df.to_csv(path, index=False)
+    assert load(con, path, store).rows == 10
+    # 追加后的索引包含全部行，再修改时只写入修改的行
+    df.loc[25, "city"] = "北京"
+    df.loc[3, "city"] = "上海"
+    df.to_csv(path, index=False)
+    assert load(con, path, store).rows == 2
+    pd.testing.assert_frame_equal(table(con), df)
+
+
+def test_changed_file_without_key_reloads_everything(con, tmp_path):
+    path, store = tmp_path / "job.csv", CheckpointStore(str(tmp_path / "ckpt.json"))
+    df = frame(12)
+    df.to_csv(path, index=False)
+    load(con, path, store, key=None)
+    df.loc[0, "salary"] = 5
+    df.to_csv(path, index=False)
+    assert load(con, path, store, key=None).rows == 12
+    pd.testing.assert_frame_equal(table(con), df)
@@ -0,0 +1,168 @@
+"""ConnectionPool 的测试：用 sqlite3 内存数据库代替 Phoenix 连接，用可控的时钟代替 time.monotonic"""
+import sqlite3
+import threading
+import time
+from unittest import mock
+
+import pytest
+
+from utils import Condata
+from utils.Condata import ConnectionPool, PoolTimeout
+
+
+class FakeFactory:
+    """每次调用新建一个 sqlite 内存连接，并记录下来"""
+
+    def __init__(self):
+        self.connections = []
+
+    def __call__(self):
+        con = sqlite3.connect(":memory:", check_same_thread=False)
+        self.connections.append(con)
+        return con
+
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def is_closed(con):
+    try:
+        con.execute("SELECT 1")
+    except sqlite3.ProgrammingError:
+        return True
+    return False
+
+
+def make_pool(**kwargs):
+    factory = FakeFactory()
+    options = dict(maxsize=2, timeout=1.0, idle_timeout=None, max_lifetime=None,
+                   ping_interval=None, ping_sql="SELECT 1")
+    options.update(kwargs)
+    return ConnectionPool(factory, **options), factory
+
+
+@pytest.fixture
+def clock():
+    clock = Clock()
+    with mock.patch.object(Condata.time, "monotonic", clock):
+        yield clock
+
+
+def test_acquire_timeout():
+    pool, _ = make_pool(maxsize=1)
+    con = pool.acquire()
+    start = time.monotonic()
+    with pytest.raises(PoolTimeout):
+        pool.acquire(timeout=0.05)
+    assert time.monotonic() - start >= 0.05
+    assert pool.stats()["timeouts"] == 1
+    pool.release(con)
+    # 归还后可以再借到同一个连接
+    assert pool.acquire(timeout=0.05) is con
+
+
+def test_waiter_gets_released_connection():
+    pool, factory = make_pool(maxsize=1)
+    con = pool.acquire()
+    got = []
+    waiter = threading.Thread(target=lambda: got.append(pool.acquire(timeout=2.0)))
+    waiter.start()
+    time.sleep(0.05)
+    pool.release(con)
+    waiter.join(2.0)
+    assert got == [con]
+    assert len(factory.connections) == 1
+
+
+def test_idle_eviction(clock):
+    pool, factory = make_pool(idle_timeout=60.0)
+    first = pool.acquire()
+    pool.release(first)
+    clock.now += 59.0
+    assert pool.acquire() is first
+    pool.release(first)
+
+    clock.now += 60.0
+    second = pool.acquire()
+    assert second is not first
+    assert is_closed(first)
+    stats = pool.stats()
+    assert stats["created"] == 2
+    assert stats["discarded"] == 1
+    assert stats["size"] == 1
+
+
+def test_lifetime_eviction(clock):
+    pool, _ = make_pool(max_lifetime=100.0)
+    con = pool.acquire()
+    clock.now += 100.0
+    # 借出期间到期，归还时直接关闭
+    pool.release(con)
+    assert is_closed(con)
+    assert pool.stats()["size"] == 0
+
+    con = pool.acquire()
+    pool.release(con)
+    clock.now += 100.0
+    # 空闲期间到期，借出前回收
+    assert pool.acquire() is not con
+    assert is_closed(con)
+    assert pool.stats()["discarded"] == 2
+
+
+def test_ping_failure_replaces_connection(clock):
+    pool, factory = make_pool(ping_interval=30.0)
+    con = pool.acquire()
+    pool.release(con)
+    # 服务端断开：连接对象还在，但已不可用
+    con.close()
+    clock.now += 10.0
+    # 距上次检查不到 ping_interval，不做检查
+    assert pool.acquire() is con
+    pool.release(con)
+
+    clock.now += 30.0
+    fresh = pool.acquire()
+    assert fresh is not con
+    assert fresh is factory.connections[-1]
+    stats = pool.stats()
+    assert stats["ping_failures"] == 1
+    assert stats["discarded"] == 1
+    assert stats["created"] == 2
+
+
+def test_stats_counters():
+    pool, _ = make_pool(maxsize=3)
+    a = pool.acquire()
+    b = pool.acquire()
+    stats = pool.stats()
+    assert (stats["size"], stats["in_use"], stats["idle"]) == (2, 2, 0)
+    pool.release(a)
+    pool.release(b, broken=True)
+    stats = pool.stats()
+    assert (stats["size"], stats["in_use"], stats["idle"]) == (1, 0, 1)
+    assert stats["checkouts"] == 2
+    assert stats["created"] == 2
+    assert stats["discarded"] == 1
+    assert stats["wait_max"] >= 0.0
+    assert stats["wait_avg"] == pytest.approx(stats["wait_total"] / 2)
+    with pytest.raises(ValueError):
+        pool.release(a)
+
+
+def test_connection_released_on_base_exception(clock):
+    pool, _ = make_pool(ping_interval=30.0)
+    with pytest.raises(KeyboardInterrupt):
+        with pool.connection() as con:
+            raise KeyboardInterrupt
+    stats = pool.stats()
+    assert (stats["in_use"], stats["idle"]) == (0, 1)
+    # 出错后的连接下次借出前要做健康检查
+    con.close()
+    assert pool.acquire() is not con
+    assert pool.stats()["ping_failures"] == 1
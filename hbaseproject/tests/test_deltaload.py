@@ -0,0 +1,57 @@
+"""增量导入的测试：用 sqlite 内存库代替 Phoenix（UPSERT 换成 INSERT OR REPLACE）"""
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils import deltaload
+from utils.deltaload import delta_upsert, row_hashes
+
+COLUMNS = ["id", "city", "businessZones", "salary"]
+SQL = f"INSERT OR REPLACE INTO JOB ({', '.join(COLUMNS)}) VALUES (?, ?, ?, ?)"
+
+
+@pytest.fixture
+def con(tmp_path, monkeypatch):
+    monkeypatch.setattr(deltaload, "DATA_DIR", str(tmp_path))
+    con = sqlite3.connect(":memory:", check_same_thread=False)
+    con.execute("CREATE TABLE JOB (id INTEGER PRIMARY KEY, city VARCHAR, businessZones VARCHAR, salary INTEGER)")
+    yield con
+    con.close()
+
+
+def write_csv(path, rows):
+    pd.DataFrame(rows, columns=COLUMNS).to_csv(path, index=False)
+    return str(path)
+
+
+def test_invalid_keys_are_skipped(con, tmp_path):
+    path = write_csv(tmp_path / "job.csv", [
+        [1, "北京", "海淀", 10000],
+        [None, "上海", "浦东", 20000],
+        ["abc", "广州", "天河", 30000],
+        [2.5, "深圳", "南山", 40000],
+        [3, "杭州", "西湖", 50000],
+    ])
+    report = delta_upsert(con, path, "JOB", COLUMNS, "id", sql=SQL, chunksize=2)
+    assert report.skipped == 3
+    assert report.rows == 2
+    assert [r[0] for r in con.execute("SELECT id FROM JOB ORDER BY id")] == [1, 3]
+
+
+def test_hashes_do_not_depend_on_chunk_dtypes(con, tmp_path):
+    # businessZones 在前几行只有数字（推断为 float），后面出现文字（推断为 object）
+    rows = [[i, "北京", (str(i) if i < 4 else f"区{i}") if i % 3 else None, 1000 * i] for i in range(1, 9)]
+    path = write_csv(tmp_path / "job.csv", rows)
+    first = delta_upsert(con, path, "JOB", COLUMNS, "id", sql=SQL, chunksize=3)
+    assert first.rows == 8
+    # 分块方式不同，各块推断出的类型也不同，但内容没有变化
+    again = delta_upsert(con, path, "JOB", COLUMNS, "id", sql=SQL, chunksize=100)
+    assert again.rows == 0
+
+
+def test_row_hashes_float_and_object_columns():
+    as_float = pd.DataFrame({"id": [1, 2, 3], "city": [5.0, np.nan, 2.5]})
+    as_object = pd.DataFrame({"id": [1, 2, 3], "city": ["5", None, "2.5"]})
+    assert (row_hashes(as_float, ["id", "city"]) == row_hashes(as_object, ["id", "city"])).all()
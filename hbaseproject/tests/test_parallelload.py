@@ -0,0 +1,23 @@
+"""partition_by_key 的测试"""
+import types
+
+import numpy as np
+import pandas as pd
+
+from utils.parallelload import partition_by_key
+
+
+def test_partitions_are_lazy_and_cover_all_rows():
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({"id": rng.permutation(100).repeat(3), "v": np.arange(300)})
+    parts = partition_by_key(df, "id", 7)
+    assert isinstance(parts, types.GeneratorType)
+    parts = list(parts)
+    assert len(parts) == 7
+    assert sum(len(part) for _, part in parts) == len(df)
+    # 相同主键只落在一个分区，区间首尾与子表一致且互不重叠
+    for (lo, hi), part in parts:
+        assert (part["id"].min(), part["id"].max()) == (lo, hi)
+    highs = [hi for (_, hi), _ in parts]
+    lows = [lo for (lo, _), _ in parts]
+    assert all(h < l for h, l in zip(highs, lows[1:]))
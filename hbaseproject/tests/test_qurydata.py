@@ -0,0 +1,119 @@
+"""仪表盘合并查询的测试：在 sqlite 内存库上执行合并 SQL，与原来逐项查询的结果对比"""
+import random
+import sqlite3
+from contextlib import contextmanager
+
+import pytest
+
+from utils import qurydata
+from utils.qurydata import DASHBOARD_DIMS, build_dashboard, get_dashboard, plan_dashboard_queries
+
+
+@pytest.fixture
+def con():
+    rng = random.Random(0)
+    con = sqlite3.connect(":memory:")
+    con.execute("""
+    CREATE TABLE JOB (id INTEGER PRIMARY KEY, city VARCHAR, companyFullName VARCHAR, companySize INTEGER,
+                      secondType VARCHAR, education VARCHAR, salary INTEGER, workYear VARCHAR)
+    """)
+    pick = lambda values: rng.choice(values + [None])
+    rows = [(i, pick(["北京", "上海", "广州"]), f"公司{rng.randrange(40)}", pick([10, 50, 200]),
+             pick(["后端", "前端", "测试", "运维", "数据"]), pick(["本科", "硕士"]),
+             pick([8000, 15000, 30000]), pick(["1-3年", "3-5年", "不限"]))
+            for i in range(500)]
+    con.executemany("INSERT INTO JOB VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+    yield con
+    con.close()
+
+
+def query(con, sql):
+    return con.execute(sql).fetchall()
+
+
+def grouped_rows(con):
+    grouped, _ = plan_dashboard_queries()
+    return [row for dim in DASHBOARD_DIMS for row in query(con, grouped[dim])]
+
+
+def test_grouped_rows_are_per_dimension(con):
+    grouped, _ = plan_dashboard_queries()
+    assert list(grouped) == list(DASHBOARD_DIMS)
+    # 结果行数是各维度取值个数之和，而不是四个维度的组合数
+    expected = sum(len(query(con, f"SELECT DISTINCT {dim} FROM JOB")) for dim in DASHBOARD_DIMS)
+    assert len(grouped_rows(con)) == expected
+
+
+def test_dashboard_matches_original_queries(con):
+    _, distinct = plan_dashboard_queries()
+    data = build_dashboard(grouped_rows(con), query(con, distinct)[0][0])
+
+    counts = lambda dim: dict(query(con, f"SELECT {dim}, COUNT(*) FROM JOB GROUP BY {dim}"))
+    assert dict(zip(data.secondTypename, data.secondTypecount)) == counts("secondType")
+    assert dict(zip(data.city_name, data.city_value)) == counts("city")
+    assert {d["name"]: d["value"] for d in data.workyear} == counts("workYear")
+    assert {d["name"]: d["value"] for d in data.education} == counts("education")
+    assert dict(zip(data.companyname, data.companyvalue)) == dict(
+        query(con, "SELECT secondType, SUM(companySize) FROM JOB GROUP BY secondType"))
+
+    top = query(con, """
+    SELECT secondType, AVG(salary) AS average_salary FROM JOB
+    GROUP BY secondType ORDER BY average_salary DESC LIMIT 5
+    """)
+    assert data.job_name == [name for name, _ in top]
+    assert data.job_value == pytest.approx([value for _, value in top])
+    assert data.companysize == query(con, "SELECT SUM(companySize) FROM JOB")[0][0]
+    assert data.companysum == query(con, "SELECT COUNT(DISTINCT companyFullName) FROM JOB")[0][0]
+
+
+def test_failed_queries_render_zero_totals():
+    data = build_dashboard([], None)
+    assert data.companysize == 0
+    assert data.companysum == 0
+    assert data.secondTypename == [] and data.workyear == []
+
+
+def test_template_context_excludes_diagnostics(con):
+    _, distinct = plan_dashboard_queries()
+    data = build_dashboard(grouped_rows(con), query(con, distinct)[0][0])
+    data.timings = {"grouped": 0.1}
+    data.errors = {"companysum": "timeout"}
+    context = data.as_template_context()
+    assert "timings" not in context and "errors" not in context
+    assert context["companysize"] == data.companysize
+    assert set(context) == {"secondTypename", "secondTypecount", "companyname", "companyvalue", "workyear",
+                            "education", "city_name", "city_value", "job_name", "job_value",
+                            "companysum", "companysize"}
+
+
+def test_failed_panel_only_blanks_its_own_charts(tmp_path, monkeypatch):
+    # JOB 表没有 education 列：只有学历面板的语句失败
+    path = str(tmp_path / "job.db")
+    with sqlite3.connect(path) as con:
+        con.execute("""
+        CREATE TABLE JOB (id INTEGER PRIMARY KEY, city VARCHAR, companyFullName VARCHAR,
+                          companySize INTEGER, secondType VARCHAR, salary INTEGER, workYear VARCHAR)
+        """)
+        con.executemany("INSERT INTO JOB VALUES (?, ?, ?, ?, ?, ?, ?)", [
+            (1, "北京", "甲", 50, "后端", 20000, "1-3年"),
+            (2, "上海", "乙", 200, "前端", 15000, "3-5年"),
+            (3, "北京", "甲", 50, "后端", 25000, "1-3年"),
+        ])
+
+    @contextmanager
+    def pooled():
+        con = sqlite3.connect(path)
+        try:
+            yield con
+        finally:
+            con.close()
+
+    monkeypatch.setattr(qurydata, "pooled", pooled)
+    data = get_dashboard.uncached()
+    assert set(data.errors) == {"education"}
+    assert set(data.timings) == set(DASHBOARD_DIMS) | {"companysum"}
+    assert data.education == []
+    assert dict(zip(data.city_name, data.city_value)) == {"上海": 1, "北京": 2}
+    assert {d["name"]: d["value"] for d in data.workyear} == {"1-3年": 2, "3-5年": 1}
+    assert data.secondTypename == ["前端", "后端"] and data.companysize == 300
+    assert data.companysum == 2
@@ -0,0 +1,50 @@
+"""流式导入的测试：断点续传时跳过的行数按记录计算，写入出错后流水线线程退出"""
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+from utils.streamload import iter_csv_chunks, stream_upsert
+
+
+def test_csv_skip_counts_records_not_lines(tmp_path):
+    df = pd.DataFrame({
+        "id": range(10),
+        "positionAdvantage": [f"第一行\n第二行 {i}" if i % 3 == 0 else f"福利 {i}" for i in range(10)],
+    })
+    path = tmp_path / "job.csv"
+    df.to_csv(path, index=False)
+    for skip in (0, 1, 4, 9, 10, 12):
+        for chunksize in (1, 3, 100):
+            chunks = list(iter_csv_chunks(path, chunksize=chunksize, skip=skip))
+            got = pd.concat(chunks, ignore_index=True) if chunks else df.iloc[:0]
+            pd.testing.assert_frame_equal(got, df.iloc[skip:].reset_index(drop=True))
+
+
+def test_pipeline_threads_exit_after_write_error():
+    def chunks():
+        # 读取较慢：写入出错时转换线程正在等待下一个分块
+        for i in range(100):
+            time.sleep(0.05)
+            yield pd.DataFrame({"id": [i]})
+
+    class FailingCursor:
+        def executemany(self, sql, batch):
+            raise RuntimeError("写入失败")
+
+        def close(self):
+            pass
+
+    class FailingConnection:
+        def cursor(self):
+            return FailingCursor()
+
+    before = set(threading.enumerate())
+    with pytest.raises(RuntimeError):
+        stream_upsert(FailingConnection(), chunks(), "JOB", ["id"], sql="INSERT INTO JOB VALUES (?)")
+    deadline = time.monotonic() + 2
+    alive = lambda: [t for t in threading.enumerate() if t not in before]
+    while alive() and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert not alive()
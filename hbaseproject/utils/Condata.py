@@ -1,19 +1,291 @@
 #!/usr/bin/env python3
-import phoenixdb
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# 配置完整的Phoenix数据库URL
+# 端口默认8765
+PHOENIX_URL = 'http://192.168.196.139:8765/'
+PHOENIX_USER = 'ye'
+PHOENIX_PASSWORD = '123456'
+
+# 连接池默认参数
+POOL_MAXSIZE = 8            # 最大连接数（包括借出中的连接）
+POOL_TIMEOUT = 10.0         # 借连接时最多等待的秒数
+POOL_IDLE_TIMEOUT = 300.0   # 空闲超过该秒数的连接会被回收
+POOL_MAX_LIFETIME = 3600.0  # 连接最长存活时间，到期后重建
+POOL_PING_INTERVAL = 30.0   # 空闲超过该秒数的连接，借出前先做健康检查
+PING_SQL = "SELECT 1 FROM SYSTEM.CATALOG LIMIT 1"
 
-def connect():
-    # 配置完整的Phoenix数据库URL
-    # 端口默认8765
-    global con
-    phoenix_url = 'http://192.168.196.139:8765/'
 
-    # 尝试连接到Phoenix
+def connect():
+    """新建一个 Phoenix 连接（不经过连接池）"""
+    # 只在真正建立连接时导入驱动，连接池本身不依赖 phoenixdb
+    import phoenixdb
     try:
-        con = phoenixdb.connect(url=phoenix_url,
+        con = phoenixdb.connect(url=PHOENIX_URL,
                                 auth_mechanism='PLAIN',
-                                user='ye',
-                                password='123456')
+                                user=PHOENIX_USER,
+                                password=PHOENIX_PASSWORD)
     except Exception as e:
         print(f"Failed to connect to Phoenix: {e}")
-
+        raise
     return con
+
+
+class PoolTimeout(Exception):
+    """在 timeout 内没有借到连接"""
+
+
+class _PoolEntry:
+    __slots__ = ("con", "created_at", "last_used", "last_checked")
+
+    def __init__(self, con):
+        now = time.monotonic()
+        self.con = con
+        self.created_at = now
+        self.last_used = now
+        self.last_checked = now
+
+
+class ConnectionPool:
+    """
+    线程安全、有上限的 DB-API 连接池
+
+    - 连接数不超过 maxsize，借满时最多等待 timeout 秒
+    - 空闲超过 idle_timeout 的连接被回收
+    - 存活超过 max_lifetime 的连接归还时直接关闭重建
+    - 空闲超过 ping_interval 的连接借出前先执行 ping_sql 做健康检查
+    - stats() 返回借出次数、等待时间等指标
+
+    用法：
+        with pool.connection() as con:
+            cursor = con.cursor()
+            ...
+    """
+
+    def __init__(self, factory=connect, maxsize=POOL_MAXSIZE, timeout=POOL_TIMEOUT,
+                 idle_timeout=POOL_IDLE_TIMEOUT, max_lifetime=POOL_MAX_LIFETIME,
+                 ping_interval=POOL_PING_INTERVAL, ping_sql=PING_SQL):
+        if maxsize < 1:
+            raise ValueError("maxsize 必须 >= 1")
+        self.factory = factory
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.max_lifetime = max_lifetime
+        self.ping_interval = ping_interval
+        self.ping_sql = ping_sql
+
+        self._cond = threading.Condition()
+        self._idle = deque()   # 右端是最近归还的连接
+        self._in_use = {}      # id(con) -> _PoolEntry
+        self._size = 0         # 已打开（含正在创建）的连接数
+        self._closed = False
+
+        self._checkouts = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._timeouts = 0
+        self._created = 0
+        self._discarded = 0
+        self._ping_failures = 0
+
+    # --- 内部工具 ---
+    def _expired(self, entry, now):
+        if self.max_lifetime is not None and now - entry.created_at >= self.max_lifetime:
+            return True
+        if self.idle_timeout is not None and now - entry.last_used >= self.idle_timeout:
+            return True
+        return False
+
+    def _evict_idle(self, now):
+        """在锁内取出所有过期的空闲连接，返回给调用方在锁外关闭"""
+        evicted = []
+        kept = deque()
+        while self._idle:
+            entry = self._idle.popleft()
+            if self._expired(entry, now):
+                evicted.append(entry)
+            else:
+                kept.append(entry)
+        self._idle = kept
+        self._size -= len(evicted)
+        self._discarded += len(evicted)
+        if evicted:
+            self._cond.notify(len(evicted))
+        return evicted
+
+    @staticmethod
+    def _close_quietly(entry):
+        try:
+            entry.con.close()
+        except Exception:
+            pass
+
+    def _alive(self, entry):
+        try:
+            cursor = entry.con.cursor()
+            try:
+                cursor.execute(self.ping_sql)
+                cursor.fetchall()
+            finally:
+                cursor.close()
+        except Exception:
+            return False
+        entry.last_checked = time.monotonic()
+        return True
+
+    def _discard(self, entry):
+        self._close_quietly(entry)
+        with self._cond:
+            self._size -= 1
+            self._discarded += 1
+            self._cond.notify()
+
+    # --- 借出 / 归还 ---
+    def acquire(self, timeout=None):
+        """借出一个连接，用完必须调用 release()"""
+        timeout = self.timeout if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+
+        while True:
+            entry = None
+            with self._cond:
+                while True:
+                    if self._closed:
+                        raise RuntimeError("连接池已关闭")
+                    now = time.monotonic()
+                    evicted = self._evict_idle(now)
+                    if evicted:
+                        # 关闭连接可能较慢，放到锁外
+                        self._cond.release()
+                        try:
+                            for e in evicted:
+                                self._close_quietly(e)
+                        finally:
+                            self._cond.acquire()
+                        continue
+                    if self._idle:
+                        entry = self._idle.pop()
+                        break
+                    if self._size < self.maxsize:
+                        self._size += 1
+                        break
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        raise PoolTimeout(f"{timeout:.1f} 秒内未能从连接池借到连接")
+                    self._cond.wait(remaining)
+
+            if entry is None:
+                try:
+                    entry = _PoolEntry(self.factory())
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+                with self._cond:
+                    self._created += 1
+            elif (self.ping_interval is not None
+                  and time.monotonic() - entry.last_checked >= self.ping_interval
+                  and not self._alive(entry)):
+                with self._cond:
+                    self._ping_failures += 1
+                self._discard(entry)
+                continue
+
+            waited = time.monotonic() - start
+            with self._cond:
+                self._in_use[id(entry.con)] = entry
+                self._checkouts += 1
+                self._wait_total += waited
+                self._wait_max = max(self._wait_max, waited)
+            return entry.con
+
+    def release(self, con, broken=False):
+        """归还连接；broken=True 时直接关闭，不再复用"""
+        with self._cond:
+            entry = self._in_use.pop(id(con), None)
+        if entry is None:
+            raise ValueError("该连接不属于此连接池或已归还")
+
+        now = time.monotonic()
+        if broken or self._closed or (
+                self.max_lifetime is not None and now - entry.created_at >= self.max_lifetime):
+            self._discard(entry)
+            return
+        entry.last_used = now
+        with self._cond:
+            self._idle.append(entry)
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """借出连接的上下文管理器，退出时自动归还"""
+        con = self.acquire(timeout)
+        try:
+            yield con
+        except BaseException:
+            # 出错（包括 KeyboardInterrupt、GeneratorExit 等）的连接同样归还，
+            # 下次借出前强制做一次健康检查
+            with self._cond:
+                entry = self._in_use.get(id(con))
+                if entry is not None:
+                    entry.last_checked = float("-inf")
+            self.release(con)
+            raise
+        else:
+            self.release(con)
+
+    def close(self):
+        """关闭所有空闲连接，借出中的连接归还时关闭"""
+        with self._cond:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._size -= len(idle)
+            self._discarded += len(idle)
+            self._cond.notify_all()
+        for entry in idle:
+            self._close_quietly(entry)
+
+    def stats(self):
+        """连接池指标快照"""
+        with self._cond:
+            return {
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": len(self._in_use),
+                "checkouts": self._checkouts,
+                "wait_total": self._wait_total,
+                "wait_avg": self._wait_total / self._checkouts if self._checkouts else 0.0,
+                "wait_max": self._wait_max,
+                "timeouts": self._timeouts,
+                "created": self._created,
+                "discarded": self._discarded,
+                "ping_failures": self._ping_failures,
+            }
+
+
+# 进程内共享的默认连接池
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """返回进程内共享的连接池（首次调用时创建）"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool()
+    return _pool
+
+
+def pooled(timeout=None):
+    """从默认连接池借出连接：with pooled() as con: ..."""
+    return get_pool().connection(timeout)
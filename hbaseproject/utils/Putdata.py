@@ -1,15 +1,24 @@
 #!/usr/bin/env python3
-from utils.Condata import connect
+from utils.Condata import pooled
+from utils.cache import invalidate
+from utils.parallelload import parallel_upsert
+from utils.streamload import CHUNK_SIZE
+from utils.checkpoint import CheckpointStore, checkpointed_upsert
+from utils.deltaload import reset_index
+from utils.bulkload import BATCH_SIZE, JOB_COLUMNS
 import pandas as pd
 
-con = connect()
-cursor = con.cursor()
-
 # 执行语句
 def ddelete():
     r = "DROP TABLE IF EXISTS JOB"
-    cursor.execute(r)
-    con.commit()
+    with pooled() as con:
+        cursor = con.cursor()
+        cursor.execute(r)
+        con.commit()
+    # 表已删除，之前的导入进度作废
+    CheckpointStore().reset("JOB")
+    reset_index("JOB")
+    invalidate()
     print("删除成功")
 
 # 创建表
@@ -35,79 +44,35 @@ def createtable():
         workYear VARCHAR
     )
     """
-    cursor.execute(r)
-    con.commit()
+    with pooled() as con:
+        cursor = con.cursor()
+        cursor.execute(r)
+        con.commit()
+    invalidate()
     print("创建成功")
 
 # 输入数据
-i = 0
-def putdata(i):
+def putdata(batch_size=BATCH_SIZE, workers=1, chunksize=CHUNK_SIZE, delete=False):
     filepath = r"F:\vs\hbaseproject\data\job2.csv"
-    file = pd.read_csv(filepath)
-    r = """
-    UPSERT INTO JOB (
-    city,
-    companyFullName,
-    companyId, 
-    companyLabelList, 
-    companyShortName, 
-    companySize, 
-    businessZones, 
-    firstType, 
-    secondType, 
-    education, 
-    industryField, 
-    positionId, 
-    positionAdvantage, 
-    positionName, 
-    positionLables, 
-    salary, 
-    workYear)
-    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """
-
-    # 将 companyLabelList 和 businessZones ,positionLables数组类型的字段转换为 JSON 字符串
-    # row['companyLabelList'] = str(row['companyLabelList'])
-    # row['businessZones'] = str(row['businessZones'])
-    # row['positionLables'] = str(row['positionLables'])
 
-
-        # 执行插入操作
-    with con.cursor() as cursor:
-        for index, row in file.iterrows():
-            params = (
-                row['city'],
-                row['companyFullName'],
-                row['companyId'],
-                row['companyLabelList'],
-                row['companyShortName'],
-                row['companySize'],
-                row['businessZones'],
-                row['firstType'],
-                row['secondType'],
-                row['education'],
-                row['industryField'],
-                row['positionId'],
-                row['positionAdvantage'],
-                row['positionName'],
-                row['positionLables'],
-                row['salary'],
-                row['workYear'],
-            )
-            cursor.execute(r, params)
-            i += 1
-            print(f"第{i}条数据已插入")
-            try:
-                # 插入数据的代码
-                pass
-            except Exception as e:
-                print(f"在插入第 {i} 条数据时发生错误: {e}")
-                # 可以在这里记录详细的错误信息或者进行其他的错误处理
-        con.commit()
-        con.close()
+    if workers > 1:
+        # 按 positionId 区间分区，多进程各用一个连接并行写入
+        # Windows 下多进程需要在 if __name__ == "__main__": 中调用
+        file = pd.read_csv(filepath)
+        report = parallel_upsert(file, "JOB", JOB_COLUMNS, "positionId", workers, batch_size=batch_size)
+    else:
+        # 分块读取文件，读取/转换/写入流水线并行，内存占用与文件大小无关
+        # 每批提交后记录检查点，中断后重新运行从断点继续，文件未变化时直接跳过；
+        # 文件有修改时按 positionId 与上次导入的行哈希对比，只写入新增/修改的行，delete=True 时删除已不存在的主键
+        with pooled() as con:
+            report = checkpointed_upsert(con, filepath, "JOB", JOB_COLUMNS, batch_size, chunksize,
+                                         key="positionId", delete=delete)
+    print(report)
+    # 数据已更新，使仪表盘查询缓存失效
+    invalidate()
 
 
 
 #createtable()
 # ddelete()
-# putdata(0)
\ No newline at end of file
+# putdata()
\ No newline at end of file
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+import os
+import time
+from dataclasses import dataclass
+
+import pandas as pd
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+
+BATCH_SIZE = 1000        # 每批 executemany 的行数，每批提交一次
+PROGRESS_EVERY = 10000   # 每插入多少行打印一次进度
+
+# JOB 表字段（Putdata.py 建表顺序）
+JOB_COLUMNS = [
+    "city", "companyFullName", "companyId", "companyLabelList", "companyShortName",
+    "companySize", "businessZones", "firstType", "secondType", "education",
+    "industryField", "positionId", "positionAdvantage", "positionName",
+    "positionLables", "salary", "workYear",
+]
+# 带自增 id 主键的表（inputdata.py / test.py）
+JOB_ID_COLUMNS = ["id"] + JOB_COLUMNS
+
+# 建表时为 INTEGER 的字段，写入前转成 Python int
+INTEGER_COLUMNS = {"id", "companyId", "companySize", "positionId", "salary"}
+
+
+@dataclass
+class LoadReport:
+    rows: int = 0
+    batches: int = 0
+    seconds: float = 0.0
+    first_write: float = None  # 从开始到第一批提交完成的秒数
+    skipped: int = 0           # 因主键无效而没有写入的行数
+
+    @property
+    def rows_per_sec(self):
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    def __str__(self):
+        return (f"共插入 {self.rows} 条，{self.batches} 批，"
+                f"耗时 {self.seconds:.2f} 秒，{self.rows_per_sec:.0f} 条/秒"
+                + (f"，首批写入 {self.first_write:.2f} 秒" if self.first_write is not None else "")
+                + (f"，跳过 {self.skipped} 条主键无效的行" if self.skipped else ""))
+
+
+def upsert_sql(table, columns):
+    """生成 UPSERT 语句"""
+    placeholders = ", ".join("?" for _ in columns)
+    return f"UPSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})"
+
+
+def column_values(series, integer=False):
+    """
+    把一列转换成 DB-API 可以直接绑定的 Python 值列表
+    缺失值转为 None，整数列转为 int（避免 numpy 类型和 2000.0 这样的浮点数）
+    """
+    if integer:
+        series = pd.to_numeric(series, errors="coerce").round().astype("Int64")
+    values = series.astype(object)
+    return values.where(series.notna(), None).tolist()
+
+
+def iter_batches(df, columns, batch_size=BATCH_SIZE):
+    """
+    按行切成批次，每批是参数元组的列表
+    每批取出 batch_size 行后再按列转换，同时存在的 Python 值只有一批，不随 df 的行数增长
+    """
+    for start in range(0, len(df), batch_size):
+        part = df.iloc[start:start + batch_size]
+        arrays = [column_values(part[c], c in INTEGER_COLUMNS) for c in columns]
+        yield list(zip(*arrays))
+
+
+def write_batches(con, sql, batches, report=None, progress_every=PROGRESS_EVERY,
+                  on_commit=None):
+    """逐批 executemany 并提交，返回 LoadReport；on_commit(report) 在每批提交后调用"""
+    report = report or LoadReport()
+    start = time.perf_counter() - report.seconds
+    next_progress = (report.rows // progress_every + 1) * progress_every
+    cursor = con.cursor()
+    try:
+        for batch in batches:
+            cursor.executemany(sql, batch)
+            con.commit()
+            report.rows += len(batch)
+            report.batches += 1
+            if report.first_write is None:
+                report.first_write = time.perf_counter() - start
+            if on_commit is not None:
+                on_commit(report)
+            if report.rows >= next_progress:
+                report.seconds = time.perf_counter() - start
+                print(f"已插入 {report.rows} 条，{report.rows_per_sec:.0f} 条/秒")
+                next_progress = (report.rows // progress_every + 1) * progress_every
+    finally:
+        cursor.close()
+    report.seconds = time.perf_counter() - start
+    return report
+
+
+def bulk_upsert(con, df, table, columns, batch_size=BATCH_SIZE,
+                progress_every=PROGRESS_EVERY, sql=None):
+    """把 DataFrame 批量写入 table，sql 可覆盖默认的 UPSERT 语句"""
+    sql = sql or upsert_sql(table, columns)
+    return write_batches(con, sql, iter_batches(df, columns, batch_size),
+                         progress_every=progress_every)
+
+
+def _py(value):
+    # iterrows 取出的是 numpy 标量，部分驱动无法直接绑定
+    if pd.isna(value):
+        return None
+    return value.item() if hasattr(value, "item") else value
+
+
+def rowwise_upsert(con, df, table, columns, sql=None):
+    """原来的写法：iterrows + 每行一次 execute，仅用于对比测试"""
+    sql = sql or upsert_sql(table, columns)
+    start = time.perf_counter()
+    cursor = con.cursor()
+    for _, row in df.iterrows():
+        cursor.execute(sql, tuple(_py(row[c]) for c in columns))
+    con.commit()
+    cursor.close()
+    return LoadReport(rows=len(df), batches=1, seconds=time.perf_counter() - start)
+
+
+def benchmark(connect_fn, df, table, columns, batch_size=BATCH_SIZE, sql=None):
+    """分别用逐行和批量两种方式写入同一份数据，返回 (逐行, 批量) 两个 LoadReport"""
+    con = connect_fn()
+    try:
+        old = rowwise_upsert(con, df, table, columns, sql)
+        new = bulk_upsert(con, df, table, columns, batch_size, sql=sql)
+    finally:
+        con.close()
+    return old, new
+
+
+if __name__ == "__main__":
+    # 用内存 SQLite 对比客户端开销：python -m utils.bulkload
+    import sqlite3
+
+    df = pd.read_csv(os.path.join(DATA_DIR, "job2.csv"))
+
+    def sqlite_connect():
+        con = sqlite3.connect(":memory:")
+        con.execute(f"CREATE TABLE JOB ({', '.join(JOB_COLUMNS)}, PRIMARY KEY (positionId))")
+        return con
+
+    sql = f"INSERT OR REPLACE INTO JOB ({', '.join(JOB_COLUMNS)}) VALUES ({', '.join('?' * len(JOB_COLUMNS))})"
+    old, new = benchmark(sqlite_connect, df, "JOB", JOB_COLUMNS, sql=sql)
+    print(f"逐行 execute : {old}")
+    print(f"批量 executemany : {new}")
+    print(f"加速比 {old.seconds / new.seconds:.1f}x")
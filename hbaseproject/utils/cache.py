@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+import functools
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+CACHE_MAXSIZE = 128      # 最多缓存的结果数，超出按 LRU 淘汰
+CACHE_TTL = 300.0        # 结果新鲜期（秒）
+CACHE_STALE_TTL = 600.0  # 过期后仍可先返回旧值、后台刷新的时长（秒）
+CACHE_CHECK_INTERVAL = 1.0  # 检查版本文件的最小间隔（秒）
+# 后台刷新的线程数。刷新函数本身可能在查询线程池上并发（如 get_dashboard），
+# 所以不能和查询共用一个有界线程池，否则刷新任务占满线程后互相等待
+REFRESH_WORKERS = 2
+
+# 导入脚本提交成功后把一个新的随机版本号写入该文件，Flask 进程比较文件内容发现数据已变化
+# （不用修改时间：粗粒度的时间戳可能让两次失效看起来相同）
+CACHE_VERSION_FILE = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", ".cache_version")
+
+_refresh_executor = None
+_refresh_executor_lock = threading.Lock()
+
+
+def get_refresh_executor():
+    """返回后台刷新专用的线程池（首次调用时创建）"""
+    global _refresh_executor
+    if _refresh_executor is None:
+        with _refresh_executor_lock:
+            if _refresh_executor is None:
+                _refresh_executor = ThreadPoolExecutor(max_workers=REFRESH_WORKERS,
+                                                       thread_name_prefix="cache-refresh")
+    return _refresh_executor
+
+
+def _read_version(path):
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return ""
+
+
+def _write_version(path):
+    """写入新的版本号：先写临时文件再替换，其他进程不会读到写了一半的内容"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    version = uuid.uuid4().hex
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        f.write(version)
+    os.replace(tmp, path)
+    return version
+
+
+class ResultCache:
+    """
+    查询结果缓存：TTL + LRU + stale-while-revalidate
+
+    - 新鲜期内直接返回内存中的结果
+    - 过期但仍在 stale_ttl 内：先返回旧值，同时在后台刷新（同一个 key 只刷新一次）
+    - 超过 ttl + stale_ttl：同步重新计算
+    - 版本文件变化（其他进程调用了 invalidate）时清空全部缓存
+    """
+
+    def __init__(self, maxsize=CACHE_MAXSIZE, ttl=CACHE_TTL, stale_ttl=CACHE_STALE_TTL,
+                 version_file=CACHE_VERSION_FILE, check_interval=CACHE_CHECK_INTERVAL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.version_file = version_file
+        self.check_interval = check_interval
+
+        self._lock = threading.Lock()
+        self._data = OrderedDict()  # key -> (value, 写入时间)
+        self._refreshing = set()
+        self._version = _read_version(version_file)
+        self._version_checked = time.monotonic()
+
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+    def _sync_version(self, now):
+        # 在锁内调用；版本文件只有几十字节，再加上间隔限制
+        if now - self._version_checked < self.check_interval:
+            return
+        self._version_checked = now
+        version = _read_version(self.version_file)
+        if version != self._version:
+            self._version = version
+            self._data.clear()
+
+    def _store(self, key, value, version, cache_if):
+        if cache_if is not None and not cache_if(value):
+            return
+        with self._lock:
+            # 计算期间数据被失效过，结果可能来自旧数据，不写入
+            if version != self._version:
+                return
+            self._data[key] = (value, time.monotonic())
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def _refresh(self, key, fn, version, cache_if):
+        try:
+            self._store(key, fn(), version, cache_if)
+        except Exception as e:
+            print(f"后台刷新缓存 {key} 失败: {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def get_or_compute(self, key, fn, cache_if=None):
+        """返回 key 对应的结果，没有或已过期时调用 fn() 计算"""
+        now = time.monotonic()
+        with self._lock:
+            self._sync_version(now)
+            version = self._version
+            entry = self._data.get(key)
+            if entry is not None:
+                value, stored_at = entry
+                age = now - stored_at
+                if age < self.ttl:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                if age < self.ttl + self.stale_ttl:
+                    self._data.move_to_end(key)
+                    self.stale_hits += 1
+                    refresh = key not in self._refreshing
+                    if refresh:
+                        self._refreshing.add(key)
+                else:
+                    entry = None
+            if entry is None:
+                self.misses += 1
+
+        if entry is not None:
+            if refresh:
+                get_refresh_executor().submit(self._refresh, key, fn, version, cache_if)
+            return value
+
+        value = fn()
+        self._store(key, value, version, cache_if)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def invalidate(self):
+        """清空本进程缓存，并更新版本文件通知其他进程"""
+        version = _write_version(self.version_file)
+        with self._lock:
+            self._version = version
+            self._version_checked = time.monotonic()
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"size": len(self._data), "hits": self.hits,
+                    "stale_hits": self.stale_hits, "misses": self.misses}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """返回进程内共享的结果缓存（首次调用时创建）"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResultCache()
+    return _cache
+
+
+def invalidate():
+    """导入脚本提交新数据后调用，使所有进程的查询缓存失效"""
+    get_cache().invalidate()
+
+
+def cached(fn=None, *, cache_if=None):
+    """
+    缓存函数结果的装饰器，key 为 (函数名, 参数)
+    cache_if(value) 返回 False 时不缓存该结果（例如部分查询失败）
+    返回的对象在多次调用间共享，调用方不要修改
+    """
+    def decorator(fn):
+        name = f"{fn.__module__}.{fn.__qualname__}"
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            key = (name, args, tuple(sorted(kwargs.items())))
+            return get_cache().get_or_compute(
+                key, functools.partial(fn, *args, **kwargs), cache_if)
+
+        wrapper.uncached = fn
+        return wrapper
+
+    if fn is not None:
+        return decorator(fn)
+    return decorator
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+import hashlib
+import json
+import os
+import time
+
+from utils.bulkload import BATCH_SIZE, DATA_DIR, LoadReport
+from utils.deltaload import delta_upsert, rebuild_index, scan_file
+from utils.streamload import CHUNK_SIZE, iter_chunks, stream_upsert
+
+# 每个 (表, 源文件) 的导入进度
+CHECKPOINT_FILE = os.path.join(DATA_DIR, ".ingest_checkpoint.json")
+# plan_resume 返回的跳过行数为 DELTA 时，文件内容有修改，按主键只导入变化的行
+DELTA = -1
+
+
+def file_fingerprint(path, upto=None, block=1 << 20):
+    """文件内容的 sha1；upto 不为空时只计算前 upto 个字节"""
+    h = hashlib.sha1()
+    remaining = upto
+    with open(path, "rb") as f:
+        while remaining is None or remaining > 0:
+            data = f.read(block if remaining is None else min(block, remaining))
+            if not data:
+                break
+            h.update(data)
+            if remaining is not None:
+                remaining -= len(data)
+    return h.hexdigest()
+
+
+class CheckpointStore:
+    """JSON 文件保存的检查点，每次更新都先写临时文件再原子替换"""
+
+    def __init__(self, path=CHECKPOINT_FILE):
+        self.path = path
+
+    def _load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def get(self, key):
+        return self._load().get(key)
+
+    def put(self, key, state):
+        data = self._load()
+        data[key] = state
+        self._save(data)
+
+    def reset(self, table):
+        """删除表后调用，清除该表所有源文件的检查点"""
+        data = self._load()
+        kept = {k: v for k, v in data.items() if not k.startswith(f"{table}:")}
+        if len(kept) != len(data):
+            self._save(kept)
+
+    def _save(self, data):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+
+def plan_resume(path, state):
+    """
+    根据上次的检查点决定从第几行开始导入
+    返回 (跳过行数, 说明, 文件 sha1, 文件大小)；跳过行数为 None 表示
+    文件未变化且已导入完成，无需导入，为 DELTA 表示需要按主键增量对比
+    """
+    size = os.path.getsize(path)
+    sha1 = file_fingerprint(path)
+    if state is None:
+        return 0, "首次导入", sha1, size
+    if state["sha1"] == sha1:
+        if state["completed"]:
+            return None, "文件未变化，跳过导入", sha1, size
+        return state["rows"], f"从第 {state['batch']} 批（第 {state['rows']} 行）之后继续导入", sha1, size
+    # 文件变化：如果旧内容是新文件的前缀（只在末尾追加了数据），只导入新增的行
+    if (state["completed"] and size > state["size"]
+            and file_fingerprint(path, state["size"]) == state["sha1"]):
+        return state["rows"], f"文件末尾有新增数据，从第 {state['rows']} 行开始增量导入", sha1, size
+    return DELTA, "文件内容有修改，按主键只导入新增或修改的行", sha1, size
+
+
+def checkpointed_upsert(con, path, table, columns, batch_size=BATCH_SIZE,
+                        chunksize=CHUNK_SIZE, store=None, sql=None, key=None, delete=False):
+    """
+    可断点续传的流式导入
+
+    每批提交后记录 (文件指纹, 已提交行数, 批次号)。中断后重新运行会从最后
+    一个已提交的批次之后继续；文件未变化且已导入完成时直接返回。
+    提交成功但检查点还没写入时中断，重启后会重写这一批，UPSERT 覆盖写保证结果不变。
+    给出主键列 key 时，文件内容有修改（不只是末尾追加）交给 deltaload.delta_upsert，
+    只写入变化的行，delete=True 时同时删除已不存在的主键；每次全部导入完成后
+    重建增量导入用的行哈希索引（只读文件，不访问数据库）。没有 key 时重新全部导入。
+    """
+    store = store or CheckpointStore()
+    store_key = f"{table}:{os.path.abspath(path)}"
+    state = store.get(store_key)
+    skip, reason, sha1, size = plan_resume(path, state)
+    if skip == DELTA and key is None:
+        skip, reason = 0, "文件内容有修改，没有主键无法增量对比，重新全部导入"
+    print(reason)
+    if skip is None:
+        return LoadReport()
+
+    if skip == DELTA:
+        scanned = scan_file(path, columns, key, chunksize)
+        report = delta_upsert(con, path, table, columns, key, delete, batch_size, chunksize,
+                              sql=sql, scanned=scanned)
+        store.put(store_key, {
+            "sha1": sha1,
+            "size": size,
+            "rows": len(scanned[0]),
+            "batch": 0,
+            "completed": True,
+            "updated_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        })
+        return report
+
+    resumed = state is not None and state["sha1"] == sha1
+    new_state = {
+        "sha1": sha1,
+        "size": size,
+        "rows": skip,
+        "batch": state["batch"] if resumed else 0,
+        "completed": False,
+        "updated_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    store.put(store_key, new_state)
+
+    def on_commit(report):
+        new_state["rows"] = skip + report.rows
+        new_state["batch"] += 1
+        new_state["updated_at"] = time.strftime("%Y-%m-%d %H:%M:%S")
+        store.put(store_key, new_state)
+
+    report = stream_upsert(con, iter_chunks(path, chunksize, skip), table, columns,
+                           batch_size, sql=sql, on_commit=on_commit)
+    if key is not None:
+        rebuild_index(table, scan_file(path, columns, key, chunksize))
+    new_state["completed"] = True
+    store.put(store_key, new_state)
+    return report
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+import os
+
+import numpy as np
+import pandas as pd
+
+from utils.bulkload import BATCH_SIZE, DATA_DIR, INTEGER_COLUMNS, LoadReport
+from utils.streamload import CHUNK_SIZE, iter_chunks, stream_upsert
+
+
+def index_path(table):
+    """上次导入的 主键 -> 行哈希 索引文件"""
+    return os.path.join(DATA_DIR, f".hash_index_{table}.npz")
+
+
+def load_index(table):
+    """返回 (按主键排序的 int64 主键数组, 对应的 uint64 行哈希)，没有索引时为空数组"""
+    try:
+        with np.load(index_path(table)) as z:
+            return z["keys"], z["hashes"]
+    except OSError:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.uint64)
+
+
+def save_index(table, keys, hashes):
+    path = index_path(table)
+    tmp = path + ".tmp.npz"
+    np.savez(tmp, keys=keys, hashes=hashes)
+    os.replace(tmp, path)
+
+
+def reset_index(table):
+    """删除表后调用，下次导入视为全部新增"""
+    try:
+        os.remove(index_path(table))
+    except OSError:
+        pass
+
+
+def _as_text(series):
+    """
+    非整数列统一转成字符串：分块读取时同一列在不同块里可能被推断成 float 或 object，
+    直接哈希会因为类型不同而不同。整数值的浮点数写成不带 .0 的形式，缺失值为 <NA>
+    """
+    if pd.api.types.is_float_dtype(series):
+        text = series.astype("string")
+        integral = series.notna() & (series == series.round()) & (series.abs() < 2 ** 53)
+        text[integral] = series[integral].astype("int64").astype("string")
+        return text
+    return series.astype("string")
+
+
+def row_hashes(df, columns):
+    """
+    每行内容的 64 位哈希（向量化）
+    整数列先统一成 Int64，避免同一个值因为有无缺失值被读成 int/float 而哈希不同；
+    其他列统一成字符串，与每块推断出的类型无关
+    """
+    frame = pd.DataFrame({
+        c: pd.to_numeric(df[c], errors="coerce").round().astype("Int64")
+        if c in INTEGER_COLUMNS else _as_text(df[c])
+        for c in columns
+    })
+    return pd.util.hash_pandas_object(frame, index=False).to_numpy(dtype=np.uint64)
+
+
+def key_values(series):
+    """
+    主键列 -> (int64 主键, 有效掩码)
+    缺失、不是数字或不是整数的主键无效，对应位置的主键为 0
+    """
+    num = pd.to_numeric(series, errors="coerce")
+    if pd.api.types.is_integer_dtype(num.dtype):
+        return num.to_numpy(dtype=np.int64), np.ones(len(num), dtype=bool)
+    v = num.to_numpy(dtype=np.float64, na_value=np.nan)
+    valid = np.isfinite(v) & (v == np.round(v))
+    return np.where(valid, v, 0).astype(np.int64), valid
+
+
+def diff_index(keys, hashes, old_keys, old_hashes):
+    """
+    与上次的索引对比
+    keys/hashes 为本次文件中每行的主键和哈希（允许重复主键，以最后一次出现为准）
+    返回 (需要写入的行号掩码, 被删除的主键, 新索引主键, 新索引哈希)
+    """
+    n = len(keys)
+    # 每个主键最后一次出现的行号，结果按主键排序
+    uniq_keys, rev_idx = np.unique(keys[::-1], return_index=True)
+    last = n - 1 - rev_idx
+    uniq_hashes = hashes[last]
+
+    if len(old_keys):
+        pos = np.minimum(np.searchsorted(old_keys, uniq_keys), len(old_keys) - 1)
+        changed = (old_keys[pos] != uniq_keys) | (old_hashes[pos] != uniq_hashes)
+    else:
+        changed = np.ones(len(uniq_keys), dtype=bool)
+
+    emit = np.zeros(n, dtype=bool)
+    emit[last[changed]] = True
+    deleted = np.setdiff1d(old_keys, uniq_keys, assume_unique=True)
+    return emit, deleted, uniq_keys, uniq_hashes
+
+
+def delete_keys(con, table, key, keys, batch_size=BATCH_SIZE):
+    """按主键批量删除"""
+    sql = f"DELETE FROM {table} WHERE {key} = ?"
+    cursor = con.cursor()
+    try:
+        for start in range(0, len(keys), batch_size):
+            cursor.executemany(sql, [(int(k),) for k in keys[start:start + batch_size]])
+            con.commit()
+    finally:
+        cursor.close()
+
+
+def scan_file(path, columns, key, chunksize=CHUNK_SIZE):
+    """
+    分块读取文件，只保留每行的主键和内容哈希（每行 16 字节）
+    返回 (int64 主键, 主键有效掩码, uint64 行哈希)，顺序与文件中的行相同
+    """
+    keys, valid, hashes = [], [], []
+    for chunk in iter_chunks(path, chunksize):
+        k, ok = key_values(chunk[key])
+        keys.append(k)
+        valid.append(ok)
+        hashes.append(row_hashes(chunk, columns))
+    keys = np.concatenate(keys) if keys else np.empty(0, dtype=np.int64)
+    valid = np.concatenate(valid) if valid else np.empty(0, dtype=bool)
+    hashes = np.concatenate(hashes) if hashes else np.empty(0, dtype=np.uint64)
+    return keys, valid, hashes
+
+
+def rebuild_index(table, scanned):
+    """按 scan_file 的结果重建索引：文件已经全部写入表中之后调用"""
+    keys, valid, hashes = scanned
+    _, _, new_keys, new_hashes = diff_index(keys[valid], hashes[valid],
+                                            np.empty(0, dtype=np.int64), np.empty(0, dtype=np.uint64))
+    save_index(table, new_keys, new_hashes)
+
+
+def delta_upsert(con, path, table, columns, key, delete=False, batch_size=BATCH_SIZE,
+                 chunksize=CHUNK_SIZE, sql=None, scanned=None):
+    """
+    只写入相对上次导入新增或修改过的行
+
+    第一遍分块读取文件，只保留每行的主键和内容哈希，与上次导入保存的索引
+    对比（已经用 scan_file 读过时传入 scanned，不再重读）；第二遍只把
+    新增/修改的行流式写入。delete=True 时同时删除文件中已不存在的主键。
+    全部提交成功后才更新索引，中途失败下次会重新对比并重写这些行。
+    主键缺失或不是整数的行不写入，在输出中列出，并记入返回结果的 skipped。
+    """
+    keys, valid, hashes = scanned if scanned is not None else scan_file(path, columns, key, chunksize)
+
+    bad = np.flatnonzero(~valid)
+    if len(bad):
+        # 数据行号从 1 开始（不含表头）
+        shown = ", ".join(str(i + 1) for i in bad[:10])
+        print(f"跳过 {len(bad)} 行：{key} 缺失或不是整数（数据行 {shown}{' ...' if len(bad) > 10 else ''}）")
+
+    old_keys, old_hashes = load_index(table)
+    emit_valid, deleted, new_keys, new_hashes = diff_index(keys[valid], hashes[valid], old_keys, old_hashes)
+    emit = np.zeros(len(keys), dtype=bool)
+    emit[valid] = emit_valid
+    print(f"共 {len(new_keys)} 个主键，需写入 {int(emit.sum())} 行，"
+          f"{'删除' if delete else '已不存在（未删除）'} {len(deleted)} 个主键")
+
+    def changed_chunks():
+        offset = 0
+        for chunk in iter_chunks(path, chunksize):
+            mask = emit[offset:offset + len(chunk)]
+            offset += len(chunk)
+            if mask.any():
+                yield chunk[mask]
+
+    report = LoadReport()
+    if emit.any():
+        report = stream_upsert(con, changed_chunks(), table, columns, batch_size, sql=sql)
+    if delete and len(deleted):
+        delete_keys(con, table, key, deleted, batch_size)
+    else:
+        # 不删除时，保留这些主键在索引中，下次仍能识别为已存在
+        keep = np.isin(old_keys, deleted)
+        new_keys = np.concatenate([new_keys, old_keys[keep]])
+        new_hashes = np.concatenate([new_hashes, old_hashes[keep]])
+        order = np.argsort(new_keys, kind="stable")
+        new_keys, new_hashes = new_keys[order], new_hashes[order]
+    save_index(table, new_keys, new_hashes)
+    report.skipped = len(bad)
+    return report
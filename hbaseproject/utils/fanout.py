@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout
+from dataclasses import dataclass, field
+
+# 默认每个查询最多等待的秒数
+FANOUT_TIMEOUT = 10.0
+# 查询线程数，不超过连接池大小即可
+FANOUT_WORKERS = 8
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """返回进程内共享的查询线程池（首次调用时创建）"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=FANOUT_WORKERS,
+                                               thread_name_prefix="qurydata")
+    return _executor
+
+
+@dataclass
+class FanoutResult:
+    """并发查询的结果：成功的值、失败的异常、每个查询的耗时（秒）"""
+    values: dict = field(default_factory=dict)
+    errors: dict = field(default_factory=dict)
+    timings: dict = field(default_factory=dict)
+
+    def get(self, name, default=None):
+        return self.values.get(name, default)
+
+    @property
+    def ok(self):
+        return not self.errors
+
+
+def _timed(fn):
+    # 在工作线程里计时，异常不向外抛，统一交给调用方处理
+    start = time.perf_counter()
+    try:
+        value = fn()
+    except Exception as e:
+        return False, e, time.perf_counter() - start
+    return True, value, time.perf_counter() - start
+
+
+def run_parallel(tasks, timeout=FANOUT_TIMEOUT, timeouts=None, executor=None):
+    """
+    并发执行多个无参查询函数
+
+    tasks: {名称: 可调用对象}
+    timeout: 默认的单个查询超时（秒），timeouts 可按名称单独覆盖
+    某个查询失败或超时只记录在 errors 里，不影响其他查询。
+    超时的查询如果还没开始会被取消；已经在执行的无法中断，
+    只是不再等待它的结果（连接在它结束后照常归还连接池）。
+    """
+    executor = executor or get_executor()
+    timeouts = timeouts or {}
+    result = FanoutResult()
+
+    start = time.perf_counter()
+    futures = {name: executor.submit(_timed, fn) for name, fn in tasks.items()}
+    for name, future in futures.items():
+        remaining = start + timeouts.get(name, timeout) - time.perf_counter()
+        try:
+            ok, value, elapsed = future.result(timeout=max(remaining, 0))
+        except FuturesTimeout:
+            future.cancel()
+            result.errors[name] = TimeoutError(f"查询 {name} 超时")
+            result.timings[name] = time.perf_counter() - start
+            continue
+        result.timings[name] = elapsed
+        if ok:
+            result.values[name] = value
+        else:
+            result.errors[name] = value
+    return result
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from utils.Condata import connect
+from utils.bulkload import BATCH_SIZE, LoadReport, bulk_upsert
+
+WORKERS = os.cpu_count() or 4
+PARTITIONS_PER_WORKER = 4   # 分区数 = 进程数 * 该值，分区小一些便于均衡和重试
+MAX_PENDING_PER_WORKER = 2  # 每个进程最多排队的分区数（限制已序列化、等待子进程处理的分区副本）
+RETRIES = 3                 # 每个分区失败后的重试次数
+RETRY_BACKOFF = 1.0         # 第 n 次重试前等待 n * RETRY_BACKOFF 秒
+
+
+@dataclass
+class PartitionResult:
+    partition: int
+    key_range: tuple
+    report: LoadReport = None
+    attempts: int = 0
+    error: str = None
+
+
+@dataclass
+class ParallelLoadReport:
+    rows: int = 0
+    seconds: float = 0.0
+    workers: int = 0
+    partitions: list = field(default_factory=list)
+
+    @property
+    def rows_per_sec(self):
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    @property
+    def failed(self):
+        return [p for p in self.partitions if p.error is not None]
+
+    def __str__(self):
+        lines = [f"{self.workers} 个进程，{len(self.partitions)} 个分区，共插入 {self.rows} 条，"
+                 f"耗时 {self.seconds:.2f} 秒，{self.rows_per_sec:.0f} 条/秒"]
+        for p in self.failed:
+            lines.append(f"分区 {p.partition} {p.key_range} 在 {p.attempts} 次尝试后失败: {p.error}")
+        return "\n".join(lines)
+
+
+def partition_by_key(df, key, n):
+    """
+    按主键排序后切成最多 n 段连续的主键区间，逐个生成 (区间, 子表)
+    切分点对齐到主键变化处，相同主键的行只会落在同一个分区
+    子表在取用时才切出，调用方按需消费，不会一次生成全部分区
+    """
+    if not df[key].is_monotonic_increasing:
+        df = df.sort_values(key, kind="stable")
+    keys = df[key].to_numpy()
+    cuts = np.linspace(0, len(df), n + 1).astype(int)[1:-1]
+    cuts = np.unique(np.searchsorted(keys, keys[cuts], side="left")) if len(cuts) else cuts
+    bounds = [0] + [c for c in cuts if c > 0] + [len(df)]
+    for lo, hi in zip(bounds[:-1], bounds[1:]):
+        if hi <= lo:
+            continue
+        yield (keys[lo].item(), keys[hi - 1].item()), df.iloc[lo:hi]
+
+
+def _load_partition(partition, key_range, df, table, columns, batch_size,
+                    retries, connect_fn):
+    """
+    在工作进程中写入一个分区，每个进程使用自己的连接
+    UPSERT 按主键覆盖写，失败后整个分区重写是幂等的
+    """
+    result = PartitionResult(partition, key_range)
+    while True:
+        result.attempts += 1
+        con = None
+        try:
+            con = connect_fn()
+            result.report = bulk_upsert(con, df, table, columns, batch_size,
+                                        progress_every=len(df) + 1)
+            result.error = None
+            return result
+        except Exception as e:
+            result.error = f"{type(e).__name__}: {e}"
+            if result.attempts > retries:
+                return result
+            time.sleep(result.attempts * RETRY_BACKOFF)
+        finally:
+            if con is not None:
+                try:
+                    con.close()
+                except Exception:
+                    pass
+
+
+def parallel_upsert(df, table, columns, key, workers=WORKERS, partitions=None,
+                    batch_size=BATCH_SIZE, retries=RETRIES, connect_fn=connect):
+    """
+    按主键区间分区，用多进程并行写入
+
+    partitions 默认为 workers * PARTITIONS_PER_WORKER。df 本身已经整表在内存中；
+    分区在提交时才切出并序列化发给子进程，同时在途的分区不超过
+    workers * MAX_PENDING_PER_WORKER，分区的序列化副本不会一次全部堆积
+    """
+    partitions = partitions or workers * PARTITIONS_PER_WORKER
+    max_pending = workers * MAX_PENDING_PER_WORKER
+    report = ParallelLoadReport(workers=workers)
+    start = time.perf_counter()
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = set()
+        for i, (key_range, part) in enumerate(partition_by_key(df, key, partitions)):
+            if len(pending) >= max_pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                _collect(done, report)
+            pending.add(executor.submit(_load_partition, i, key_range, part, table, columns,
+                                        batch_size, retries, connect_fn))
+        _collect(pending, report)
+
+    report.partitions.sort(key=lambda p: p.partition)
+    report.seconds = time.perf_counter() - start
+    return report
+
+
+def _collect(futures, report):
+    for future in futures:
+        result = future.result()
+        report.partitions.append(result)
+        if result.error is None:
+            report.rows += result.report.rows
+        print(f"分区 {result.partition} {result.key_range} "
+              + ("完成" if result.error is None else f"失败: {result.error}"))
@@ -1,215 +1,385 @@
 # #!/usr/bin/env python3
-from utils.Condata import connect
+from dataclasses import dataclass, field
+from functools import partial
+
+from utils.Condata import pooled
+from utils.cache import cached
+from utils.fanout import run_parallel
 
 # 行业-公司数据
+@cached
 def get_secondType():
-    con = connect()
-    cursor = con.cursor()
-
-    # SQL 查询语句，用于选择 secondType 列的所有不同值及其出现次数
-    query = """
-    SELECT secondType, COUNT(*) as count 
-    FROM JOB 
-    GROUP BY secondType
-    """
-
-    cursor.execute(query)
-    # category_counts = []  # 创建一个列表来存储分类和出现次数的字典
-    secondTypename = []
-    secondTypecount = []
-
-    # 从查询结果中获取所有不同的分类及其出现次数
-    for row in cursor:
-        # category_dict = {"name": row[0], "value": row[1]}
-        # category_counts.append(category_dict)
-        secondTypename.append(row[0])
-        secondTypecount.append(row[1])
-    con.close()
+    with pooled() as con:
+        cursor = con.cursor()
+
+        # SQL 查询语句，用于选择 secondType 列的所有不同值及其出现次数
+        query = """
+        SELECT secondType, COUNT(*) as count 
+        FROM JOB 
+        GROUP BY secondType
+        """
+
+        cursor.execute(query)
+        # category_counts = []  # 创建一个列表来存储分类和出现次数的字典
+        secondTypename = []
+        secondTypecount = []
+
+        # 从查询结果中获取所有不同的分类及其出现次数
+        for row in cursor:
+            # category_dict = {"name": row[0], "value": row[1]}
+            # category_counts.append(category_dict)
+            secondTypename.append(row[0])
+            secondTypecount.append(row[1])
     return secondTypename,secondTypecount
 
 
 # 公司招聘规模
+@cached
 def get_companysize():
-    con = connect()
-    cursor = con.cursor()
-
-    # SQL 查询语句，用于按 secondType 统计 companySize 的总和
-    # 注意：去掉了语句末尾的分号
-    query = """
-    SELECT secondType, SUM(companySize) as totalCompanySize
-    FROM JOB
-    GROUP BY secondType
-    """
+    with pooled() as con:
+        cursor = con.cursor()
+
+        # SQL 查询语句，用于按 secondType 统计 companySize 的总和
+        # 注意：去掉了语句末尾的分号
+        query = """
+        SELECT secondType, SUM(companySize) as totalCompanySize
+        FROM JOB
+        GROUP BY secondType
+        """
+
+        cursor.execute(query)
+        results = cursor.fetchall()  # 获取所有查询结果
+
+        # 创建列表来存储每个 secondType 对应的 companySize 总和
+        companyname = []
+        companyvalue = []
+        for row in results:
+            companyname.append(row[0])
+            companyvalue.append(row[1])
 
-    cursor.execute(query)
-    results = cursor.fetchall()  # 获取所有查询结果
-
-    # 创建列表来存储每个 secondType 对应的 companySize 总和
-    companyname = []
-    companyvalue = []
-    for row in results:
-        companyname.append(row[0])
-        companyvalue.append(row[1])
-
-    con.close()
     return companyname, companyvalue
 
 
 # 工作经验数据
+@cached
 def get_workyear_counts():
-    con = connect()  # 连接到 Phoenix
-    cursor = con.cursor()
-
-    # SQL 查询语句，用于统计 workYear 的不同值及其出现次数
-    query = """
-    SELECT workYear, COUNT(*) as count 
-    FROM JOB
-    GROUP BY workYear
-    """
+    with pooled() as con:
+        cursor = con.cursor()
 
-    cursor.execute(query)
+        # SQL 查询语句，用于统计 workYear 的不同值及其出现次数
+        query = """
+        SELECT workYear, COUNT(*) as count 
+        FROM JOB
+        GROUP BY workYear
+        """
 
-    # 使用字典来存储 workYear 和它的计数
-    # 使用列表来存储包含 name 和 value 的字典
-    workyear_counts = []
+        cursor.execute(query)
 
-    for row in cursor:
-        # 创建一个字典，包含 name 和 value
-        workyear_dict = {"name": row[0], "value": row[1]}
-        # 将字典添加到列表中
-        workyear_counts.append(workyear_dict)
+        # 使用字典来存储 workYear 和它的计数
+        # 使用列表来存储包含 name 和 value 的字典
+        workyear_counts = []
+
+        for row in cursor:
+            # 创建一个字典，包含 name 和 value
+            workyear_dict = {"name": row[0], "value": row[1]}
+            # 将字典添加到列表中
+            workyear_counts.append(workyear_dict)
 
 
-    con.close()  # 关闭数据库连接
 
     # 返回字典，其中包含 workYear 和它的计数
     return workyear_counts
 
 # 学历数据
+@cached
 def get_education():
-    con = connect()  # 连接到 Phoenix
-    cursor = con.cursor()
-
-    # SQL 查询语句，用于统计 education 的不同值及其出现次数
-    query = """
-    SELECT education, COUNT(*) as count 
-    FROM JOB
-    GROUP BY education
-    """
+    with pooled() as con:
+        cursor = con.cursor()
 
-    cursor.execute(query)
+        # SQL 查询语句，用于统计 education 的不同值及其出现次数
+        query = """
+        SELECT education, COUNT(*) as count 
+        FROM JOB
+        GROUP BY education
+        """
 
-    # 使用列表来存储包含 name 和 value 的字典
-    education_counts = []
+        cursor.execute(query)
 
-    for row in cursor:
-        # 创建一个字典，包含 name 和 value
-        education_dict = {"name": row[0], "value": row[1]}
-        # 将字典添加到列表中
-        education_counts.append(education_dict)
+        # 使用列表来存储包含 name 和 value 的字典
+        education_counts = []
+
+        for row in cursor:
+            # 创建一个字典，包含 name 和 value
+            education_dict = {"name": row[0], "value": row[1]}
+            # 将字典添加到列表中
+            education_counts.append(education_dict)
 
-    con.close()  # 关闭数据库连接
 
     # 返回包含字典的列表
     return education_counts
 
 
 # 城市分布数据
+@cached
 def get_city():
-    con = connect()  # 连接到 Phoenix
-    cursor = con.cursor()
-
-    # SQL 查询语句，用于统计 education 的不同值及其出现次数
-    query = """
-    SELECT city, COUNT(*) as count 
-    FROM JOB
-    GROUP BY city
-    """
+    with pooled() as con:
+        cursor = con.cursor()
 
-    cursor.execute(query)
+        # SQL 查询语句，用于统计 education 的不同值及其出现次数
+        query = """
+        SELECT city, COUNT(*) as count 
+        FROM JOB
+        GROUP BY city
+        """
 
-    # 使用列表来存储包含 name 和 value 的字典
-    city_name = []
-    city_value = []
+        cursor.execute(query)
 
-    for row in cursor:
-        # 将字典添加到列表中
-        city_name.append(row[0])
-        city_value.append(row[1])
+        # 使用列表来存储包含 name 和 value 的字典
+        city_name = []
+        city_value = []
+
+        for row in cursor:
+            # 将字典添加到列表中
+            city_name.append(row[0])
+            city_value.append(row[1])
 
-    con.close()  # 关闭数据库连接
 
     # 返回包含字典的列表
     return city_value, city_name
 
 
+@cached
 def get_top_five_job():
-    con = connect()  # 连接到 Phoenix
-    cursor = con.cursor()
-
-    # SQL 查询语句，用于获取按 salary 降序排序的前五个 secondType
-    query = """
-    SELECT secondType, AVG(salary) as average_salary
-    FROM JOB
-    GROUP BY secondType
-    ORDER BY average_salary DESC
-    LIMIT 5
-    """
+    with pooled() as con:
+        cursor = con.cursor()
+
+        # SQL 查询语句，用于获取按 salary 降序排序的前五个 secondType
+        query = """
+        SELECT secondType, AVG(salary) as average_salary
+        FROM JOB
+        GROUP BY secondType
+        ORDER BY average_salary DESC
+        LIMIT 5
+        """
 
-    cursor.execute(query)
+        cursor.execute(query)
 
-    job = []
-    job_value = []
+        job = []
+        job_value = []
 
-    for row in cursor:
-        # 将查询结果添加到列表中
-        job.append(row[0])
-        job_value.append(row[1])
-    float_salaries = [float(salary) for salary in job_value]
+        for row in cursor:
+            # 将查询结果添加到列表中
+            job.append(row[0])
+            job_value.append(row[1])
+        float_salaries = [float(salary) for salary in job_value]
 
-    con.close()  # 关闭数据库连接
 
     return job, float_salaries
 
 
 # 公司种类数
+@cached
 def get_count_companies():
-    con = connect()  # 连接到 Phoenix
-    cursor = con.cursor()
+    with pooled() as con:
+        cursor = con.cursor()
 
-    # SQL 查询语句，用于统计不同的 companyFullName 的数量
-    query = """
-    SELECT COUNT(DISTINCT companyFullName) AS unique_company_count
-    FROM JOB 
-    """
+        # SQL 查询语句，用于统计不同的 companyFullName 的数量
+        query = """
+        SELECT COUNT(DISTINCT companyFullName) AS unique_company_count
+        FROM JOB 
+        """
 
-    cursor.execute(query)
-    companysum = cursor.fetchone()  # 获取查询结果
+        cursor.execute(query)
+        companysum = cursor.fetchone()  # 获取查询结果
 
-    con.close()  # 关闭数据库连接
 
     # 返回唯一公司种类的数量
     return companysum[0]
 
 
+@cached
 def get_company_size_sum():
-    con = connect()  # 连接到 Phoenix
-    cursor = con.cursor()
+    with pooled() as con:
+        cursor = con.cursor()
 
-    # SQL 查询语句，用于计算 companySize 列的总和
-    query = """
-    SELECT SUM(companySize) AS total_company_size
-    FROM JOB
-    """
+        # SQL 查询语句，用于计算 companySize 列的总和
+        query = """
+        SELECT SUM(companySize) AS total_company_size
+        FROM JOB
+        """
 
-    cursor.execute(query)
-    companysize = cursor.fetchone()  # 获取查询结果
+        cursor.execute(query)
+        companysize = cursor.fetchone()  # 获取查询结果
 
-    con.close()  # 关闭数据库连接
 
     # 返回 companySize 列的总和
     return companysize[0]
 
 
+# ---------------- 仪表盘合并查询 ----------------
+# /index 原来的 8 个查询都是对 JOB 全表的分组计数/求和，这里把它们合并：
+# 1. 按 secondType 的 COUNT、SUM(companySize)、AVG(salary) 三个查询合成一个分组，
+#    全局 SUM(companySize) 由这个分组的结果相加得到，不再单独查询；
+#    workYear、education、city 各自分组，每个维度（面板）一条语句，结果行带上维度编号；
+#    只取可累加的聚合 COUNT/SUM，AVG(salary) 用 SUM(salary)/COUNT(salary) 还原
+# 2. COUNT(DISTINCT companyFullName) 无法从分组结果推出，单独一条语句
+# 5 条语句并发执行，超时和失败按语句隔离，也就是按面板隔离：某个维度失败只空出它自己的图表。
+# 全表扫描从 8 次降到 5 次，扫描量基本没有减少（Phoenix 不支持 GROUPING SETS）。
+# 一次扫描算出所有维度只能按四个维度一起分组，组合的个数接近行数，
+# 省下的扫描会变成结果传输（data/job.csv 的 6876 行：四维一起分组 1341 行，各维分别分组共 82 行）
+
+# 参与合并分组的维度，结果行的第一列为维度在这里的下标
+DASHBOARD_DIMS = ("secondType", "workYear", "education", "city")
+
+# 每个分组上的可累加聚合
+DASHBOARD_AGGS = (
+    ("count", "COUNT(*)"),
+    ("size_sum", "SUM(companySize)"),
+    ("salary_sum", "SUM(salary)"),
+    ("salary_count", "COUNT(salary)"),
+)
+
+
+@dataclass
+class DashboardData:
+    """/index 模板需要的全部数据"""
+    secondTypename: list = field(default_factory=list)
+    secondTypecount: list = field(default_factory=list)
+    companyname: list = field(default_factory=list)
+    companyvalue: list = field(default_factory=list)
+    workyear: list = field(default_factory=list)
+    education: list = field(default_factory=list)
+    city_name: list = field(default_factory=list)
+    city_value: list = field(default_factory=list)
+    job_name: list = field(default_factory=list)
+    job_value: list = field(default_factory=list)
+    companysum: int = 0
+    companysize: int = 0
+    # 各查询耗时（秒）与失败原因，便于定位慢面板
+    timings: dict = field(default_factory=dict)
+    errors: dict = field(default_factory=dict)
+
+    def as_template_context(self):
+        # timings/errors 只用于日志，不传给模板
+        return {k: v for k, v in self.__dict__.items() if k not in ("timings", "errors")}
+
+
+def plan_dashboard_queries(table="JOB", dims=DASHBOARD_DIMS, aggs=DASHBOARD_AGGS):
+    """
+    生成合并后的 SQL：({维度: 分组查询}, 去重公司数查询)
+    分组查询的每行为 (维度下标, 维度值, 各聚合...)
+    """
+    agg_sql = ", ".join(expr for _, expr in aggs)
+    grouped = {
+        dim: f"SELECT {i} AS dim, {dim} AS dim_value, {agg_sql} FROM {table} GROUP BY {dim}"
+        for i, dim in enumerate(dims)
+    }
+    distinct = f"""
+    SELECT COUNT(DISTINCT companyFullName) AS unique_company_count
+    FROM {table}
+    """
+    return grouped, distinct
 
 
+def _add(a, b):
+    # SQL 的 SUM 在整组都是 NULL 时返回 NULL，累加时保持这一语义
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return a + b
+
+
+def rollup(rows, dim, dims=DASHBOARD_DIMS, aggs=DASHBOARD_AGGS):
+    """
+    从合并的分组结果中取出维度 dim 的各组
+    返回 {维度值: {聚合名: 值}}，按维度值排序（NULL 在前，与 Phoenix 一致）
+    """
+    pos = dims.index(dim)
+    offset = 2
+    names = [name for name, _ in aggs]
+    totals = {}
+    for row in rows:
+        if row[0] != pos:
+            continue
+        key = row[1]
+        acc = totals.get(key)
+        if acc is None:
+            totals[key] = dict(zip(names, row[offset:]))
+        else:
+            for i, name in enumerate(names):
+                acc[name] = _add(acc[name], row[offset + i])
+    return dict(sorted(totals.items(), key=lambda kv: (kv[0] is not None, kv[0])))
+
+
+def build_dashboard(rows, companysum, top_n=5):
+    """从合并查询的结果推出模板需要的各项指标"""
+    data = DashboardData(companysum=companysum or 0)
+
+    by_type = rollup(rows, "secondType")
+    data.secondTypename = list(by_type)
+    data.secondTypecount = [v["count"] for v in by_type.values()]
+    data.companyname = list(by_type)
+    data.companyvalue = [v["size_sum"] for v in by_type.values()]
+
+    # 平均薪资前 top_n 的 secondType
+    avg_salary = [
+        (name, float(v["salary_sum"]) / v["salary_count"])
+        for name, v in by_type.items() if v["salary_count"]
+    ]
+    avg_salary.sort(key=lambda kv: kv[1], reverse=True)
+    data.job_name = [name for name, _ in avg_salary[:top_n]]
+    data.job_value = [value for _, value in avg_salary[:top_n]]
+
+    data.workyear = [{"name": k, "value": v["count"]}
+                     for k, v in rollup(rows, "workYear").items()]
+    data.education = [{"name": k, "value": v["count"]}
+                      for k, v in rollup(rows, "education").items()]
+
+    by_city = rollup(rows, "city")
+    data.city_name = list(by_city)
+    data.city_value = [v["count"] for v in by_city.values()]
+
+    total = None
+    for v in by_type.values():
+        total = _add(total, v["size_sum"])
+    # 分组查询失败（没有结果行）或整列为 NULL 时显示 0，不在页面上显示 None
+    data.companysize = total or 0
+    return data
+
+
+def get_dashboard_rows(table, dim):
+    """一个维度的分组查询"""
+    grouped, _ = plan_dashboard_queries(table)
+    with pooled() as con:
+        cursor = con.cursor()
+        cursor.execute(grouped[dim])
+        return cursor.fetchall()
+
+
+def get_dashboard_companysum(table="JOB"):
+    """去重公司数"""
+    _, distinct = plan_dashboard_queries(table)
+    with pooled() as con:
+        cursor = con.cursor()
+        cursor.execute(distinct)
+        return cursor.fetchone()[0]
+
+
+# 有查询失败时不缓存，下次请求重新查询
+@cached(cache_if=lambda data: not data.errors)
+def get_dashboard(table="JOB", timeout=None):
+    """
+    取出 /index 所需的全部数据
+    每个维度一条语句，与去重公司数一起并发执行，耗时按维度记录；
+    某条失败或超时，只有用到该维度的图表为空，其余照常显示
+    """
+    kwargs = {} if timeout is None else {"timeout": timeout}
+    tasks = {dim: partial(get_dashboard_rows, table, dim) for dim in DASHBOARD_DIMS}
+    tasks["companysum"] = partial(get_dashboard_companysum, table)
+    result = run_parallel(tasks, **kwargs)
+    rows = [row for dim in DASHBOARD_DIMS for row in result.get(dim, [])]
+    data = build_dashboard(rows, result.get("companysum", 0))
+    data.timings = result.timings
+    data.errors = {name: str(e) for name, e in result.errors.items()}
+    return data
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+import os
+import queue
+import threading
+
+import pandas as pd
+
+from utils.bulkload import BATCH_SIZE, PROGRESS_EVERY, iter_batches, upsert_sql, write_batches
+
+CHUNK_SIZE = 10000  # 每次读取的行数
+QUEUE_SIZE = 4      # 各阶段之间队列的容量，满了上游就阻塞等待
+
+_DONE = object()
+
+
+def iter_csv_chunks(path, chunksize=CHUNK_SIZE, skip=0, **kwargs):
+    """
+    分块读取 CSV，每次返回最多 chunksize 行的 DataFrame；skip 为跳过的数据行数
+    跳过的是解析后的记录而不是文件中的物理行（带引号的字段里可以有换行），
+    与检查点中记录的已提交行数一致
+    """
+    for chunk in pd.read_csv(path, chunksize=chunksize, **kwargs):
+        if skip >= len(chunk):
+            skip -= len(chunk)
+            continue
+        if skip:
+            chunk = chunk.iloc[skip:]
+            skip = 0
+        yield chunk
+
+
+def iter_xlsx_chunks(path, chunksize=CHUNK_SIZE, skip=0, sheet=None):
+    """
+    以只读模式逐行读取 xlsx，每 chunksize 行组成一个 DataFrame
+    不会像 read_excel 那样把整个工作表载入内存
+    """
+    from openpyxl import load_workbook
+
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        ws = wb[sheet] if sheet else wb.active
+        rows = ws.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        # to_excel 写出的索引列没有列名
+        header = [h if h is not None else f"Unnamed: {i}" for i, h in enumerate(header)]
+        for _ in range(skip):
+            if next(rows, None) is None:
+                return
+        buf = []
+        for row in rows:
+            buf.append(row)
+            if len(buf) >= chunksize:
+                yield pd.DataFrame(buf, columns=header)
+                buf = []
+        if buf:
+            yield pd.DataFrame(buf, columns=header)
+    finally:
+        wb.close()
+
+
+def iter_parquet_chunks(path, chunksize=CHUNK_SIZE, skip=0):
+    """按 record batch 分块读取 Parquet（需要 pyarrow）"""
+    import pyarrow.parquet as pq
+
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize):
+        if skip >= batch.num_rows:
+            skip -= batch.num_rows
+            continue
+        chunk = batch.to_pandas()
+        if skip:
+            chunk = chunk.iloc[skip:]
+            skip = 0
+        yield chunk
+
+
+def iter_chunks(path, chunksize=CHUNK_SIZE, skip=0):
+    """按扩展名选择分块读取方式"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext in (".xlsx", ".xlsm"):
+        return iter_xlsx_chunks(path, chunksize, skip)
+    if ext == ".parquet":
+        return iter_parquet_chunks(path, chunksize, skip)
+    return iter_csv_chunks(path, chunksize, skip)
+
+
+def _put(q, item, stop):
+    # 队列满时阻塞等待；下游已经退出（stop 被设置）时放弃
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _stage(fn, source, sink, stop, name=None):
+    """
+    在线程中运行一个流水线阶段：从 source 迭代，把 fn 产出的结果放入 sink
+    出错时把异常放入 sink，由下游抛出
+    """
+    def run():
+        try:
+            for item in source:
+                for out in fn(item):
+                    if not _put(sink, out, stop):
+                        return
+        except BaseException as e:
+            _put(sink, e, stop)
+        else:
+            _put(sink, _DONE, stop)
+
+    t = threading.Thread(target=run, name=name, daemon=True)
+    t.start()
+    return t
+
+
+def _drain(q, stop):
+    # 上游退出前不一定能放入 _DONE（stop 已设置时 _put 直接放弃），所以不能无限期阻塞在 get 上
+    while True:
+        try:
+            item = q.get(timeout=0.1)
+        except queue.Empty:
+            if stop.is_set():
+                return
+            continue
+        if item is _DONE:
+            return
+        if isinstance(item, BaseException):
+            raise item
+        yield item
+
+
+def stream_upsert(con, chunks, table, columns, batch_size=BATCH_SIZE,
+                  queue_size=QUEUE_SIZE, progress_every=PROGRESS_EVERY, sql=None,
+                  on_commit=None):
+    """
+    读取 → 转换 → 写入 三个阶段用有界队列连接、同时进行
+
+    chunks: DataFrame 分块的迭代器（iter_chunks 等）
+    内存中最多同时存在约 2 * queue_size 个分块，与文件大小无关；
+    第一个分块转换完就开始写入。
+    on_commit(report) 在每批提交后调用。
+    """
+    sql = sql or upsert_sql(table, columns)
+    chunk_q = queue.Queue(maxsize=queue_size)
+    batch_q = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+
+    _stage(lambda chunk: [chunk], chunks, chunk_q, stop, "stream-read")
+    _stage(lambda chunk: iter_batches(chunk, columns, batch_size), _drain(chunk_q, stop), batch_q, stop,
+           "stream-convert")
+    try:
+        return write_batches(con, sql, _drain(batch_q, stop), progress_every=progress_every,
+                             on_commit=on_commit)
+    finally:
+        # 写入结束或出错，通知上游线程退出
+        stop.set()
@@ -1,14 +1,23 @@
-from utils.Condata import connect
+from utils.Condata import pooled
+from utils.cache import invalidate
+from utils.parallelload import parallel_upsert
+from utils.streamload import CHUNK_SIZE
+from utils.checkpoint import CheckpointStore, checkpointed_upsert
+from utils.deltaload import reset_index
+from utils.bulkload import BATCH_SIZE, JOB_ID_COLUMNS
 import pandas as pd
 
-con = connect()
-cursor = con.cursor()
-
 # 执行语句
 def ddelete():
     r = "DROP TABLE IF EXISTS JOB2"
-    cursor.execute(r)
-    con.commit()
+    with pooled() as con:
+        cursor = con.cursor()
+        cursor.execute(r)
+        con.commit()
+    # 表已删除，之前的导入进度作废
+    CheckpointStore().reset("JOB2")
+    reset_index("JOB2")
+    invalidate()
     print("删除成功")
 
 # 创建表
@@ -35,76 +44,33 @@ def createtable():
         workYear VARCHAR
     )
     """
-    cursor.execute(r)
-    con.commit()
+    with pooled() as con:
+        cursor = con.cursor()
+        cursor.execute(r)
+        con.commit()
+    invalidate()
     print("创建成功")
 
 # 输入数据
-i = 0
-def putdata(i):
-    filepath = r"F:\vs\hbaseproject\data\job.xlsx"
-    file = pd.read_excel(filepath)
-    r = """
-    UPSERT INTO JOB2 (
-    id,
-    city,
-    companyFullName,
-    companyId, 
-    companyLabelList, 
-    companyShortName, 
-    companySize, 
-    businessZones, 
-    firstType, 
-    secondType, 
-    education, 
-    industryField, 
-    positionId, 
-    positionAdvantage, 
-    positionName, 
-    positionLables, 
-    salary, 
-    workYear)
-    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """
-
-    # 将 companyLabelList 和 businessZones ,positionLables数组类型的字段转换为 JSON 字符串
-    # row['companyLabelList'] = str(row['companyLabelList'])
-    # row['businessZones'] = str(row['businessZones'])
-    # row['positionLables'] = str(row['positionLables'])
-    with con.cursor() as cursor:
-        cursor.arraysize = 1000  # 批量提交大小
-        for index, row in file.iterrows():
-            # 构造参数列表
-            params = (
-                row['id'],
-                row['city'],
-                row['companyFullName'],
-                row['companyId'],
-                row['companyLabelList'],
-                row['companyShortName'],
-                row['companySize'],
-                row['businessZones'],
-                row['firstType'],
-                row['secondType'],
-                row['education'],
-                row['industryField'],
-                row['positionId'],
-                row['positionAdvantage'],
-                row['positionName'],
-                row['positionLables'],
-                row['salary'],
-                row['workYear'],
-            )
-            # 执行 UPSERT 语句
-            cursor.execute(r, params)
-            if index % cursor.arraysize == 0:
-                con.commit()  # 定期提交事务
-            i += 1
-            print(f"第{i}条数据已插入")
+def putdata(batch_size=BATCH_SIZE, workers=1, chunksize=CHUNK_SIZE, delete=False):
+    # utils/处理.py 清洗后输出的 Parquet（含 id 列），按 record batch 分块读取
+    filepath = r"F:\vs\hbaseproject\data\job.parquet"
 
-    # 最后一次提交
-    con.commit()
-    con.close()
+    if workers > 1:
+        # 按 id 区间分区，多进程各用一个连接并行写入
+        # Windows 下多进程需要在 if __name__ == "__main__": 中调用
+        file = pd.read_parquet(filepath)
+        report = parallel_upsert(file, "JOB2", JOB_ID_COLUMNS, "id", workers, batch_size=batch_size)
+    else:
+        # 分块读取文件，读取/转换/写入流水线并行，内存占用与文件大小无关
+        # 每批提交后记录检查点，中断后重新运行从断点继续，文件未变化时直接跳过；
+        # 文件有修改时按 id 与上次导入的行哈希对比，只写入新增/修改的行，delete=True 时删除已不存在的主键
+        with pooled() as con:
+            report = checkpointed_upsert(con, filepath, "JOB2", JOB_ID_COLUMNS, batch_size, chunksize,
+                                         key="id", delete=delete)
+    print(report)
+    # 数据已更新，使仪表盘查询缓存失效
+    invalidate()
 
 
     #     # 执行插入操作
@@ -146,4 +112,4 @@ def putdata(i):
 
 # createtable()
 #ddelete()
-putdata(0)
\ No newline at end of file
+putdata()
\ No newline at end of file